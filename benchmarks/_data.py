@@ -0,0 +1,44 @@
+"""ベンチマーク用のテストデータ生成ヘルパー"""
+
+from pathlib import Path
+import csv
+import io
+
+
+def booklog_csv_line(i: int, rating: int = 5, status: str = "読み終わった") -> str:
+    """
+    ブクログのCSV形式の1行を生成する。列順は BOOKLOG_CSV_COLUMNS と同じ。
+    タグのようにカンマを含む値で列がずれないよう、csvモジュールで引用符を付ける。
+    """
+    line = io.StringIO()
+    csv.writer(line, lineterminator="").writerow(
+        [
+            "1",
+            f"{1000000000 + i}",
+            f"978{4000000000 + i}",
+            "本",
+            str(rating),
+            status,
+            f"感想{i}。とても面白かった。",
+            "小説,SF",
+            f"メモ{i}",
+            "2020-01-01 10:00:00",
+            "2020-02-01 10:00:00",
+            f"タイトル{i}",
+            f"作者{i % 500}",
+            f"出版社{i % 50}",
+            str(1990 + i % 30),
+            "単行本",
+            "320",
+        ]
+    )
+    return line.getvalue()
+
+
+def write_booklog_csv(path: Path, rows: int, **kwargs) -> Path:
+    """rows件の書籍を含むcp932のCSVファイルを書き出す。"""
+    path.write_text(
+        "\n".join(booklog_csv_line(i, **kwargs) for i in range(rows)),
+        encoding="cp932",
+    )
+    return path
@@ -0,0 +1,61 @@
+"""
+item_idを持たない既存ノートを取り込むベンチマーク。
+
+    uv run python benchmarks/bench_adoption.py --notes 20000
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from _data import write_booklog_csv
+
+from booklog_sync.adopt import build_vault_index
+from booklog_sync.main import run_sync
+
+
+def write_unidentified_notes(books_path: Path, notes: int):
+    """半数はISBNで、残りは著者名+タイトルで照合されるノートを書き出す。"""
+    books_path.mkdir(parents=True)
+    for i in range(notes):
+        if i % 2 == 0:
+            frontmatter = f"isbn13: '978{4000000000 + i}'\n"
+        else:
+            frontmatter = f"title: タイトル{i}\nauthor: 作者{i % 500}\n"
+        (books_path / f"note{i}.md").write_text(f"---\n{frontmatter}---\n## 感想\n", encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notes", type=int, default=20000, help="既存ノートの数 (デフォルト: 20000)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        csv_path = write_booklog_csv(tmp_path / "booklog.csv", args.notes)
+        books_path = tmp_path / "Vault" / "Books"
+        write_unidentified_notes(books_path, args.notes)
+
+        start = time.perf_counter()
+        index = build_vault_index(books_path)
+        index_elapsed = time.perf_counter() - start
+        print(
+            f"index: {args.notes} notes, {len(index.by_isbn)} isbn keys, "
+            f"{len(index.by_title)} title keys in {index_elapsed:.2f}s"
+        )
+
+        for mode in ["report", "on"]:
+            start = time.perf_counter()
+            run_sync(csv_path, books_path, adopt=mode, checkpoint_interval=0)
+            print(f"adopt={mode}: {time.perf_counter() - start:.2f}s")
+
+        created = sum(1 for _ in books_path.glob("*.md")) - args.notes
+        print(f"duplicates created: {created}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+本文テンプレートありで初回インポートを行うベンチマーク。
+
+    uv run python benchmarks/bench_initial_import.py --rows 10000
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from _data import write_booklog_csv
+
+from booklog_sync.main import run_sync
+
+TEMPLATE = """## 感想
+{review}
+
+## メモ
+{memo}
+
+- タグ: {tags}
+- 登録日: {registered_at}
+- 読了日: {finished_at}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000, help="CSVの行数 (デフォルト: 10000)")
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=500,
+        help="同期ジャーナルのチェックポイント間隔。0でジャーナルを無効化 (デフォルト: 500)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        csv_path = write_booklog_csv(tmp_path / "booklog.csv", args.rows)
+        template_path = tmp_path / "template.md"
+        template_path.write_text(TEMPLATE, encoding="utf-8")
+        books_path = tmp_path / "Vault" / "Books"
+
+        start = time.perf_counter()
+        run_sync(
+            csv_path,
+            books_path,
+            body_template=template_path,
+            checkpoint_interval=args.checkpoint_interval,
+        )
+        elapsed = time.perf_counter() - start
+
+        created = sum(1 for _ in books_path.glob("*.md"))
+        print(f"rows={args.rows} created={created} elapsed={elapsed:.2f}s ({args.rows / elapsed:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
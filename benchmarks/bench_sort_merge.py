@@ -0,0 +1,62 @@
+"""
+joinの方法ごとに、変更のない再同期の処理時間と最大メモリ使用量（RSS）を比較するベンチマーク。
+
+    uv run python benchmarks/bench_sort_merge.py --rows 20000 --sort-memory-mb 8
+
+各方法は別プロセスで実行し、プロセスの最大RSSを計測する（Windowsでは計測できない）。
+"""
+
+import argparse
+import logging
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from _data import write_booklog_csv
+
+from booklog_sync.sync import run_sync
+
+
+def measure(csv_path: Path, books_path: Path, join: str, sort_memory_mb: int, results):
+    import resource
+
+    logging.basicConfig(level=logging.WARNING)
+    start = time.perf_counter()
+    stats = run_sync(csv_path, books_path, checkpoint_interval=0, join=join, sort_memory_mb=sort_memory_mb)
+    elapsed = time.perf_counter() - start
+    # Linuxではキロバイト単位
+    results.put((join, elapsed, stats.unchanged, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000, help="CSVの行数 (デフォルト: 20000)")
+    parser.add_argument("--sort-memory-mb", type=int, default=8, help="sort_mergeのメモリ上限 (デフォルト: 8)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        csv_path = write_booklog_csv(tmp_path / "booklog.csv", args.rows)
+        books_path = tmp_path / "Vault" / "Books"
+
+        start = time.perf_counter()
+        run_sync(csv_path, books_path, checkpoint_interval=0)
+        print(f"rows={args.rows} initial import: {time.perf_counter() - start:.2f}s")
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        for join in ("index", "sort_merge"):
+            process = context.Process(
+                target=measure, args=(csv_path, books_path, join, args.sort_memory_mb, results)
+            )
+            process.start()
+            process.join()
+            join, elapsed, unchanged, max_rss_kb = results.get()
+            print(f"join={join:10s} elapsed={elapsed:.2f}s unchanged={unchanged} max_rss={max_rss_kb / 1024:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+監視モードで、CSVの書き込みからノートの更新までの時間を計測するベンチマーク。
+
+    uv run python benchmarks/bench_watch_latency.py --rows 1000 --iterations 30
+
+CSVの書き方は次の3種類を順に繰り返す。
+- partial: 同じファイルに少しずつ書き込む（ダウンロード中のブラウザなど）
+- rename: 一時ファイルに書き込んでから置き換える（アトミックな保存）
+- burst: 短い間隔で何度も書き換える
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from _data import booklog_csv_line
+
+from booklog_sync import watcher
+from booklog_sync.core import build_id_book_index, read_frontmatter_text
+from booklog_sync.sync import run_sync
+from booklog_sync.watcher import CSVSyncHandler, create_observer
+
+SCENARIOS = ("partial", "rename", "burst")
+
+# 計測対象の書籍。CSVの1行目のitem_id。
+TARGET_ITEM_ID = "1000000000"
+
+
+class SyncRecorder:
+    """watcherから呼ばれるrun_syncを包み、実行回数、重なり、失敗、変更のなかった同期を記録する。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self.syncs = 0
+        self.overlapping = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self._active += 1
+            self.syncs += 1
+            if self._active > 1:
+                self.overlapping += 1
+        try:
+            stats = run_sync(*args, **kwargs)
+        except Exception:
+            # 書き込み途中のCSVを読んだ場合など。次の変更イベントで同期し直される。
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+        if stats.created + stats.updated == 0:
+            with self._lock:
+                self.duplicates += 1
+        return stats
+
+
+def csv_content(rows: int, marker: str) -> bytes:
+    lines = [booklog_csv_line(0, status=marker)]
+    lines += [booklog_csv_line(i) for i in range(1, rows)]
+    return "\n".join(lines).encode("cp932")
+
+
+def write_partial(csv_path: Path, content: bytes, chunks: int = 4, pause: float = 0.05):
+    size = -(-len(content) // chunks)
+    with open(csv_path, "wb") as f:
+        for start in range(0, len(content), size):
+            f.write(content[start : start + size])
+            f.flush()
+            os.fsync(f.fileno())
+            time.sleep(pause)
+
+
+def write_rename(csv_path: Path, content: bytes):
+    tmp_path = csv_path.with_name(f".{csv_path.name}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, csv_path)
+
+
+def wait_for_status(note_path: Path, marker: str, timeout: float) -> float | None:
+    """ノートのstatusがmarkerになった時刻を返す。timeout秒以内に更新されなければNone。"""
+    expected = f"status: {marker}\n"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if expected in read_frontmatter_text(note_path):
+                return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.005)
+    return None
+
+
+def percentile(values: list[float], p: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000, help="CSVの行数 (デフォルト: 1000)")
+    parser.add_argument("--iterations", type=int, default=30, help="CSVを書き換える回数 (デフォルト: 30)")
+    parser.add_argument("--backend", choices=("native", "polling"), default="native", help="監視方法")
+    parser.add_argument("--debounce", type=float, default=0.5, help="デバウンス秒数 (デフォルト: 0.5)")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="ポーリング間隔 (デフォルト: 0.2)")
+    parser.add_argument("--burst", type=int, default=5, help="burstで書き換える回数 (デフォルト: 5)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="1回あたりの待ち時間の上限 (秒)")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # 失敗した同期は件数だけを出力する
+    logging.getLogger("booklog_sync.watcher").setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        csv_path = tmp_path / "inbox" / "booklog.csv"
+        csv_path.parent.mkdir()
+        csv_path.write_bytes(csv_content(args.rows, "初期状態"))
+        books_path = tmp_path / "Vault" / "Books"
+
+        run_sync(csv_path, books_path)
+        note_path = build_id_book_index(books_path)[TARGET_ITEM_ID]
+
+        recorder = SyncRecorder()
+        watcher.run_sync = recorder
+        handler = CSVSyncHandler(csv_path, books_path, args.debounce)
+        observer = create_observer(handler, args.backend, args.poll_interval)
+        observer.start()
+
+        latencies: dict[str, list[float]] = {scenario: [] for scenario in SCENARIOS}
+        timeouts = 0
+        try:
+            for iteration in range(args.iterations):
+                scenario = SCENARIOS[iteration % len(SCENARIOS)]
+                marker = f"状態{iteration}"
+                if scenario == "partial":
+                    write_partial(csv_path, csv_content(args.rows, marker))
+                elif scenario == "rename":
+                    write_rename(csv_path, csv_content(args.rows, marker))
+                else:
+                    for burst in range(args.burst - 1):
+                        csv_path.write_bytes(csv_content(args.rows, f"{marker}-{burst}"))
+                        time.sleep(0.02)
+                    csv_path.write_bytes(csv_content(args.rows, marker))
+                written = time.perf_counter()
+
+                updated = wait_for_status(note_path, marker, args.timeout)
+                if updated is None:
+                    timeouts += 1
+                else:
+                    latencies[scenario].append(updated - written)
+                # 次の書き込みが前回の同期と重なり過ぎないよう、デバウンスの分だけ待つ
+                time.sleep(args.debounce)
+        finally:
+            observer.stop()
+            observer.join()
+            handler.close()
+            watcher.run_sync = run_sync
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    result = {
+        "backend": args.backend,
+        "rows": args.rows,
+        "iterations": args.iterations,
+        "timeouts": timeouts,
+        "syncs": recorder.syncs,
+        "failed_syncs": recorder.failed,
+        "duplicate_syncs": recorder.duplicates,
+        "overlapping_syncs": recorder.overlapping,
+        "latency": {
+            scenario: {
+                f"p{p}": round(percentile(values, p), 3) for p in (50, 90, 99)
+            }
+            for scenario, values in {**latencies, "all": all_latencies}.items()
+            if values
+        },
+    }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(
+            f"backend={args.backend} rows={args.rows} iterations={args.iterations} "
+            f"syncs={recorder.syncs} failed={recorder.failed} duplicate={recorder.duplicates} "
+            f"overlapping={recorder.overlapping} timeouts={timeouts}"
+        )
+        for scenario, summary in result["latency"].items():
+            print(f"  {scenario:8s} " + " ".join(f"{key}={value:.3f}s" for key, value in summary.items()))
+
+    # 同期の重なりと更新の取りこぼしはCIで失敗として扱う
+    if recorder.overlapping or timeouts:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
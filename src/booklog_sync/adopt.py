@@ -0,0 +1,104 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+import logging
+import re
+import unicodedata
+from typing import Final, Iterable, Optional
+
+import yaml
+
+from booklog_sync.core import (
+    DEFAULT_IGNORE_PATTERNS,
+    ITEM_ID_PATTERN,
+    BooklogCSVRow,
+    iter_frontmatters,
+)
+from booklog_sync.defaults import ADOPT_MODES, AdoptMode
+
+logger = logging.getLogger(__name__)
+
+# 取り込みの照合に使うフロントマターのキー
+_ADOPTION_KEY_PATTERN: Final = re.compile(r"^(isbn13|title|author):[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+
+# 照合キーから取り除く空白と記号
+_IGNORED_CHARS_PATTERN: Final = re.compile(r"[\s\W_]+")
+
+
+def normalize_title_key(author: Optional[str], title: Optional[str]) -> Optional[str]:
+    """
+    著者名とタイトルから、表記ゆれ（全角半角、大文字小文字、空白、記号）を吸収した照合キーを作る。
+    タイトルがない場合はNoneを返す。
+    """
+    if not title:
+        return None
+    normalized = unicodedata.normalize("NFKC", f"{author or ''}\t{title}").casefold()
+    author_key, title_key = (_IGNORED_CHARS_PATTERN.sub("", part) for part in normalized.split("\t", 1))
+    return f"{author_key}\t{title_key}" if title_key else None
+
+
+def _scalar(value: str) -> Optional[str]:
+    # クォートされた値だけYAMLとして解釈し、それ以外はそのまま文字列として扱う
+    if value[:1] in ("'", '"'):
+        try:
+            loaded = yaml.safe_load(value)
+        except yaml.YAMLError:
+            return value.strip("'\"")
+        return None if loaded is None else str(loaded)
+    return value or None
+
+
+@dataclass
+class VaultIndex:
+    """
+    Vaultの索引。item_idによる主索引に加えて、item_idを持たないノートを
+    ISBNと著者名+タイトルで引く副索引を持つ。副索引で複数のノートが同じキーを持つ場合はNoneを入れる。
+    """
+
+    by_id: dict[str, Path] = field(default_factory=dict)
+    by_isbn: dict[str, Optional[Path]] = field(default_factory=dict)
+    by_title: dict[str, Optional[Path]] = field(default_factory=dict)
+    _claimed: set[Path] = field(default_factory=set)
+
+    def add_unidentified(self, file_path: Path, isbn13: Optional[str], title_key: Optional[str]):
+        for index, key in ((self.by_isbn, isbn13), (self.by_title, title_key)):
+            if not key:
+                continue
+            index[key] = None if key in index and index[key] != file_path else file_path
+
+    def find_adoptable(self, row: BooklogCSVRow) -> Optional[Path]:
+        """
+        item_idで見つからなかった行について、取り込める既存ノートを探す。
+        ISBNを優先し、見つからなければ著者名+タイトルで探す。すでに取り込んだノートは返さない。
+        """
+        isbn13 = row.get("isbn13")
+        candidate = self.by_isbn.get(isbn13) if isbn13 else None
+        if candidate is None:
+            title_key = normalize_title_key(row.get("author"), row.get("title"))
+            candidate = self.by_title.get(title_key) if title_key else None
+        if candidate is None or candidate in self._claimed:
+            return None
+        self._claimed.add(candidate)
+        return candidate
+
+
+def build_vault_index(
+    books_path: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> VaultIndex:
+    """
+    Vaultを1回走査して、item_idの主索引とISBN・著者名+タイトルの副索引を作る。
+    """
+    index = VaultIndex()
+    for file_path, frontmatter in iter_frontmatters(books_path, recursive, ignore):
+        match = ITEM_ID_PATTERN.search(frontmatter)
+        if match:
+            index.by_id[match.group(1)] = file_path
+            continue
+        values = {key: _scalar(value) for key, value in _ADOPTION_KEY_PATTERN.findall(frontmatter)}
+        index.add_unidentified(
+            file_path,
+            values.get("isbn13"),
+            normalize_title_key(values.get("author"), values.get("title")),
+        )
+    return index
@@ -0,0 +1,261 @@
+from pathlib import Path
+import json
+import logging
+from typing import Final, Iterable, Mapping, Optional
+
+import yaml
+
+from booklog_sync.core import (
+    DEFAULT_IGNORE_PATTERNS,
+    FILENAME_MAX_BYTE_LENGTH,
+    ITEM_ID_PATTERN,
+    _sanitize_filename,
+    iter_frontmatters,
+    write_text_atomic,
+)
+from booklog_sync.defaults import AGGREGATE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_STATE_FILENAME: Final = "aggregates.json"
+
+_STATE_VERSION: Final = 1
+
+
+def dirty_marker(state_file: Path) -> Path:
+    """
+    差分を反映してから状態を保存するまでの間だけ存在するファイル。
+    プロセスが強制終了されて残っていた場合は、状態が古いため次回は集計し直す。
+    """
+    return state_file.with_name(f"{state_file.name}.dirty")
+
+
+def change_log(state_file: Path) -> Path:
+    """
+    前回まとめて保存したあとに変更のあったグループを、1行に1グループずつ追記するファイル。
+    読み込むときは状態に順に上書きする。
+    """
+    return state_file.with_name(f"{state_file.name}.log")
+
+
+def aggregate_key(value: object) -> Optional[str]:
+    """
+    フロントマターの値を集計のグループ名にする。値が空の場合はNone（どのグループにも入れない）。
+    """
+    if value is None:
+        return None
+    key = str(value).strip()
+    return key or None
+
+
+class AggregateIndex:
+    """
+    ステータス・評価・著者ごとに書籍ノートへのリンクをまとめた集計ノートと、その元になる状態。
+
+    状態は {キー: {グループ名: {item_id: ノート名}}} の形でstate_fileに保存し、同期では
+    save_bookが検出した差分（diff_frontmatterの旧値と新値）だけを反映する。集計ノートは
+    変更のあったグループの分だけ書き直し、状態も変更のあったグループだけをchange_logに追記するため、
+    更新の手間は本棚の大きさではなく変更の件数に比例する。追記した行がグループの数を超えたら
+    state_fileにまとめて保存し直す。状態がない場合や設定が変わった場合だけ、rebuildでVault全体から集計し直す。
+    """
+
+    def __init__(self, state_file: Path, output_path: Path, by: Iterable[str] = AGGREGATE_FIELDS):
+        self._state_file = state_file
+        self._dirty_marker = dirty_marker(state_file)
+        self._change_log = change_log(state_file)
+        self._output_path = output_path
+        self._by = tuple(by)
+        self._groups: dict[str, dict[str, dict[str, str]]] = {key: {} for key in self._by}
+        # item_idからグループ名を引く逆引き {キー: {item_id: グループ名}}
+        self._values: dict[str, dict[str, str]] = {key: {} for key in self._by}
+        self._dirty: set[tuple[str, str]] = set()
+        self._logged = 0
+        self.written = 0
+        self.loaded = self._load()
+        if self.loaded:
+            self._index_values()
+        # 状態がない場合は、最初のflushでstate_fileにまとめて保存する
+        self._compact = not self.loaded
+
+    def _load(self) -> bool:
+        if self._dirty_marker.exists():
+            logger.info("Aggregate state was not saved by the previous sync, rebuilding: %s", self._state_file)
+            return False
+        try:
+            state = json.loads(self._state_file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError):
+            logger.warning("Failed to read aggregate state, rebuilding: %s", self._state_file)
+            return False
+        if (
+            state.get("version") != _STATE_VERSION
+            or state.get("by") != list(self._by)
+            or state.get("output_path") != str(self._output_path)
+        ):
+            logger.info("Aggregate settings changed, rebuilding: %s", self._state_file)
+            return False
+        self._groups = {key: state["groups"].get(key, {}) for key in self._by}
+        try:
+            with self._change_log.open(encoding="utf-8") as f:
+                for line in f:
+                    key, value, members = json.loads(line)
+                    if members:
+                        self._groups[key][value] = members
+                    else:
+                        self._groups[key].pop(value, None)
+                    self._logged += 1
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, KeyError):
+            logger.warning("Failed to read aggregate changes, rebuilding: %s", self._change_log)
+            return False
+        return True
+
+    def _index_values(self):
+        self._values = {
+            key: {item_id: value for value, members in groups.items() for item_id in members}
+            for key, groups in self._groups.items()
+        }
+
+    def rebuild(
+        self,
+        books_path: Path,
+        recursive: bool = False,
+        ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    ):
+        """
+        Vault内のitem_idを持つノートのフロントマターから集計し直し、すべての集計ノートを書き直す対象にする。
+        """
+        self._mark_dirty()
+        previous = self._groups
+        self._groups = {key: {} for key in self._by}
+        self._compact = True
+        for file_path, frontmatter in iter_frontmatters(books_path, recursive, ignore):
+            if not ITEM_ID_PATTERN.search(frontmatter):
+                continue
+            try:
+                props = yaml.safe_load(frontmatter)
+            except yaml.YAMLError:
+                continue
+            if not isinstance(props, dict):
+                continue
+            item_id = str(props.get("item_id"))
+            for key in self._by:
+                value = aggregate_key(props.get(key))
+                if value is not None:
+                    self._groups[key].setdefault(value, {})[item_id] = file_path.stem
+
+        self._index_values()
+        # 以前の状態にあって空になったグループの集計ノートも削除する
+        for groups in (previous, self._groups):
+            for key, values in groups.items():
+                self._dirty.update((key, value) for value in values)
+        logger.info("Rebuilt aggregates from %s", books_path)
+
+    def add_book(self, item_id: str, path: Path, book: Mapping[str, object]):
+        """
+        新規作成または取り込んだノートを集計に加える。
+        """
+        for key in self._by:
+            if key in book:
+                self._move(key, item_id, path.stem, None, aggregate_key(book[key]))
+
+    def apply_changes(self, item_id: str, path: Path, changes: Mapping[str, tuple]):
+        """
+        既存ノートの更新で検出した差分 {キー: (旧値, 新値)} を集計に反映する。
+        """
+        for key in self._by:
+            if key in changes:
+                old_value, new_value = changes[key]
+                self._move(key, item_id, path.stem, aggregate_key(old_value), aggregate_key(new_value))
+
+    def remove_books(self, item_ids: Iterable[str]):
+        """
+        アーカイブしたノートなど、Vaultからなくなったノートを集計から取り除く。
+        """
+        for item_id in item_ids:
+            for key, values in self._values.items():
+                value = values.get(item_id)
+                if value is not None:
+                    self._remove(key, value, item_id)
+
+    def _move(self, key: str, item_id: str, link: str, old_value: Optional[str], new_value: Optional[str]):
+        groups = self._groups[key]
+        # 前回の同期のあとにノートが手で編集された場合など、差分の旧値と状態が食い違うときは状態を正とする
+        old_value = self._values[key].get(item_id)
+        if old_value == new_value and (new_value is None or groups[new_value].get(item_id) == link):
+            return
+        if old_value is not None:
+            self._remove(key, old_value, item_id)
+        if new_value is not None:
+            self._mark_dirty()
+            groups.setdefault(new_value, {})[item_id] = link
+            self._values[key][item_id] = new_value
+            self._dirty.add((key, new_value))
+
+    def _remove(self, key: str, value: str, item_id: str):
+        self._mark_dirty()
+        members = self._groups[key][value]
+        del members[item_id]
+        del self._values[key][item_id]
+        if not members:
+            del self._groups[key][value]
+        self._dirty.add((key, value))
+
+    def _mark_dirty(self):
+        if self._dirty:
+            return
+        self._dirty_marker.parent.mkdir(parents=True, exist_ok=True)
+        self._dirty_marker.touch()
+
+    def note_path(self, key: str, value: str) -> Path:
+        return self._output_path / key / f"{_sanitize_filename(value, FILENAME_MAX_BYTE_LENGTH - 3)}.md"
+
+    def render(self, key: str, value: str) -> str:
+        links = sorted(self._groups[key][value].values())
+        frontmatter = yaml.dump(
+            {"aggregate": key, "value": value, "count": len(links)}, allow_unicode=True, sort_keys=False
+        )
+        lines = "".join(f"- [[{link}]]\n" for link in links)
+        return f"---\n{frontmatter}---\n# {value}\n\n{lines}"
+
+    def flush(self) -> int:
+        """
+        変更のあったグループの集計ノートを書き直し（空になったグループは削除し）、状態を保存する。
+        戻り値: 書き直した集計ノートの数。
+        """
+        if not self._dirty:
+            return 0
+
+        written = 0
+        for key, value in sorted(self._dirty):
+            path = self.note_path(key, value)
+            if value in self._groups[key]:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                write_text_atomic(path, self.render(key, value))
+                written += 1
+            else:
+                path.unlink(missing_ok=True)
+
+        if self._compact or self._logged + len(self._dirty) > sum(len(groups) for groups in self._groups.values()):
+            state = {
+                "version": _STATE_VERSION,
+                "by": list(self._by),
+                "output_path": str(self._output_path),
+                "groups": self._groups,
+            }
+            write_text_atomic(self._state_file, json.dumps(state, ensure_ascii=False))
+            self._change_log.unlink(missing_ok=True)
+            self._logged = 0
+            self._compact = False
+        else:
+            # 途中で強制終了された場合はdirty_markerが残るため、次回は集計し直す
+            with self._change_log.open("a", encoding="utf-8") as f:
+                for key, value in sorted(self._dirty):
+                    f.write(json.dumps([key, value, self._groups[key].get(value)], ensure_ascii=False) + "\n")
+            self._logged += len(self._dirty)
+        self._dirty.clear()
+        self._dirty_marker.unlink(missing_ok=True)
+        self.written += written
+        return written
@@ -0,0 +1,218 @@
+from collections import deque
+from functools import partial
+from pathlib import Path
+import asyncio
+import itertools
+import logging
+from typing import AsyncIterator, Callable, Final, Generator, Iterator, Optional, Sequence, TypeVar
+
+from booklog_sync.core import BooklogCSVRow, SavedBook
+from booklog_sync.sync import BookResult, SyncStats, _PendingSave, _SyncSession
+
+logger = logging.getLogger(__name__)
+
+# 同時に読み込み・差分・書き込みを行うノートの数のデフォルト
+DEFAULT_CONCURRENCY: Final = 8
+
+# CSVの行をスレッドでまとめて読み込む件数
+ROW_BATCH_SIZE: Final = 256
+
+T = TypeVar("T")
+
+
+async def _in_thread(func: Callable[..., T], *args) -> T:
+    """
+    funcをスレッドで実行する。待っている間に取り消された場合も、funcが終わるのを待ってからCancelledErrorを送出する。
+    スレッドで実行中の処理と後始末が同時に走らないようにするため。
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await asyncio.wait({task})
+        raise
+
+
+class _RowReader:
+    """
+    CSVの行（sort_mergeの場合はノートとの突き合わせも含む）を、スレッドでROW_BATCH_SIZE行ずつ読み込む。
+    """
+
+    def __init__(self, session: _SyncSession, batch_size: int = ROW_BATCH_SIZE):
+        self._session = session
+        self._batch_size = batch_size
+        self._rows: Optional[Generator[tuple[BooklogCSVRow, Optional[Path]], None, None]] = None
+        self._numbered: Iterator[tuple[int, tuple[BooklogCSVRow, Optional[Path]]]] = iter(())
+
+    def read(self) -> list[tuple[int, tuple[BooklogCSVRow, Optional[Path]]]]:
+        if self._rows is None:
+            self._rows = self._session.rows()
+            self._numbered = enumerate(self._rows)
+        return list(itertools.islice(self._numbered, self._batch_size))
+
+    def close(self):
+        # 外部ソートの一時ファイルなどを片付ける
+        if self._rows is not None:
+            self._rows.close()
+
+
+def _forget(tasks: dict[Path, asyncio.Task], target: Path, task: asyncio.Task):
+    if tasks.get(target) is task:
+        del tasks[target]
+
+
+async def run_sync_async(
+    csv_path: Path | Sequence[Path],
+    books_path: Path,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    **options,
+) -> SyncStats:
+    """
+    run_syncのasyncio版。optionsはiter_syncと同じ。
+    取り消された場合は、それまでに書き込んだ行をジャーナルに記録してからCancelledErrorを送出する。
+    """
+    stats = SyncStats()
+    async for _ in iter_sync_async(csv_path, books_path, concurrency, stats=stats, **options):
+        pass
+    return stats
+
+
+async def iter_sync_async(
+    csv_path: Path | Sequence[Path],
+    books_path: Path,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[SyncStats] = None,
+    **options,
+) -> AsyncIterator[BookResult]:
+    """
+    iter_syncのasyncio版。1冊ごとの結果をCSVの行の順に返す。optionsはiter_syncと同じ。
+
+    Vaultの走査、CSVの読み込み、ノートの読み込み・差分・書き込みはスレッドで実行し、イベントループを止めない。
+    Vaultを走査している間に先頭のCSVの行を読み込み、ノートの保存は最大concurrency件を並行して行う。
+    同じファイルへの保存は行の順に行い、集計、ジャーナル、変更の記録は行の順に反映するため、
+    結果とVaultの内容はiter_syncと同じになる。
+    取り消された場合（または呼び出し側がループを抜けた場合）は、まだ始まっていない保存を行わず、
+    実行中の保存が終わるのを待ってから、完了した行までをジャーナルに記録する。
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    session = _SyncSession(csv_path, books_path, stats=stats, **options)
+    semaphore = asyncio.Semaphore(concurrency)
+    last_by_target: dict[Path, asyncio.Task] = {}
+    # 結果を返す順に並べた、保存待ちまたは保存済みの行。保存しない行はタスクがNone。
+    window: deque[tuple[_PendingSave | BookResult, Optional[asyncio.Task]]] = deque()
+    max_window = concurrency * 2
+    stopping = False
+
+    async def save(pending: _PendingSave, previous: Optional[asyncio.Task]) -> Optional[SavedBook]:
+        if previous is not None:
+            await asyncio.wait({previous})
+        async with semaphore:
+            if stopping:
+                return None
+            return await asyncio.to_thread(session.save, pending)
+
+    async def complete_head() -> BookResult:
+        # 待っている間に取り消された場合もdrainで記録できるよう、保存が終わるまで先頭に残しておく
+        step, task = window[0]
+        if task is not None:
+            await asyncio.wait({task})
+        window.popleft()
+        if task is None:
+            return step
+        saved = task.result()
+        if session.journal and session.journal.checkpoint_due:
+            return await _in_thread(session.complete, step, saved)
+        return session.complete(step, saved)
+
+    def drain():
+        # 保存が終わっていた行は、結果を返していなくても記録する
+        for step, task in window:
+            if task is None or task.cancelled() or task.exception() is not None:
+                continue
+            saved = task.result()
+            if saved is not None:
+                session.complete(step, saved)
+        window.clear()
+        session.abort()
+
+    reader = _RowReader(session)
+    # Vaultの索引を作っている間に、先頭のCSVの行を読み込んでおく
+    prefetch = asyncio.ensure_future(asyncio.to_thread(reader.read))
+    try:
+        await _in_thread(session.open)
+        while True:
+            await asyncio.wait({prefetch})
+            batch = prefetch.result()
+            if not batch:
+                break
+            prefetch = asyncio.ensure_future(asyncio.to_thread(reader.read))
+
+            for row_number, (row, existing_file) in batch:
+                step = session.prepare(row_number, row, existing_file)
+                if step is None:
+                    continue
+                if isinstance(step, BookResult):
+                    window.append((step, None))
+                else:
+                    target = step.target
+                    task = asyncio.ensure_future(save(step, last_by_target.get(target)))
+                    last_by_target[target] = task
+                    task.add_done_callback(partial(_forget, last_by_target, target))
+                    window.append((step, task))
+
+                while window and (len(window) > max_window or window[0][1] is None or window[0][1].done()):
+                    yield await complete_head()
+
+        while window:
+            yield await complete_head()
+    except BaseException:
+        stopping = True
+        tasks = [task for _, task in window if task is not None]
+        if tasks:
+            await asyncio.wait(tasks)
+        await asyncio.wait({prefetch})
+        await _in_thread(drain)
+        await _in_thread(reader.close)
+        raise
+
+    await _in_thread(reader.close)
+    await _in_thread(session.finish)
+
+
+class LatestSync:
+    """
+    CSVが更新されるたびにtriggerを呼び出すと、同期を始める。
+    実行中の同期があれば取り消し、その同期が完了した行を記録し終えてから、最新のCSVで同期し直す。
+    """
+
+    def __init__(self, csv_path: Path | Sequence[Path], books_path: Path, **options):
+        self._csv_path = csv_path
+        self._books_path = books_path
+        self._options = options
+        self._task: Optional[asyncio.Task] = None
+
+    def trigger(self) -> asyncio.Task:
+        """
+        同期を始め、そのタスクを返す。実行中の同期は取り消す。
+        """
+        previous = self._task
+        if previous is not None and not previous.done():
+            logger.info("CSV changed during sync, restarting")
+            previous.cancel()
+        self._task = asyncio.ensure_future(self._run(previous))
+        return self._task
+
+    async def _run(self, previous: Optional[asyncio.Task]) -> SyncStats:
+        if previous is not None:
+            await asyncio.wait({previous})
+        return await run_sync_async(self._csv_path, self._books_path, **self._options)
+
+    async def close(self):
+        """
+        実行中の同期を取り消し、後始末が終わるのを待つ。
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait({self._task})
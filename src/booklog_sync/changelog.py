@@ -0,0 +1,52 @@
+from datetime import datetime
+from pathlib import Path
+import json
+from typing import Final
+
+# バッファに溜める変更の件数。この件数に達するとまとめてファイルに書き出す。
+DEFAULT_BATCH_SIZE: Final = 1000
+
+
+class ChangeJournal:
+    """
+    ノートのフロントマターの変更を、1フィールド1行のJSON Linesで記録する。
+    変更はバッファに溜め、batch_size件ごとにまとめて追記する。
+    """
+
+    def __init__(self, journal_path: Path, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._journal_path = journal_path
+        self._batch_size = batch_size
+        self._buffer: list[str] = []
+        self.recorded = 0
+
+    def record(self, item_id: str, path: Path, changes: dict[str, tuple]):
+        """
+        diff_frontmatterが返した差分を記録する。
+        """
+        time = datetime.now().astimezone().isoformat(timespec="seconds")
+        for field, (old_value, new_value) in changes.items():
+            self._buffer.append(
+                json.dumps(
+                    {
+                        "time": time,
+                        "item_id": item_id,
+                        "path": str(path),
+                        "field": field,
+                        "old": old_value,
+                        "new": new_value,
+                    },
+                    ensure_ascii=False,
+                    default=str,
+                )
+            )
+        self.recorded += len(changes)
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self._buffer) + "\n")
+        self._buffer = []
@@ -0,0 +1,196 @@
+from dataclasses import dataclass, field
+from operator import itemgetter
+from pathlib import Path
+import itertools
+import json
+import logging
+from typing import Callable, Final, Iterable, Iterator, Literal, Optional
+
+import yaml
+
+from booklog_sync.core import (
+    DEFAULT_IGNORE_PATTERNS,
+    FILENAME_MAX_BYTE_LENGTH,
+    ITEM_ID_PATTERN,
+    generate_filename,
+    iter_markdown_files,
+)
+from booklog_sync.extsort import external_sort
+from booklog_sync.join import MIN_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 検出する問題の種類。
+# "duplicate_item_id" は同じitem_idを持つノートが複数ある（同期ではそのうち1つしか更新されない）、
+# "unparsable_frontmatter" はフロントマターを読み取れない（同期で上書きされる、または重複して作成される）、
+# "filename_drift" はファイル名がフロントマターから生成されるファイル名と異なる、
+# "name_too_long" はファイル名がFILENAME_MAX_BYTE_LENGTHを超えている。
+CheckKind = Literal["duplicate_item_id", "unparsable_frontmatter", "filename_drift", "name_too_long"]
+
+CHECK_KINDS: Final = ("duplicate_item_id", "unparsable_frontmatter", "filename_drift", "name_too_long")
+
+CHECK_LABELS: Final = {
+    "duplicate_item_id": "item_idの重複",
+    "unparsable_frontmatter": "フロントマターの誤り",
+    "filename_drift": "ファイル名のずれ",
+    "name_too_long": "長すぎるファイル名",
+}
+
+
+@dataclass(frozen=True)
+class VaultIssue:
+    kind: CheckKind
+    path: Path
+    item_id: Optional[str] = None
+    # 重複では同期で使われるノート、ファイル名のずれでは生成されるファイル名、フロントマターの誤りではその内容
+    detail: str = ""
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"kind": self.kind, "path": str(self.path), "item_id": self.item_id, "detail": self.detail},
+            ensure_ascii=False,
+        )
+
+    def __str__(self) -> str:
+        item_id = f" (item_id: {self.item_id})" if self.item_id else ""
+        detail = f": {self.detail}" if self.detail else ""
+        return f"[{CHECK_LABELS[self.kind]}] {self.path}{item_id}{detail}"
+
+
+@dataclass
+class CheckStats:
+    notes: int = 0
+    # item_idを持つノートの数
+    indexed: int = 0
+    # 種類ごとの問題の件数
+    issues: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(self.issues.values())
+
+
+class _Unterminated(ValueError):
+    pass
+
+
+def _read_frontmatter(file_path: Path) -> Optional[str]:
+    """
+    read_frontmatter_textと同じくフロントマターだけを読み込む。閉じる --- がない場合は_Unterminatedを送出する。
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        if f.readline().rstrip("\r\n") != "---":
+            return None
+        lines = []
+        for line in f:
+            if line.rstrip("\r\n") == "---":
+                return "".join(lines)
+            lines.append(line)
+    raise _Unterminated("".join(lines))
+
+
+def _yaml_error(error: yaml.YAMLError) -> str:
+    # 行番号を含む最初の行だけを使う
+    problem = getattr(error, "problem", None) or str(error).splitlines()[0]
+    mark = getattr(error, "problem_mark", None)
+    if mark is not None:
+        # フロントマターの開始行の --- の分、1行ずらす
+        return f"{problem} (line {mark.line + 2})"
+    return problem
+
+
+def _check_note(file_path: Path, report: Callable[[VaultIssue], None]) -> Optional[str]:
+    """
+    1つのノートを確かめ、item_idを持つノートであればitem_idを返す。
+    """
+    if len(file_path.name.encode("utf-8")) > FILENAME_MAX_BYTE_LENGTH:
+        report(VaultIssue("name_too_long", file_path, detail=f"{len(file_path.name.encode('utf-8'))} bytes"))
+
+    try:
+        frontmatter = _read_frontmatter(file_path)
+    except UnicodeDecodeError:
+        report(VaultIssue("unparsable_frontmatter", file_path, detail="not UTF-8"))
+        return None
+    except _Unterminated as e:
+        # 同期では既存ノートとして読めず、同じitem_idのノートが新しく作られる
+        match = ITEM_ID_PATTERN.search(str(e))
+        if match:
+            report(VaultIssue("unparsable_frontmatter", file_path, match.group(1), "closing '---' not found"))
+        return None
+    if frontmatter is None:
+        return None
+
+    match = ITEM_ID_PATTERN.search(frontmatter)
+    if not match:
+        return None
+    item_id = match.group(1)
+
+    try:
+        props = yaml.safe_load(frontmatter)
+    except yaml.YAMLError as e:
+        # 同期ではフロントマターが書籍データだけで上書きされる
+        report(VaultIssue("unparsable_frontmatter", file_path, item_id, _yaml_error(e)))
+        return item_id
+    if not isinstance(props, dict):
+        report(VaultIssue("unparsable_frontmatter", file_path, item_id, "not a mapping"))
+        return item_id
+
+    # save_bookが新規作成するときと同じ値からファイル名を生成する
+    expected = generate_filename(
+        props.get("author"), props.get("title"), props.get("publisher"), props.get("publish_year")
+    )
+    if file_path.name != expected:
+        report(VaultIssue("filename_drift", file_path, item_id, expected))
+    return item_id
+
+
+def check_vault(
+    books_path: Path,
+    report: Callable[[VaultIssue], None],
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    chunk_size: int = MIN_CHUNK_SIZE,
+    kinds: Iterable[CheckKind] = CHECK_KINDS,
+) -> CheckStats:
+    """
+    Vaultを1回走査してノートの問題を調べ、見つけた問題をreportに渡す。
+    ノートごとの問題は見つけた時点で、item_idの重複は走査が終わってから報告する。
+    重複はitem_idとパスの組をchunk_size件ずつ外部ソートして調べるため、Vaultの大きさに関わらず
+    メモリ上に保持するのはchunk_size件分だけになる。kindsで調べる問題の種類を絞り込める。
+    """
+    kinds = frozenset(kinds)
+    stats = CheckStats()
+
+    def counted(issue: VaultIssue):
+        if issue.kind not in kinds:
+            return
+        stats.issues[issue.kind] = stats.issues.get(issue.kind, 0) + 1
+        report(issue)
+
+    def indexed_notes() -> Iterator[tuple[str, Path]]:
+        if not books_path.exists():
+            return
+        for file_path in iter_markdown_files(books_path, recursive, ignore):
+            stats.notes += 1
+            item_id = _check_note(file_path, counted)
+            if item_id is not None:
+                stats.indexed += 1
+                yield item_id, file_path
+
+    notes = external_sort(indexed_notes(), key=itemgetter(0), chunk_size=chunk_size)
+    for item_id, group in itertools.groupby(notes, key=itemgetter(0)):
+        paths = [path for _, path in group]
+        if len(paths) < 2:
+            continue
+        # 安定ソートのため走査の順に並んでおり、build_id_book_indexは最後に見つかったノートを使う
+        used = paths[-1]
+        for path in paths[:-1]:
+            counted(VaultIssue("duplicate_item_id", path, item_id, str(used)))
+
+    logger.info(
+        "Checked %d notes (%d with item_id): %s",
+        stats.notes,
+        stats.indexed,
+        ", ".join(f"{kind}: {count}" for kind, count in stats.issues.items()) or "no issues",
+    )
+    return stats
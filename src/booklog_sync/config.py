@@ -1,12 +1,172 @@
 import yaml
 from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from booklog_sync.core import (
+    BOOKLOG_CSV_COLUMNS,
+    DEFAULT_FRONTMATTER_FIELDS,
+    DEFAULT_IGNORE_PATTERNS,
+    LAYOUTS,
+    REQUIRED_FRONTMATTER_FIELDS,
+    Layout,
+)
+from booklog_sync.defaults import (
+    ADOPT_MODES,
+    AGGREGATE_FIELDS,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_IDLE_AFTER,
+    DEFAULT_MAX_BACKOFF,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_SERVE_INTERVAL,
+    DEFAULT_SNAPSHOT_KEEP,
+    DEFAULT_SORT_MEMORY_MB,
+    JOIN_MODES,
+    LOCK_MODES,
+    MERGE_POLICIES,
+    ORPHAN_ACTIONS,
+    WATCH_BACKENDS,
+    AdoptMode,
+    JoinMode,
+    LockMode,
+    MergePolicy,
+    OrphanAction,
+    WatchBackend,
+)
+from booklog_sync.filters import FILTER_NAMES, RowFilter, parse_filter_date
+
+# 起動を速くするため、設定の値に使う定数は依存のないdefaultsから読み込み、各機能のモジュールはimportしない。
+if TYPE_CHECKING:
+    from booklog_sync.transforms import TransformStage
 
 
 @dataclass(frozen=True)
 class SyncConfig:
-    csv_path: Path
+    csv_path: Path | tuple[Path, ...]
     books_path: Path
+    body_template: Path | None = None
+    fields: tuple[str, ...] = DEFAULT_FRONTMATTER_FIELDS
+    orphan_action: OrphanAction = "report"
+    orphan_archive_path: Path | None = None
+    state_path: Path | None = None
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL
+    snapshot_keep: int = DEFAULT_SNAPSHOT_KEEP
+    max_writes_per_second: float | None = None
+    max_write_bytes_per_second: float | None = None
+    recursive: bool = False
+    ignore: tuple[str, ...] = DEFAULT_IGNORE_PATTERNS
+    layout: Layout = "flat"
+    merge_policy: MergePolicy = "first"
+    change_journal: Path | None = None
+    adopt: AdoptMode = "off"
+    join: JoinMode = "index"
+    sort_memory_mb: int = DEFAULT_SORT_MEMORY_MB
+    row_filter: RowFilter = RowFilter()
+    aggregate_path: Path | None = None
+    aggregate_by: tuple[str, ...] = AGGREGATE_FIELDS
+    transforms: tuple["TransformStage", ...] = ()
+    watch_backend: WatchBackend = "auto"
+    poll_interval: float = DEFAULT_POLL_INTERVAL
+    watch_restart_on_change: bool = False
+    lock_mode: LockMode = "handoff"
+    lock_timeout: float | None = None
+    serve_interval: float = DEFAULT_SERVE_INTERVAL
+    serve_idle_after: float = DEFAULT_IDLE_AFTER
+    serve_max_backoff: float = DEFAULT_MAX_BACKOFF
+
+    def sync_options(self) -> dict:
+        """
+        run_syncに渡すオプション引数を組み立てる。
+        """
+        return {
+            "body_template": self.body_template,
+            "fields": self.fields,
+            "orphan_action": self.orphan_action,
+            "orphan_archive_path": self.orphan_archive_path,
+            "state_path": self.state_path,
+            "checkpoint_interval": self.checkpoint_interval,
+            "snapshot_keep": self.snapshot_keep,
+            "max_writes_per_second": self.max_writes_per_second,
+            "max_write_bytes_per_second": self.max_write_bytes_per_second,
+            "recursive": self.recursive,
+            "ignore": self.ignore,
+            "layout": self.layout,
+            "merge_policy": self.merge_policy,
+            "change_journal": self.change_journal,
+            "adopt": self.adopt,
+            "join": self.join,
+            "sort_memory_mb": self.sort_memory_mb,
+            "row_filter": self.row_filter,
+            "aggregate_path": self.aggregate_path,
+            "aggregate_by": self.aggregate_by,
+            "transforms": self.transforms,
+        }
+
+    def watch_options(self) -> dict:
+        """
+        start_watchingに渡す監視方法のオプション引数を組み立てる。
+        """
+        return {"backend": self.watch_backend, "poll_interval": self.poll_interval}
+
+    def serve_options(self) -> dict:
+        """
+        start_servingに渡す常駐モードのオプション引数を組み立てる。
+        """
+        return {
+            "interval": self.serve_interval,
+            "idle_after": self.serve_idle_after,
+            "max_backoff": self.serve_max_backoff,
+        }
+
+
+def _filter_values(value, name: str) -> tuple[str, ...]:
+    # service_idなどはYAMLで数値として読み込まれるため、文字列にそろえる
+    if value is None:
+        return ()
+    if not isinstance(value, list):
+        value = [value]
+    if any(isinstance(item, (dict, list)) for item in value):
+        raise ValueError(f"設定エラー: 'filters.{name}' は値または値のリストで指定してください。")
+    return tuple(str(item) for item in value)
+
+
+def _date_range(value, name: str) -> tuple[str | None, str | None]:
+    if value is None:
+        return None, None
+    if not isinstance(value, dict) or not set(value) <= {"from", "to"}:
+        raise ValueError(f"設定エラー: 'filters.{name}' は from と to で指定してください。")
+    return (
+        parse_filter_date(value.get("from"), f"filters.{name}.from"),
+        parse_filter_date(value.get("to"), f"filters.{name}.to"),
+    )
+
+
+def load_row_filter(filters) -> RowFilter:
+    """
+    設定ファイルの filters を読み込む。
+    """
+    if filters is None:
+        return RowFilter()
+    if not isinstance(filters, dict):
+        raise ValueError("設定エラー: 'filters' は絞り込みの名前と条件の組で指定してください。")
+    for name in filters:
+        if name not in FILTER_NAMES:
+            raise ValueError(
+                f"設定エラー: 'filters' の '{name}' は不明です。{', '.join(FILTER_NAMES)} のいずれかを指定してください。"
+            )
+
+    registered_from, registered_to = _date_range(filters.get("registered_at"), "registered_at")
+    finished_from, finished_to = _date_range(filters.get("finished_at"), "finished_at")
+    return RowFilter(
+        since=parse_filter_date(filters.get("since"), "filters.since"),
+        registered_from=registered_from,
+        registered_to=registered_to,
+        finished_from=finished_from,
+        finished_to=finished_to,
+        statuses=_filter_values(filters.get("status"), "status"),
+        categories=_filter_values(filters.get("category"), "category"),
+        service_ids=_filter_values(filters.get("service_id"), "service_id"),
+    )
 
 
 def load_config(config_path: str | Path) -> SyncConfig:
@@ -25,7 +185,155 @@ def load_config(config_path: str | Path) -> SyncConfig:
         if key not in config or not config[key]:
             raise ValueError(f"設定エラー: '{key}' は必須項目です。")
 
+    fields = config.get("fields") or DEFAULT_FRONTMATTER_FIELDS
+    if not isinstance(fields, (list, tuple)):
+        raise ValueError("設定エラー: 'fields' は列名のリストで指定してください。")
+    for field in fields:
+        if field not in BOOKLOG_CSV_COLUMNS:
+            raise ValueError(f"設定エラー: 'fields' に不明な列 '{field}' が含まれています。")
+    for field in REQUIRED_FRONTMATTER_FIELDS:
+        if field not in fields:
+            raise ValueError(f"設定エラー: 'fields' には '{field}' が必須です。")
+
+    orphan_action = config.get("orphan_action") or "report"
+    if orphan_action not in ORPHAN_ACTIONS:
+        raise ValueError(
+            f"設定エラー: 'orphan_action' は {', '.join(ORPHAN_ACTIONS)} のいずれかを指定してください。"
+        )
+    if orphan_action == "archive" and not config.get("orphan_archive_path"):
+        raise ValueError("設定エラー: 'orphan_action' が archive の場合、'orphan_archive_path' は必須項目です。")
+
+    checkpoint_interval = config.get("checkpoint_interval", DEFAULT_CHECKPOINT_INTERVAL)
+    if isinstance(checkpoint_interval, bool) or not isinstance(checkpoint_interval, int) or checkpoint_interval < 0:
+        raise ValueError("設定エラー: 'checkpoint_interval' は0以上の整数で指定してください。")
+
+    snapshot_keep = config.get("snapshot_keep", DEFAULT_SNAPSHOT_KEEP)
+    if isinstance(snapshot_keep, bool) or not isinstance(snapshot_keep, int) or snapshot_keep < 0:
+        raise ValueError("設定エラー: 'snapshot_keep' は0以上の整数で指定してください。")
+
+    for key in ["max_writes_per_second", "max_write_bytes_per_second"]:
+        value = config.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            raise ValueError(f"設定エラー: '{key}' は正の数で指定してください。")
+
+    layout = config.get("layout") or "flat"
+    if layout not in LAYOUTS:
+        raise ValueError(f"設定エラー: 'layout' は {', '.join(LAYOUTS)} のいずれかを指定してください。")
+    # サブディレクトリに作成したファイルを次回の同期で見つけられるよう、flat以外では再帰的に走査する
+    recursive = config.get("recursive", layout != "flat")
+    if layout != "flat" and not recursive:
+        raise ValueError("設定エラー: 'layout' が flat 以外の場合、'recursive' を false にはできません。")
+    ignore = config.get("ignore", DEFAULT_IGNORE_PATTERNS)
+    if not isinstance(ignore, (list, tuple)):
+        raise ValueError("設定エラー: 'ignore' はパターンのリストで指定してください。")
+
+    # 複数のCSVを統合する場合は csv_path にリストを指定する
+    csv_path = config["csv_path"]
+    if isinstance(csv_path, list):
+        csv_path = tuple(Path(p) for p in csv_path) if len(csv_path) > 1 else Path(csv_path[0])
+    else:
+        csv_path = Path(csv_path)
+    merge_policy = config.get("merge_policy") or "first"
+    if merge_policy not in MERGE_POLICIES:
+        raise ValueError(
+            f"設定エラー: 'merge_policy' は {', '.join(MERGE_POLICIES)} のいずれかを指定してください。"
+        )
+
+    # YAMLでは on / off が真偽値として読み込まれる
+    adopt = {True: "on", False: "off", None: "off"}.get(config.get("adopt"), config.get("adopt"))
+    if adopt not in ADOPT_MODES:
+        raise ValueError(f"設定エラー: 'adopt' は {', '.join(ADOPT_MODES)} のいずれかを指定してください。")
+
+    join = config.get("join") or "index"
+    if join not in JOIN_MODES:
+        raise ValueError(f"設定エラー: 'join' は {', '.join(JOIN_MODES)} のいずれかを指定してください。")
+    if join == "sort_merge" and adopt != "off":
+        raise ValueError("設定エラー: 'join' が sort_merge の場合、'adopt' は指定できません。")
+    sort_memory_mb = config.get("sort_memory_mb", DEFAULT_SORT_MEMORY_MB)
+    if isinstance(sort_memory_mb, bool) or not isinstance(sort_memory_mb, int) or sort_memory_mb <= 0:
+        raise ValueError("設定エラー: 'sort_memory_mb' は正の整数で指定してください。")
+
+    # 省略時は、集計できるキーのうちフロントマターに出力するものをすべて使う
+    aggregate_by = config.get("aggregate_by") or [key for key in AGGREGATE_FIELDS if key in fields]
+    if not isinstance(aggregate_by, (list, tuple)):
+        raise ValueError("設定エラー: 'aggregate_by' はキーのリストで指定してください。")
+    for key in aggregate_by:
+        if key not in AGGREGATE_FIELDS:
+            raise ValueError(
+                f"設定エラー: 'aggregate_by' は {', '.join(AGGREGATE_FIELDS)} から指定してください。"
+            )
+        if key not in fields:
+            raise ValueError(f"設定エラー: 'aggregate_by' の '{key}' は 'fields' にも指定してください。")
+
+    watch_backend = config.get("watch_backend") or "auto"
+    if watch_backend not in WATCH_BACKENDS:
+        raise ValueError(
+            f"設定エラー: 'watch_backend' は {', '.join(WATCH_BACKENDS)} のいずれかを指定してください。"
+        )
+    poll_interval = config.get("poll_interval", DEFAULT_POLL_INTERVAL)
+    if isinstance(poll_interval, bool) or not isinstance(poll_interval, (int, float)) or poll_interval <= 0:
+        raise ValueError("設定エラー: 'poll_interval' は正の数で指定してください。")
+    watch_restart_on_change = config.get("watch_restart_on_change", False)
+    if not isinstance(watch_restart_on_change, bool):
+        raise ValueError("設定エラー: 'watch_restart_on_change' は true または false で指定してください。")
+
+    lock_mode = config.get("lock") or "handoff"
+    if lock_mode not in LOCK_MODES:
+        raise ValueError(f"設定エラー: 'lock' は {', '.join(LOCK_MODES)} のいずれかを指定してください。")
+    lock_timeout = config.get("lock_timeout")
+    if lock_timeout is not None and (
+        isinstance(lock_timeout, bool) or not isinstance(lock_timeout, (int, float)) or lock_timeout < 0
+    ):
+        raise ValueError("設定エラー: 'lock_timeout' は0以上の数で指定してください。")
+
+    serve_interval = config.get("serve_interval", DEFAULT_SERVE_INTERVAL)
+    serve_max_backoff = config.get("serve_max_backoff", DEFAULT_MAX_BACKOFF)
+    for key, value in [("serve_interval", serve_interval), ("serve_max_backoff", serve_max_backoff)]:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise ValueError(f"設定エラー: '{key}' は正の数で指定してください。")
+    serve_idle_after = config.get("serve_idle_after", DEFAULT_IDLE_AFTER)
+    if isinstance(serve_idle_after, bool) or not isinstance(serve_idle_after, (int, float)) or serve_idle_after < 0:
+        raise ValueError("設定エラー: 'serve_idle_after' は0以上の数で指定してください。")
+
+    transforms = ()
+    if config.get("transforms") is not None:
+        from booklog_sync.transforms import compile_transforms
+
+        # 変換のファイルは設定ファイルからの相対パスで指定できる
+        transforms = compile_transforms(config.get("transforms"), path.parent)
+
     return SyncConfig(
-        csv_path=Path(config["csv_path"]),
+        csv_path=csv_path,
         books_path=Path(config["books_path"]),
+        body_template=Path(config["body_template"]) if config.get("body_template") else None,
+        fields=tuple(fields),
+        orphan_action=orphan_action,
+        orphan_archive_path=(
+            Path(config["orphan_archive_path"]) if config.get("orphan_archive_path") else None
+        ),
+        state_path=Path(config["state_path"]) if config.get("state_path") else None,
+        checkpoint_interval=checkpoint_interval,
+        snapshot_keep=snapshot_keep,
+        max_writes_per_second=config.get("max_writes_per_second"),
+        max_write_bytes_per_second=config.get("max_write_bytes_per_second"),
+        recursive=bool(recursive),
+        ignore=tuple(ignore),
+        layout=layout,
+        merge_policy=merge_policy,
+        change_journal=Path(config["change_journal"]) if config.get("change_journal") else None,
+        adopt=adopt,
+        join=join,
+        sort_memory_mb=sort_memory_mb,
+        row_filter=load_row_filter(config.get("filters")),
+        aggregate_path=Path(config["aggregate_path"]) if config.get("aggregate_path") else None,
+        aggregate_by=tuple(aggregate_by),
+        transforms=transforms,
+        watch_backend=watch_backend,
+        poll_interval=float(poll_interval),
+        watch_restart_on_change=watch_restart_on_change,
+        lock_mode=lock_mode,
+        lock_timeout=float(lock_timeout) if lock_timeout is not None else None,
+        serve_interval=float(serve_interval),
+        serve_idle_after=float(serve_idle_after),
+        serve_max_backoff=float(serve_max_backoff),
     )
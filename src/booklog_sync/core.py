@@ -1,8 +1,23 @@
 from pathlib import Path
+from operator import itemgetter
+import csv
+import fnmatch
+import hashlib
 import logging
+import os
 import yaml
 import re
-from typing import Final, Literal, TypedDict, Optional, get_type_hints
+from typing import (
+    Callable,
+    Final,
+    Iterable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    TypedDict,
+    Optional,
+    get_type_hints,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +45,7 @@ class BooklogCSVRow(TypedDict, total=False):
 BOOKLOG_CSV_COLUMNS: Final = list(get_type_hints(BooklogCSVRow).keys())
 
 
-class Book(TypedDict):
+class Book(TypedDict, total=False):
     item_id: str
     title: str
     author: Optional[str]
@@ -39,31 +54,190 @@ class Book(TypedDict):
     publish_year: Optional[str]
     status: Optional[str]
     rating: Optional[int]
+    service_id: Optional[str]
+    category: Optional[str]
+    review: Optional[str]
+    tags: Optional[str]
+    memo: Optional[str]
+    registered_at: Optional[str]
+    finished_at: Optional[str]
+    book_type: Optional[str]
+    page_count: Optional[int]
+
+
+# フロントマターに出力する列のデフォルト。設定ファイルの fields で変更できる。
+DEFAULT_FRONTMATTER_FIELDS: Final = (
+    "item_id",
+    "title",
+    "author",
+    "isbn13",
+    "publisher",
+    "publish_year",
+    "status",
+    "rating",
+)
+
+# 既存ファイルとの照合とファイル名の生成に必要なため、常にフロントマターに含める列
+REQUIRED_FRONTMATTER_FIELDS: Final = ("item_id", "title", "author", "publisher", "publish_year")
+
+# 数値としてフロントマターに出力する列
+INTEGER_FIELDS: Final = frozenset({"rating", "page_count"})
 
 
 # ファイル名の最大バイト数。OS上の上限は255バイトだが、何かの操作でファイル名にプレフィックスがつく場合などを考慮して200バイトとする。UTF-8。
 FILENAME_MAX_BYTE_LENGTH: Final = 200
 
-SyncResult = Literal["created", "updated", "unchanged"]
+# "conflict" は、同期中にノートが編集され続けたため書き込みを見送ったことを表す
+SyncResult = Literal["created", "updated", "unchanged", "conflict"]
 
+# write_if_unchangedの結果
+GuardedWriteResult = Literal["written", "unchanged", "conflict"]
 
-def convert_csv(row: BooklogCSVRow) -> Book:
+
+class SavedBook(NamedTuple):
+    result: SyncResult
+    path: Path
+    # 更新したフィールドの {フィールド名: (旧値, 新値)}。作成時と変更なしの場合は空。
+    changes: dict[str, tuple]
+
+
+class FileVersion(NamedTuple):
+    """ノートを読み込んだ時点のファイルの状態。書き込む直前に変わっていないかの確認に使う。"""
+
+    mtime_ns: int
+    size: int
+    digest: bytes
+
+
+# 書き込む直前にノートが変更されていた場合に、読み込みとマージをやり直す回数
+DEFAULT_WRITE_RETRIES: Final = 3
+
+# 同期ジャーナルなど、ツールが管理する状態ファイルを置くディレクトリ名。
+# ドットで始まるディレクトリはObsidianのファイル一覧に表示されない。
+STATE_DIR_NAME: Final = ".booklog-sync"
+
+
+# Vaultの走査で除外するファイル・ディレクトリ名のパターンのデフォルト。
+# ".*" は .obsidian、.trash、.booklog-sync などを除外する。
+DEFAULT_IGNORE_PATTERNS: Final = (".*", "attachments")
+
+# 新規ファイルを配置するサブディレクトリの決め方
+Layout = Literal["flat", "author_initial", "publish_year"]
+
+LAYOUTS: Final = ("flat", "author_initial", "publish_year")
+
+
+def default_state_path(books_path: Path) -> Path:
+    return books_path / STATE_DIR_NAME
+
+
+def write_text_atomic(path: Path, content: str):
     """
-    ブクログのCSVの1行をObsidianのフロントマター用書籍データに変換する
+    一時ファイルに書き込んでから置き換えることで、書き込み途中の中断でファイルが壊れないようにする。
     """
-    rating_str: str = row.get("rating", "")
-    rating = int(rating_str) if rating_str.isdigit() else None
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
 
-    return {
-        "item_id": row.get("item_id"),
-        "title": row.get("title"),
-        "author": row.get("author"),
-        "isbn13": row.get("isbn13"),
-        "publisher": row.get("publisher"),
-        "publish_year": row.get("publish_year"),
-        "status": row.get("status"),
-        "rating": rating,
-    }
+
+def read_text_versioned(path: Path) -> tuple[str, FileVersion]:
+    """
+    ファイルの内容と、読み込んだ時点のFileVersionを返す。改行はread_textと同じく\nにそろえる。
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    return text, FileVersion(stat.st_mtime_ns, stat.st_size, hashlib.blake2b(data).digest())
+
+
+def is_unchanged(path: Path, expected: FileVersion) -> bool:
+    """
+    pathがexpectedを読み込んだ時点から変わっていなければTrueを返す。
+    更新日時とサイズを先に比べ、一致した場合だけ内容のハッシュを比べる。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if (stat.st_mtime_ns, stat.st_size) != (expected.mtime_ns, expected.size):
+        return False
+    # 更新日時の精度が粗いファイルシステムでは、同じ時刻のまま書き換えられることがあるため内容も比べる
+    return hashlib.blake2b(path.read_bytes()).digest() == expected.digest
+
+
+def write_if_unchanged(
+    path: Path,
+    content: str,
+    expected: FileVersion,
+    rebase: Callable[[], Optional[tuple[str, FileVersion]]],
+    writer: Callable[[Path, str], None] = write_text_atomic,
+    retries: int = DEFAULT_WRITE_RETRIES,
+) -> GuardedWriteResult:
+    """
+    pathがexpectedの時点から変わっていなければcontentを書き込み、"written" を返す（compare-and-swap）。
+    変わっていた場合はrebase()で最新の内容にマージし直した (内容, FileVersion) を受け取り、retries回までやり直す。
+    rebase()がNoneを返した場合は書き込まず、マージし直すと変更がなくなった場合は "unchanged"、
+    ノートが削除された場合は "conflict" を返す。やり直しても書き込めなかった場合も "conflict" を返す。
+    """
+    for attempt in range(retries + 1):
+        if is_unchanged(path, expected):
+            writer(path, content)
+            return "written"
+        if attempt == retries:
+            break
+        logger.debug("Conflict: %s was modified during sync, merging again", path)
+        rebased = rebase()
+        if rebased is None:
+            if path.exists():
+                logger.debug("Unchanged after merging again: %s", path)
+                return "unchanged"
+            logger.warning("Conflict: %s was deleted during sync, skipped", path)
+            return "conflict"
+        content, expected = rebased
+
+    logger.warning("Conflict: %s kept changing during sync, skipped", path)
+    return "conflict"
+
+
+def convert_csv(
+    row: BooklogCSVRow, fields: Iterable[str] = DEFAULT_FRONTMATTER_FIELDS
+) -> Book:
+    """
+    ブクログのCSVの1行をObsidianのフロントマター用書籍データに変換する。
+    fieldsで指定した列だけを、指定した順序で出力する。
+    """
+    book: Book = {}
+    for field in fields:
+        value = row.get(field)
+        if field in INTEGER_FIELDS:
+            value = int(value) if value and value.isdigit() else None
+        book[field] = value
+    return book
+
+
+def read_booklog_csv(csv_path: Path, columns: Iterable[str]) -> Iterator[BooklogCSVRow]:
+    """
+    ブクログのCSVを読み込み、columnsで指定した列だけを持つ行を順に返す。
+    列は位置で取り出すため、使わない列の辞書エントリは作られない。
+    """
+    wanted = set(columns)
+    names = tuple(column for column in BOOKLOG_CSV_COLUMNS if column in wanted)
+    indexes = [BOOKLOG_CSV_COLUMNS.index(name) for name in names]
+    width = max(indexes) + 1
+    getter = itemgetter(*indexes)
+    if len(indexes) == 1:
+        single_getter = getter
+        getter = lambda record: (single_getter(record),)  # noqa: E731
+
+    with open(csv_path, "r", encoding="cp932", newline="") as f:
+        for record in csv.reader(f):
+            if not record:
+                continue
+            if len(record) < width:
+                # csv.DictReaderと同様、足りない列はNoneとして扱う
+                record = record + [None] * (width - len(record))
+            yield dict(zip(names, getter(record)))
 
 
 def _sanitize_filename(filename: str, max_bytes: int = 200) -> str:
@@ -107,24 +281,106 @@ def generate_filename(
     return sanitized
 
 
-def build_id_book_index(books_path: Path) -> dict[str, Path]:
+def iter_markdown_files(
+    root: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> Iterator[Path]:
     """
-    ディレクトリ内の全ファイルを走査し、item_idがあるファイルとそのファイルパスをもつ辞書を返す。
+    root以下のMarkdownファイルを列挙する。ignoreのパターンに一致する名前のファイルとディレクトリは除外する。
+    os.scandirのエントリが持つ種別情報を使うため、ファイルごとのstatは発生しない。
+    """
+    ignored = re.compile("|".join(fnmatch.translate(pattern) for pattern in ignore) or "(?!)")
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if ignored.match(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        directories.append(entry.path)
+                elif entry.name.endswith(".md") and entry.is_file():
+                    yield Path(entry.path)
+
+
+def shard_directory(book: Book | BooklogCSVRow, layout: Layout) -> str:
+    """
+    layoutに従って、新規ファイルを配置するサブディレクトリ名を返す。flatの場合は空文字。
+    """
+    if layout == "author_initial":
+        author = (book.get("author") or "").strip()
+        return _sanitize_filename(author[:1].upper()) if author else "_"
+    if layout == "publish_year":
+        publish_year = (book.get("publish_year") or "").strip()
+        return _sanitize_filename(publish_year) if publish_year else "unknown"
+    return ""
+
+
+def read_frontmatter_text(file_path: Path) -> Optional[str]:
+    """
+    ファイル先頭のフロントマター部分（区切りの --- を除く）だけを読み込んで返す。
+    本文は読み込まない。フロントマターがない場合はNoneを返す。
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        if f.readline().rstrip("\r\n") != "---":
+            return None
+        lines = []
+        for line in f:
+            if line.rstrip("\r\n") == "---":
+                return "".join(lines)
+            lines.append(line)
+    return None
+
+
+ITEM_ID_PATTERN: Final = re.compile(r'^item_id:\s*["\']?([A-Za-z0-9]+)["\']?', re.MULTILINE)
+
+
+def iter_frontmatters(
+    books_path: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> Iterator[tuple[Path, str]]:
+    """
+    フロントマターを持つノートについて、(ファイルパス, フロントマター) を順に返す。
+    各ファイルはフロントマター部分だけを読み込む。
     """
-    index = {}
     if not books_path.exists():
-        return index
+        return
+
+    for file_path in iter_markdown_files(books_path, recursive, ignore):
+        frontmatter = read_frontmatter_text(file_path)
+        if frontmatter is not None:
+            yield file_path, frontmatter
 
-    for file_path in books_path.glob("*.md"):
-        content = file_path.read_text(encoding="utf-8")
-        match = re.search(
-            r'^item_id:\s*["\']?([A-Za-z0-9]+)["\']?', content, re.MULTILINE
-        )
+
+def iter_indexed_notes(
+    books_path: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> Iterator[tuple[str, Path, str]]:
+    """
+    フロントマターにitem_idを持つノートについて、(item_id, ファイルパス, フロントマター) を順に返す。
+    """
+    for file_path, frontmatter in iter_frontmatters(books_path, recursive, ignore):
+        match = ITEM_ID_PATTERN.search(frontmatter)
         if match:
-            item_id = match.group(1)
-            index[item_id] = file_path
+            yield match.group(1), file_path, frontmatter
+
 
-    return index
+def build_id_book_index(
+    books_path: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> dict[str, Path]:
+    """
+    ディレクトリ内の全ファイルを走査し、item_idがあるファイルとそのファイルパスをもつ辞書を返す。
+    recursiveがTrueの場合はサブディレクトリも走査する。
+    """
+    return {
+        item_id: file_path
+        for item_id, file_path, _ in iter_indexed_notes(books_path, recursive, ignore)
+    }
 
 
 def diff_frontmatter(existing_props: dict, book: Book) -> dict[str, tuple]:
@@ -143,56 +399,122 @@ def diff_frontmatter(existing_props: dict, book: Book) -> dict[str, tuple]:
     return changes
 
 
-def save_book_to_markdown(
+def _merge_note(file_path: Path, old_content: str, book: Book) -> Optional[tuple[str, dict[str, tuple]]]:
+    """
+    ノートのフロントマターにbookをマージした内容と差分を返す。フロントマターがない場合はNone。
+    """
+    parts = re.split(r"^---$", old_content, maxsplit=2, flags=re.MULTILINE)
+    if len(parts) < 3:
+        return None
+
+    try:
+        old_props = yaml.safe_load(parts[1]) or {}
+    except yaml.YAMLError:
+        logger.warning("Failed to parse frontmatter, overwriting: %s", file_path)
+        old_props = {}
+    changes = diff_frontmatter(old_props, book)
+    if not changes:
+        return old_content, changes
+
+    old_props.update(book)
+    return f"---\n{yaml.dump(old_props, allow_unicode=True, sort_keys=False)}---{parts[2]}", changes
+
+
+def _rebase_note(file_path: Path, book: Book) -> Optional[tuple[str, FileVersion]]:
+    try:
+        old_content, version = read_text_versioned(file_path)
+    except FileNotFoundError:
+        return None
+    merged = _merge_note(file_path, old_content, book)
+    if merged is None or not merged[1]:
+        return None
+    return merged[0], version
+
+
+def new_note_path(books_path: Path, book: Book) -> Path:
+    """
+    書籍のノートを新規作成する場合のファイルパスを返す。
+    """
+    filename = generate_filename(
+        book["author"],
+        book["title"],
+        book["publisher"],
+        book["publish_year"],
+    )
+    return books_path / _sanitize_filename(filename)
+
+
+def save_book(
     books_path: Path,
     book: Book,
     body: str = "",
     existing_file: Optional[Path] = None,
-) -> SyncResult:
+    writer: Optional[Callable[..., None]] = None,
+    write_file: Callable[[Path, str], None] = write_text_atomic,
+) -> SavedBook:
     """
-    書籍データをMarkdownファイルとして保存する。
-    戻り値: "created", "updated", "unchanged"
+    書籍データをMarkdownファイルとして保存し、結果と対象のパス、更新したフィールドを返す。
+    既存ファイルの更新は、読み込んだ時点から変更されていないことを確かめてから書き込む。
+    writerを指定すると、ファイルへの書き込みを writer(パス, 内容, 結果) の呼び出しに委ねる。
+    既存ファイルの更新では、4番目の引数にwrite_if_unchangedに渡す (FileVersion, rebase) を渡す。
+    write_fileは、writerを指定しない場合にファイルを書き込む関数（スナップショットを取る場合など）。
     """
 
     if existing_file and existing_file.exists():
-        old_content = existing_file.read_text(encoding="utf-8")
-        parts = re.split(r"^---$", old_content, maxsplit=2, flags=re.MULTILINE)
+        old_content, version = read_text_versioned(existing_file)
+        merged = _merge_note(existing_file, old_content, book)
 
-        if len(parts) >= 3:
-            try:
-                old_props = yaml.safe_load(parts[1]) or {}
-            except yaml.YAMLError:
-                logger.warning("Failed to parse frontmatter, overwriting: %s", existing_file)
-                old_props = {}
-            changes = diff_frontmatter(old_props, book)
+        if merged is not None:
+            content, changes = merged
 
             if not changes:
                 logger.debug("Unchanged: %s", existing_file)
-                return "unchanged"
-
-            logger.info("Changes detected in %s:", existing_file)
-            for key, (old_val, new_val) in changes.items():
-                logger.info("  %s: %s → %s", key, old_val, new_val)
-
-            old_props.update(book)
-            content = f"---\n{yaml.dump(old_props, allow_unicode=True, sort_keys=False)}---{parts[2]}"
-            existing_file.write_text(content, encoding="utf-8")
-            return "updated"
+                return SavedBook("unchanged", existing_file, changes)
+
+            # 大量の更新でログの整形が負担にならないよう、DEBUGのときだけ差分を整形する
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Changes detected in %s: %s",
+                    existing_file,
+                    ", ".join(f"{key}: {old_val} → {new_val}" for key, (old_val, new_val) in changes.items()),
+                )
+
+            # 読み込んでから書き込むまでの間にObsidianなどで編集された場合は、編集後の内容にマージし直す
+            guard = (version, lambda: _rebase_note(existing_file, book))
+            if writer:
+                writer(existing_file, content, "updated", guard)
+                return SavedBook("updated", existing_file, changes)
+            written = write_if_unchanged(existing_file, content, *guard, writer=write_file)
+            if written == "unchanged":
+                return SavedBook("unchanged", existing_file, {})
+            if written == "conflict":
+                return SavedBook("conflict", existing_file, changes)
+            return SavedBook("updated", existing_file, changes)
 
     books_path.mkdir(parents=True, exist_ok=True)
-
-    filename = generate_filename(
-        book["author"],
-        book["title"],
-        book["publisher"],
-        book["publish_year"],
-    )
-    file_path = books_path / _sanitize_filename(filename)
+    file_path = new_note_path(books_path, book)
 
     frontmatter = yaml.dump(book, allow_unicode=True, sort_keys=False)
 
     content = f"---\n{frontmatter}---\n{body}\n"
-    file_path.write_text(content, encoding="utf-8")
+    if writer:
+        writer(file_path, content, "created")
+    else:
+        write_file(file_path, content)
+
+    logger.debug("Created: %s", file_path)
+    return SavedBook("created", file_path, {})
+
 
-    logger.info("Created: %s", file_path)
-    return "created"
+def save_book_to_markdown(
+    books_path: Path,
+    book: Book,
+    body: str = "",
+    existing_file: Optional[Path] = None,
+    writer: Optional[Callable[..., None]] = None,
+) -> SyncResult:
+    """
+    書籍データをMarkdownファイルとして保存する。
+    戻り値: "created", "updated", "unchanged", "conflict"
+    """
+    return save_book(books_path, book, body, existing_file, writer).result
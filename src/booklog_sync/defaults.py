@@ -0,0 +1,62 @@
+from typing import Final, Literal
+
+# 設定の選択肢とデフォルト値。configが起動時に読み込むため、このモジュールは標準ライブラリ以外をimportしない。
+# 各機能のモジュールは、ここで定義した値をimportして使う。
+
+# item_idを持たない既存ノートの取り込み方
+AdoptMode = Literal["off", "report", "on"]
+
+ADOPT_MODES: Final = ("off", "report", "on")
+
+# 集計ノートを作れるフロントマターのキー
+AGGREGATE_FIELDS: Final = ("status", "rating", "author")
+
+# CSVの行とVaultのノートを突き合わせる方法。
+# "index" はVault全体のitem_idの索引をメモリ上に作り、CSVをファイルの順に処理する。
+# "sort_merge" はCSVの行とノートの両方をitem_idで外部ソートし、1回の順次走査で突き合わせる。
+JoinMode = Literal["index", "sort_merge"]
+
+JOIN_MODES: Final = ("index", "sort_merge")
+
+# sort_mergeでソートに使うメモリの上限（MB）のデフォルト
+DEFAULT_SORT_MEMORY_MB: Final = 64
+
+# 別のプロセスが同期中だった場合の動作。
+# "wait" は終わるのを待ち、"fail" はすぐにエラーで終了する。
+# "handoff" は相手が監視モードのプロセスなら同期を依頼して終了し、そうでなければ "wait" と同じく待つ。
+LockMode = Literal["wait", "fail", "handoff"]
+
+LOCK_MODES: Final = ("wait", "fail", "handoff")
+
+# 複数のCSVに同じitem_idの行があるとき、どの行を採用するか
+MergePolicy = Literal["first", "latest_finished", "highest_rating"]
+
+MERGE_POLICIES: Final = ("first", "latest_finished", "highest_rating")
+
+OrphanAction = Literal["report", "tag", "archive"]
+
+ORPHAN_ACTIONS: Final = ("report", "tag", "archive")
+
+# CSVの変更を検知する方法。"native" はOSのファイル変更通知（watchdog）、"polling" は定期的なstatの確認、
+# "auto" は監視するディレクトリがネットワークドライブならpolling、それ以外ならnativeを使う。
+WatchBackend = Literal["auto", "native", "polling"]
+
+WATCH_BACKENDS: Final = ("auto", "native", "polling")
+
+# pollingでCSVのstatを確認する間隔（秒）
+DEFAULT_POLL_INTERVAL: Final = 5.0
+
+# チェックポイントを書き出す間隔（行数）のデフォルト
+DEFAULT_CHECKPOINT_INTERVAL: Final = 500
+
+# 常駐モードで定期的に同期する間隔（秒）
+DEFAULT_SERVE_INTERVAL: Final = 300.0
+
+# 同期に失敗したあと、次に同期するまでの間隔の上限（秒）
+DEFAULT_MAX_BACKOFF: Final = 3600.0
+
+# この秒数同期していなければ待機中とみなし、メモリが不足していればキャッシュを破棄する
+DEFAULT_IDLE_AFTER: Final = 1800.0
+
+# 残しておくスナップショットパックの数のデフォルト。0でスナップショットを取らない。
+DEFAULT_SNAPSHOT_KEEP: Final = 10
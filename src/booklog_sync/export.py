@@ -0,0 +1,72 @@
+from pathlib import Path
+import csv
+import logging
+from typing import Iterable
+
+import yaml
+
+from booklog_sync.core import BOOKLOG_CSV_COLUMNS, DEFAULT_IGNORE_PATTERNS, iter_indexed_notes
+
+logger = logging.getLogger(__name__)
+
+
+def _to_csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        # Obsidianでリストに編集したtagsなどは、ブクログと同じカンマ区切りに戻す
+        return ",".join(_to_csv_value(item) for item in value)
+    return str(value)
+
+
+def _encodable_row(row: list[str], encoding: str, file_path: Path) -> list[str]:
+    """
+    encodingで表せない文字を '?' に置き換えた行を返す。置き換えた列は警告としてログに出力する。
+    """
+    try:
+        "".join(row).encode(encoding)
+        return row
+    except UnicodeEncodeError:
+        pass
+    encodable = []
+    for column, value in zip(BOOKLOG_CSV_COLUMNS, row):
+        try:
+            value.encode(encoding)
+        except UnicodeEncodeError:
+            logger.warning(
+                "Characters not representable in %s were replaced with '?': %s (%s)", encoding, file_path, column
+            )
+            value = value.encode(encoding, errors="replace").decode(encoding)
+        encodable.append(value)
+    return encodable
+
+
+def export_vault_to_csv(
+    books_path: Path,
+    output_path: Path,
+    encoding: str = "cp932",
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+) -> int:
+    """
+    Vault内のノートのフロントマターを、ブクログのCSVと同じ列順のCSVに書き出す。
+    ノートはフロントマターだけを1件ずつ読み込み、そのままCSVに書き出すため、Vault全体をメモリに保持しない。
+    encodingで表せない文字は '?' に置き換え、置き換えたノートと列を警告としてログに出力する。
+    戻り値: 書き出した行数。
+    """
+    exported = 0
+    with open(output_path, "w", encoding=encoding, newline="") as f:
+        writer = csv.writer(f)
+        for item_id, file_path, frontmatter in iter_indexed_notes(books_path, recursive, ignore):
+            try:
+                props = yaml.safe_load(frontmatter) or {}
+            except yaml.YAMLError:
+                logger.warning("Failed to parse frontmatter, skipping: %s", file_path)
+                continue
+            props["item_id"] = item_id
+            row = [_to_csv_value(props.get(column)) for column in BOOKLOG_CSV_COLUMNS]
+            writer.writerow(_encodable_row(row, encoding, file_path))
+            exported += 1
+
+    logger.info("Exported %d books to %s", exported, output_path)
+    return exported
@@ -0,0 +1,59 @@
+from pathlib import Path
+import heapq
+import itertools
+import pickle
+import tempfile
+from typing import Any, Callable, Final, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 1つのソート済みランに含める要素数のデフォルト
+DEFAULT_CHUNK_SIZE: Final = 50000
+
+
+def _write_run(items: list, run_path: Path):
+    # 要素ごとに独立したpickleとして書き出す。1つのPicklerで続けて書き出すと、
+    # 読み込み側のUnpicklerがすべての要素を参照し続け、メモリ使用量がランの大きさに比例して増える。
+    with open(run_path, "wb") as f:
+        for item in items:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(run_path: Path) -> Iterator:
+    with open(run_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def external_sort(
+    items: Iterable[T],
+    key: Callable[[T], Any],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    tmp_dir: Optional[Path] = None,
+) -> Iterator[T]:
+    """
+    itemsをkeyで安定ソートして順に返す。
+    chunk_size件ずつソートして一時ファイルに書き出し、最後にすべてのランを1回の順次マージで読み出すため、
+    メモリ上に保持するのはchunk_size件とラン数ぶんの要素だけになる。
+    要素がchunk_size件以下の場合は一時ファイルを作らない。
+    """
+    iterator = iter(items)
+    chunk = sorted(itertools.islice(iterator, chunk_size), key=key)
+    if len(chunk) < chunk_size:
+        yield from chunk
+        return
+
+    with tempfile.TemporaryDirectory(prefix="booklog-sync-", dir=tmp_dir) as tmp:
+        run_paths = []
+        while chunk:
+            run_path = Path(tmp) / f"run-{len(run_paths)}.pickle"
+            _write_run(chunk, run_path)
+            run_paths.append(run_path)
+            del chunk
+            chunk = sorted(itertools.islice(iterator, chunk_size), key=key)
+
+        # heapq.mergeは同じキーの要素を先に渡したイテレータから返すため、ランの順序で安定性が保たれる
+        yield from heapq.merge(*(_read_run(run_path) for run_path in run_paths), key=key)
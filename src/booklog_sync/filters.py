@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Final, Optional
+
+from booklog_sync.core import BooklogCSVRow
+
+# 絞り込みの名前。ログと SyncStats.filtered のキーに使う。
+FILTER_NAMES: Final = (
+    "since",
+    "registered_at",
+    "finished_at",
+    "status",
+    "category",
+    "service_id",
+)
+
+
+@dataclass(frozen=True)
+class RowFilter:
+    """
+    CSVの行の絞り込み条件。日付は "YYYY-MM-DD" 形式で、範囲の両端を含む。
+    sinceは登録日と読了日のどちらかがその日以降の行に絞り込む。
+    """
+
+    since: Optional[str] = None
+    registered_from: Optional[str] = None
+    registered_to: Optional[str] = None
+    finished_from: Optional[str] = None
+    finished_to: Optional[str] = None
+    statuses: tuple[str, ...] = ()
+    categories: tuple[str, ...] = ()
+    service_ids: tuple[str, ...] = ()
+
+    @property
+    def columns(self) -> set[str]:
+        """
+        絞り込みに必要なCSVの列。
+        """
+        columns = set()
+        if self.since:
+            columns |= {"registered_at", "finished_at"}
+        if self.registered_from or self.registered_to:
+            columns.add("registered_at")
+        if self.finished_from or self.finished_to:
+            columns.add("finished_at")
+        if self.statuses:
+            columns.add("status")
+        if self.categories:
+            columns.add("category")
+        if self.service_ids:
+            columns.add("service_id")
+        return columns
+
+    def __bool__(self) -> bool:
+        return bool(self.columns)
+
+
+def parse_filter_date(value: object, name: str) -> Optional[str]:
+    """
+    設定ファイルやコマンドラインで指定された日付を "YYYY-MM-DD" の文字列にそろえる。
+    YAMLでは日付が date として読み込まれるため、文字列と date の両方を受け付ける。
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ValueError(f"設定エラー: '{name}' は YYYY-MM-DD 形式の日付で指定してください。") from None
+
+
+def _in_range(value: Optional[str], start: Optional[str], end: Optional[str]) -> bool:
+    # ブクログの日時は "2020-01-01 10:00:00" 形式のため、日付部分を文字列のまま比べる
+    day = (value or "")[:10]
+    if not day:
+        return False
+    return (start is None or day >= start) and (end is None or day <= end)
+
+
+def compile_filter(row_filter: RowFilter) -> Callable[[BooklogCSVRow], Optional[str]]:
+    """
+    行が条件に合わない場合に、最初に合わなかった絞り込みの名前を返す関数を作る。条件に合う場合はNoneを返す。
+    """
+    checks: list[tuple[str, Callable[[BooklogCSVRow], bool]]] = []
+    if row_filter.since:
+        since = row_filter.since
+        checks.append(
+            (
+                "since",
+                lambda row: _in_range(row.get("registered_at"), since, None)
+                or _in_range(row.get("finished_at"), since, None),
+            )
+        )
+    if row_filter.registered_from or row_filter.registered_to:
+        start, end = row_filter.registered_from, row_filter.registered_to
+        checks.append(("registered_at", lambda row: _in_range(row.get("registered_at"), start, end)))
+    if row_filter.finished_from or row_filter.finished_to:
+        finished_start, finished_end = row_filter.finished_from, row_filter.finished_to
+        checks.append(
+            ("finished_at", lambda row: _in_range(row.get("finished_at"), finished_start, finished_end))
+        )
+    for name, column, values in (
+        ("status", "status", row_filter.statuses),
+        ("category", "category", row_filter.categories),
+        ("service_id", "service_id", row_filter.service_ids),
+    ):
+        if values:
+            allowed = frozenset(values)
+            checks.append((name, lambda row, column=column, allowed=allowed: row.get(column) in allowed))
+
+    def rejected_by(row: BooklogCSVRow) -> Optional[str]:
+        for name, check in checks:
+            if not check(row):
+                return name
+        return None
+
+    return rejected_by
@@ -0,0 +1,73 @@
+from pathlib import Path
+from operator import itemgetter
+import itertools
+from typing import Final, Iterable, Iterator, Optional
+
+from booklog_sync.core import DEFAULT_IGNORE_PATTERNS, BooklogCSVRow, iter_indexed_notes
+from booklog_sync.defaults import DEFAULT_SORT_MEMORY_MB, JOIN_MODES, JoinMode
+from booklog_sync.extsort import external_sort
+
+# CSVの1行（辞書）をメモリ上に保持するときのおおよそのバイト数。ソート済みランの大きさの見積もりに使う。
+ESTIMATED_ROW_BYTES: Final = 2048
+
+# ソート済みランの最小の要素数。小さすぎると一時ファイルの数が増えてマージが遅くなる。
+MIN_CHUNK_SIZE: Final = 1000
+
+
+def sort_chunk_size(memory_mb: int, sorts: int = 2) -> int:
+    """
+    同時に行うsorts個のソートがmemory_mb以内に収まるよう、1つのランに含める要素数を決める。
+    ランに満たない要素はマージの間メモリ上に残るため、ソートごとに1ランぶんのメモリを見込む。
+    sort_mergeでは、CSVごとのソートとノートのソートを同時に行う（CSVがK個ならK+1個）。
+    """
+    return max(MIN_CHUNK_SIZE, memory_mb * 1024 * 1024 // max(sorts, 1) // ESTIMATED_ROW_BYTES)
+
+
+def row_item_id(row: BooklogCSVRow) -> str:
+    return row.get("item_id") or ""
+
+
+def iter_sorted_notes(
+    books_path: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    chunk_size: int = MIN_CHUNK_SIZE,
+) -> Iterator[tuple[str, Path]]:
+    """
+    item_idを持つノートの (item_id, ファイルパス) をitem_idの昇順に返す。
+    """
+    notes = ((item_id, path) for item_id, path, _ in iter_indexed_notes(books_path, recursive, ignore))
+    return external_sort(notes, key=itemgetter(0), chunk_size=chunk_size)
+
+
+def sort_merge_join(
+    rows: Iterable[BooklogCSVRow],
+    notes: Iterable[tuple[str, Path]],
+    orphans: dict[str, Path],
+) -> Iterator[tuple[BooklogCSVRow, Optional[Path]]]:
+    """
+    item_idの昇順に並んだCSVの行とノートを1回の順次走査で突き合わせ、(行, 既存ノートのパス) を順に返す。
+    CSVに現れなかったノートはorphansに追加する。orphansはすべての行を返し終えた時点で確定する。
+    """
+    # 同じitem_idのノートが複数ある場合は、build_id_book_indexと同じく最後に見つかったものを使う
+    grouped = (
+        (item_id, list(group)[-1][1]) for item_id, group in itertools.groupby(notes, key=itemgetter(0))
+    )
+    note = next(grouped, None)
+    note_matched = False
+    for row in rows:
+        item_id = row_item_id(row)
+        while note is not None and note[0] < item_id:
+            if not note_matched:
+                orphans[note[0]] = note[1]
+            note = next(grouped, None)
+            note_matched = False
+        if note is not None and note[0] == item_id:
+            note_matched = True
+            yield row, note[1]
+        else:
+            yield row, None
+
+    if note is not None and not note_matched:
+        orphans[note[0]] = note[1]
+    orphans.update(grouped)
@@ -0,0 +1,318 @@
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Callable, Final, Optional
+
+from booklog_sync.core import default_state_path
+from booklog_sync.defaults import LOCK_MODES, LockMode
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME: Final = "sync.lock"
+
+# 監視モードのプロセスへの同期の依頼。監視モードのプロセスは受け取ると PROCESSING_FILENAME に名前を変える。
+HANDOFF_FILENAME: Final = "sync-request"
+PROCESSING_FILENAME: Final = "sync-request.processing"
+
+# ロックを持っている間、この間隔でロックファイルの更新日時を更新する（秒）
+HEARTBEAT_INTERVAL: Final = 30.0
+
+# 別のホストのプロセスのロックは、この秒数更新されていなければ古いとみなす
+STALE_LOCK_SECONDS: Final = 300.0
+
+# 作成直後で中身がまだ書き込まれていないロックファイルを待つ秒数
+_INCOMPLETE_LOCK_SECONDS: Final = 5.0
+
+# ロックの解放や依頼の完了を確認する間隔（秒）
+_POLL_INTERVAL: Final = 0.5
+
+
+class SyncLockError(RuntimeError):
+    """別のプロセスが同期中のため、ロックを取得できなかった。"""
+
+
+@dataclass(frozen=True)
+class LockOwner:
+    pid: int
+    host: str
+    command: str
+    started: float
+    # 同じpidが別のプロセスに再利用された場合を見分けるためのプロセスの開始時刻（Linuxのみ）
+    process_start: Optional[str] = None
+    # 監視モードのプロセスなど、同期の依頼を受け付けるプロセスの場合にTrue
+    handoff: bool = False
+    # 同期の設定のハッシュ。設定が同じ場合だけ監視モードのプロセスに同期を依頼する
+    options: Optional[str] = None
+
+
+def _process_start(pid: int) -> Optional[str]:
+    # /proc/<pid>/stat の22番目の値（起動からの経過時間）。プロセス名に空白が含まれても分割できるよう ) の後ろから数える。
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        import ctypes
+
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        # STILL_ACTIVE
+        return exit_code.value == 259
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_lock_owner(lock_file: Path) -> Optional[LockOwner]:
+    """
+    ロックファイルを読み込む。ファイルがない場合や、中身を読み取れない場合はNoneを返す。
+    """
+    try:
+        data = json.loads(lock_file.read_text(encoding="utf-8"))
+        return LockOwner(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def is_stale(owner: Optional[LockOwner], mtime: float) -> bool:
+    """
+    ロックを持っていたプロセスが終了しているかを判定する。
+    同じホストのプロセスはpid（とプロセスの開始時刻）で確かめ、別のホストのプロセスはロックファイルの更新日時で判断する。
+    """
+    if owner is None:
+        return time.time() - mtime > _INCOMPLETE_LOCK_SECONDS
+    if owner.host != socket.gethostname():
+        return time.time() - mtime > STALE_LOCK_SECONDS
+    if not _pid_alive(owner.pid):
+        return True
+    return owner.process_start is not None and _process_start(owner.pid) != owner.process_start
+
+
+class VaultLock:
+    """
+    books_pathごとのロックファイル。同期するプロセスが同時に1つだけになるようにする。
+
+    ロックファイルには持ち主のpid、ホスト名、コマンドを書き込み、持ち主がクラッシュして残ったロックは
+    is_staleで検出して取り除く。handoffがTrueのプロセス（監視モードと常駐モード）は、ほかのプロセスからの
+    同期の依頼をHandoffListenerで受け付ける。optionsには同期の設定のハッシュを渡し、監視モードのプロセスと
+    設定（CSVのパスや絞り込みなど）が異なる場合は、依頼すると指定した設定が無視されるため依頼せずに待つ。
+    """
+
+    def __init__(
+        self, books_path: Path, command: str = "sync", handoff: bool = False, options: Optional[str] = None
+    ):
+        state_path = default_state_path(books_path)
+        self.lock_file = state_path / LOCK_FILENAME
+        self.handoff_file = state_path / HANDOFF_FILENAME
+        self._processing_file = state_path / PROCESSING_FILENAME
+        self._owner = LockOwner(
+            pid=os.getpid(),
+            host=socket.gethostname(),
+            command=command,
+            started=time.time(),
+            process_start=_process_start(os.getpid()),
+            handoff=handoff,
+            options=options,
+        )
+        self._held = False
+        self._stopped = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _try_create(self) -> bool:
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(self._owner), f)
+        return True
+
+    def _remove_if_stale(self) -> Optional[LockOwner]:
+        """
+        ロックが古ければ取り除いてNoneを返す。有効なロックであればその持ち主を返す。
+        """
+        try:
+            mtime = self.lock_file.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        owner = read_lock_owner(self.lock_file)
+        if not is_stale(owner, mtime):
+            return owner
+        # 別のプロセスが先に取り除いて新しいロックを作っていないか、直前にもう一度確かめる
+        if read_lock_owner(self.lock_file) != owner:
+            return read_lock_owner(self.lock_file)
+        logger.warning("終了したプロセスのロックを取り除きます: %s (%s)", self.lock_file, owner)
+        self.lock_file.unlink(missing_ok=True)
+        return None
+
+    def acquire(
+        self, mode: LockMode = "wait", timeout: Optional[float] = None, wait_for_handoff: bool = True
+    ) -> bool:
+        """
+        ロックを取得してTrueを返す。modeが"handoff"で、監視モードのプロセスに同期を依頼して
+        その同期が終わった場合はFalseを返す（呼び出し側は同期しない）。
+        modeが"fail"の場合と、timeout秒待っても取得できなかった場合はSyncLockErrorを送出する。
+        wait_for_handoffがFalseの場合、監視モードのプロセスがロックを持っていれば待たずにSyncLockErrorを送出する。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        announced = False
+        while True:
+            if self._try_create():
+                self._held = True
+                self._start_heartbeat()
+                return True
+
+            owner = self._remove_if_stale()
+            if owner is None:
+                continue
+
+            if mode == "fail":
+                raise SyncLockError(
+                    f"別のプロセス（pid {owner.pid}、{owner.command}）が同期中です: {self.lock_file}"
+                )
+            if owner.handoff and not wait_for_handoff:
+                raise SyncLockError(
+                    f"監視モードのプロセス（pid {owner.pid}、{owner.command}）がロックを持っているため実行できません。"
+                    "監視モードを止めてから実行してください。"
+                )
+            if mode == "handoff" and owner.handoff:
+                if self._owner.handoff:
+                    raise SyncLockError(f"すでに監視モードのプロセス（pid {owner.pid}）が動いています。")
+                if owner.options == self._owner.options:
+                    if self._hand_off(owner, deadline):
+                        return False
+                    continue
+                if not announced:
+                    logger.info(
+                        "監視モードのプロセス（pid %d）と同期の設定が異なるため、依頼せずに終わるのを待ちます。", owner.pid
+                    )
+                    announced = True
+
+            if not announced:
+                logger.info("別のプロセス（pid %d、%s）の同期が終わるのを待っています。", owner.pid, owner.command)
+                announced = True
+            if deadline is not None and time.monotonic() >= deadline:
+                raise SyncLockError(f"別のプロセス（pid {owner.pid}）の同期が終わりませんでした: {self.lock_file}")
+            time.sleep(_POLL_INTERVAL)
+
+    def _hand_off(self, owner: LockOwner, deadline: Optional[float]) -> bool:
+        """
+        監視モードのプロセスに同期を依頼し、その同期が終わるのを待つ。
+        相手が途中で終了した場合はFalseを返す（呼び出し側がロックを取得し直して同期する）。
+        """
+        # 依頼した同期の設定を記録する（相手の設定と同じであることは依頼する前に確かめている）。
+        # 書き込み途中の依頼を受け付けられないよう、別の名前で書いてからリンクを作る。
+        request = self.handoff_file.with_name(f"{HANDOFF_FILENAME}.{os.getpid()}.tmp")
+        request.write_text(self._owner.options or "", encoding="utf-8")
+        try:
+            os.link(request, self.handoff_file)
+        except FileExistsError:
+            # 受け付けられていない依頼があれば、その依頼による同期が最新のCSVを読み込む
+            pass
+        finally:
+            request.unlink(missing_ok=True)
+        logger.info("監視モードのプロセス（pid %d）に同期を依頼しました。", owner.pid)
+
+        while self.handoff_file.exists() or self._processing_file.exists():
+            if self._remove_if_stale() is None:
+                logger.warning("監視モードのプロセス（pid %d）が終了したため、この同期を実行します。", owner.pid)
+                self.handoff_file.unlink(missing_ok=True)
+                self._processing_file.unlink(missing_ok=True)
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                raise SyncLockError(f"監視モードのプロセス（pid {owner.pid}）の同期が終わりませんでした。")
+            time.sleep(_POLL_INTERVAL)
+        logger.info("監視モードのプロセスが同期を完了しました。")
+        return True
+
+    def _start_heartbeat(self):
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="booklog-sync-lock", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                os.utime(self.lock_file)
+            except OSError:
+                logger.warning("ロックファイルを更新できませんでした: %s", self.lock_file)
+
+    def release(self):
+        if not self._held:
+            return
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        # 他のプロセスが（古いと誤って判断して）作り直したロックは消さない
+        if read_lock_owner(self.lock_file) == self._owner:
+            self.lock_file.unlink(missing_ok=True)
+        self._held = False
+
+    def __enter__(self) -> "VaultLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class HandoffListener(threading.Thread):
+    """
+    ほかのプロセスからの同期の依頼（VaultLock.handoff_file）をinterval秒ごとに確認し、on_requestを呼び出す。
+    on_requestが戻ったら依頼を完了として取り除く。
+    """
+
+    def __init__(self, handoff_file: Path, on_request: Callable[[], None], interval: float = _POLL_INTERVAL):
+        super().__init__(daemon=True, name="booklog-sync-handoff")
+        self._handoff_file = handoff_file
+        self._processing_file = handoff_file.with_name(PROCESSING_FILENAME)
+        self._on_request = on_request
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def poll(self) -> bool:
+        """
+        依頼があれば同期してTrueを返す。
+        """
+        try:
+            # 同期中に届いた依頼は次の同期で受け付けるよう、受け付けた依頼の名前を変えてから同期する
+            os.replace(self._handoff_file, self._processing_file)
+        except FileNotFoundError:
+            return False
+        logger.info("ほかのプロセスから同期の依頼を受け付けました。")
+        try:
+            self._on_request()
+        finally:
+            self._processing_file.unlink(missing_ok=True)
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("同期の依頼の処理中にエラーが発生しました。")
+
+    def stop(self):
+        self._stopped.set()
@@ -1,55 +1,84 @@
-from pathlib import Path
-import csv
-import logging
 import sys
 
-from booklog_sync.config import load_config
-from booklog_sync.core import (
-    BOOKLOG_CSV_COLUMNS,
-    Book,
-    SyncResult,
-    convert_csv,
-    save_book_to_markdown,
-    build_id_book_index,
-)
+# 起動を速くするため、このモジュールでは重い依存をトップレベルでimportしない。
+# 各サブコマンドが必要とするモジュールは、実行時に関数内でimportする。
 
-logger = logging.getLogger(__name__)
 
+def __getattr__(name: str):
+    # 後方互換のため、booklog_sync.main.run_sync を遅延して提供する
+    if name == "run_sync":
+        from booklog_sync.sync import run_sync
 
-def run_sync(csv_path: Path, books_path: Path):
+        return run_sync
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _apply_filter_arguments(config, args):
     """
-    CSVファイルのパスを受け取り、ファイルを作成または更新する。
+    コマンドラインで指定された絞り込みで、設定ファイルの filters を上書きする。
     """
-    id_book_index = build_id_book_index(books_path)
-    logger.debug("id_book_index: %s", id_book_index)
+    from dataclasses import replace
 
-    created = 0
-    updated = 0
-    unchanged = 0
+    from booklog_sync.filters import parse_filter_date
 
-    with open(csv_path, "r", encoding="cp932") as f:
-        reader = csv.DictReader(f, fieldnames=BOOKLOG_CSV_COLUMNS)
-        for row in reader:
-            book: Book = convert_csv(row)
+    overrides = {}
+    for name in ["since", "registered_from", "registered_to", "finished_from", "finished_to"]:
+        value = getattr(args, name, None)
+        if value:
+            overrides[name] = parse_filter_date(value, "--" + name.replace("_", "-"))
+    for name, attribute in [("status", "statuses"), ("category", "categories"), ("service_id", "service_ids")]:
+        values = getattr(args, name, None)
+        if values:
+            overrides[attribute] = tuple(values)
+    if not overrides:
+        return config
+    return replace(config, row_filter=replace(config.row_filter, **overrides))
 
-            item_id = row.get("item_id")
-            existing_file = id_book_index.get(item_id)
 
-            if existing_file:
-                result = save_book_to_markdown(
-                    books_path, book, existing_file=existing_file
-                )
-            else:
-                result = save_book_to_markdown(books_path, book)
+def _handoff_digest(config) -> str:
+    """
+    監視モードのプロセスに同期を依頼できるかを判定するための、同期の設定（CSVとVaultのパスを含む）のハッシュ。
+    """
+    from pathlib import Path
+
+    from booklog_sync.resume import options_digest
 
-            if result == "created":
-                created += 1
-            elif result == "updated":
-                updated += 1
-            elif result == "unchanged":
-                unchanged += 1
+    # 相対パスは作業ディレクトリによって指す先が変わるため、絶対パスにして比べる
+    def resolve(value):
+        if isinstance(value, Path):
+            return value.resolve()
+        if isinstance(value, tuple):
+            return tuple(resolve(item) for item in value)
+        return value
+
+    options = {name: resolve(value) for name, value in config.sync_options().items()}
+    # 変換の関数のreprはプロセスごとに変わるため、名前と設定、関数を定義したファイルの内容で比べる
+    options["transforms"] = tuple(
+        (stage.name, stage.columns, stage.options, stage.source_digest) for stage in config.transforms
+    )
+    options["csv_path"] = resolve(config.csv_path)
+    options["books_path"] = resolve(config.books_path)
+    return options_digest(options)
 
-    logger.info("Sync completed: %d created, %d updated, %d unchanged", created, updated, unchanged)
+
+def _rollback(config, args, lock):
+    from booklog_sync.core import default_state_path
+    from booklog_sync.snapshots import SNAPSHOT_DIRNAME, list_snapshots, read_snapshot, rollback, snapshot_run_id
+
+    if args.list:
+        state_path = config.state_path or default_state_path(config.books_path)
+        for pack_path in list_snapshots(state_path / SNAPSHOT_DIRNAME):
+            info, records = read_snapshot(pack_path)
+            print(f"{snapshot_run_id(pack_path)}  {info['started']}  {sum(1 for _ in records)} changes")
+        return
+
+    # 同期と同時に実行しないよう、ロックを取ってから戻す。監視モードに依頼はできず、監視モードは終了するまで
+    # ロックを持ち続けるため、監視モードがロックを持っている場合は待たずにエラーにする。
+    lock.acquire("fail" if config.lock_mode == "fail" else "wait", config.lock_timeout, wait_for_handoff=False)
+    try:
+        rollback(config.books_path, config.state_path, args.run, args.force)
+    finally:
+        lock.release()
 
 
 def main():
@@ -70,11 +99,110 @@ def main():
 
     subparsers = parser.add_subparsers(dest="command")
 
-    subparsers.add_parser("sync", parents=[config_parser], help="CSVファイルを読み込み同期を実行する")
+    filter_parser = argparse.ArgumentParser(add_help=False)
+    filter_group = filter_parser.add_argument_group("絞り込み（設定ファイルの filters を上書きする）")
+    filter_group.add_argument("--since", help="登録日か読了日がこの日（YYYY-MM-DD）以降の書籍だけを同期する")
+    filter_group.add_argument("--registered-from", help="登録日がこの日以降の書籍だけを同期する")
+    filter_group.add_argument("--registered-to", help="登録日がこの日以前の書籍だけを同期する")
+    filter_group.add_argument("--finished-from", help="読了日がこの日以降の書籍だけを同期する")
+    filter_group.add_argument("--finished-to", help="読了日がこの日以前の書籍だけを同期する")
+    filter_group.add_argument("--status", action="append", help="読書状況（複数指定可）")
+    filter_group.add_argument("--category", action="append", help="カテゴリ（複数指定可）")
+    filter_group.add_argument("--service-id", action="append", help="サービスID（複数指定可）")
 
-    subparsers.add_parser("watch", parents=[config_parser], help="CSVファイルを監視し、変更時に自動同期する")
+    lock_parser = argparse.ArgumentParser(add_help=False)
+    lock_parser.add_argument(
+        "--lock",
+        choices=["wait", "fail", "handoff"],
+        help="同じVaultを別のプロセスが同期中の場合に、待つ（wait）、すぐに終了する（fail）、"
+        "監視モードのプロセスに同期を依頼する（handoff）。設定ファイルの lock を上書きする",
+    )
+    lock_parser.add_argument("--lock-timeout", type=float, help="別のプロセスを待つ秒数の上限")
+
+    profile_parser = argparse.ArgumentParser(add_help=False)
+    profile_group = profile_parser.add_argument_group("CPUプロファイル")
+    profile_group.add_argument(
+        "--profile-cpu",
+        metavar="DIR",
+        help="同期ごとのCPUプロファイル（.pstats と flamegraph 向けの .collapsed）をDIRに書き出す",
+    )
+    profile_group.add_argument(
+        "--profile-interval",
+        type=float,
+        metavar="SECONDS",
+        help="cProfileの代わりに、この間隔で呼び出し履歴をサンプリングする（オーバーヘッドが小さい。例: 0.01）",
+    )
+
+    subparsers.add_parser(
+        "sync",
+        parents=[config_parser, filter_parser, lock_parser, profile_parser],
+        help="CSVファイルを読み込み同期を実行する",
+    )
+
+    subparsers.add_parser(
+        "watch",
+        parents=[config_parser, filter_parser, lock_parser, profile_parser],
+        help="CSVファイルを監視し、変更時に自動同期する",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        parents=[config_parser, filter_parser, lock_parser, profile_parser],
+        help="常駐して、CSVファイルの変更時と一定間隔ごとに同期する（変更がなければ同期を省略する）",
+    )
+    serve_parser.add_argument(
+        "--interval",
+        type=float,
+        metavar="SECONDS",
+        help="定期的に同期する間隔（秒）。設定ファイルの serve_interval を上書きする",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", parents=[config_parser], help="Vaultのフロントマターをブクログ形式のCSVに書き出す"
+    )
+    export_parser.add_argument("--output", required=True, help="書き出すCSVファイルのパス")
+    export_parser.add_argument(
+        "--encoding",
+        choices=["cp932", "utf-8"],
+        default="cp932",
+        help="CSVの文字コード (デフォルト: cp932)",
+    )
+
+    rollback_parser = subparsers.add_parser(
+        "rollback", parents=[config_parser], help="同期で変更したノートを、スナップショットから同期の前の状態に戻す"
+    )
+    rollback_parser.add_argument("run", nargs="?", help="元に戻す同期のID（省略時は最後の同期）")
+    rollback_parser.add_argument("--list", action="store_true", help="元に戻せる同期の一覧を表示する")
+    rollback_parser.add_argument(
+        "--force", action="store_true", help="同期のあとに編集されたノートも上書きして元に戻す"
+    )
+
+    check_parser = subparsers.add_parser(
+        "check", parents=[config_parser], help="Vaultのノートの問題（item_idの重複、フロントマターの誤りなど）を調べる"
+    )
+    check_parser.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="出力形式。json は1行に1件のJSON Lines (デフォルト: text)",
+    )
+    check_parser.add_argument(
+        "--kind",
+        action="append",
+        choices=["duplicate_item_id", "unparsable_frontmatter", "filename_drift", "name_too_long"],
+        help="調べる問題の種類（複数指定可。デフォルト: すべて）",
+    )
 
     args = parser.parse_args()
+    if getattr(args, "profile_interval", None) is not None:
+        if not args.profile_cpu:
+            parser.error("--profile-interval には --profile-cpu も指定してください")
+        if args.profile_interval <= 0:
+            parser.error("--profile-interval は正の数で指定してください")
+    if getattr(args, "interval", None) is not None and args.interval <= 0:
+        parser.error("--interval は正の数で指定してください")
+
+    import logging
 
     logging.basicConfig(
         level=logging.DEBUG if args.debug else logging.INFO,
@@ -82,17 +210,111 @@ def main():
     )
 
     try:
+        from booklog_sync.config import load_config
+
         config = load_config(args.config)
 
-        if args.command == "watch":
-            from booklog_sync.watcher import start_watching
+        if args.command == "export":
+            from pathlib import Path
+
+            from booklog_sync.export import export_vault_to_csv
+
+            export_vault_to_csv(
+                config.books_path,
+                Path(args.output),
+                args.encoding,
+                recursive=config.recursive,
+                ignore=config.ignore,
+            )
+            return
+
+        if args.command == "check":
+            from booklog_sync.check import CHECK_KINDS, check_vault
+            from booklog_sync.join import sort_chunk_size
+
+            stats = check_vault(
+                config.books_path,
+                lambda issue: print(issue.to_json() if args.format == "json" else issue, flush=True),
+                recursive=config.recursive,
+                ignore=config.ignore,
+                chunk_size=sort_chunk_size(config.sort_memory_mb, sorts=1),
+                kinds=args.kind or CHECK_KINDS,
+            )
+            # 問題が見つかった場合は、スクリプトから判定できるよう終了コード1で終了する
+            if stats.total:
+                sys.exit(1)
+            return
 
-            # 初回同期
-            run_sync(config.csv_path, config.books_path)
-            start_watching(config.csv_path, config.books_path)
-        else:
-            # デフォルト: sync
-            run_sync(config.csv_path, config.books_path)
+        from booklog_sync.lock import VaultLock
+
+        if args.command == "rollback":
+            _rollback(config, args, VaultLock(config.books_path, "rollback"))
+            return
+
+        from booklog_sync.sync import run_sync
+
+        config = _apply_filter_arguments(config, args)
+        sync_options = config.sync_options()
+
+        if args.command == "watch" and args.profile_cpu and config.watch_restart_on_change:
+            parser.error("--profile-cpu は watch_restart_on_change と同時に指定できません")
+
+        profiler = None
+        sync = run_sync
+        if args.profile_cpu:
+            from pathlib import Path
+
+            from booklog_sync.profiling import CPUProfiler
+
+            profiler = CPUProfiler(Path(args.profile_cpu), args.profile_interval, args.command)
+            sync = profiler.wrap(run_sync)
+
+        # 同じVaultを同期するプロセスが同時に1つだけになるようにする。監視モードと常駐モードは終了するまでロックを持つ。
+        lock = VaultLock(
+            config.books_path,
+            args.command,
+            handoff=args.command in ("watch", "serve"),
+            options=_handoff_digest(config),
+        )
+        lock_timeout = args.lock_timeout if args.lock_timeout is not None else config.lock_timeout
+        if not lock.acquire(args.lock or config.lock_mode, lock_timeout):
+            return
+        try:
+            if args.command == "watch":
+                from booklog_sync.watcher import start_watching
+
+                # 初回同期
+                sync(config.csv_path, config.books_path, **sync_options)
+                start_watching(
+                    config.csv_path,
+                    config.books_path,
+                    **config.watch_options(),
+                    handoff_file=lock.handoff_file,
+                    profiler=profiler,
+                    restart_on_change=config.watch_restart_on_change,
+                    **sync_options,
+                )
+            elif args.command == "serve":
+                from booklog_sync.watcher import start_serving
+
+                serve_options = config.serve_options()
+                if args.interval is not None:
+                    serve_options["interval"] = args.interval
+                # 初回同期はstart_servingの中で行い、失敗しても終了せずに再試行する
+                start_serving(
+                    config.csv_path,
+                    config.books_path,
+                    **serve_options,
+                    **config.watch_options(),
+                    handoff_file=lock.handoff_file,
+                    profiler=profiler,
+                    **sync_options,
+                )
+            else:
+                # デフォルト: sync
+                sync(config.csv_path, config.books_path, **sync_options)
+        finally:
+            lock.release()
     except Exception as e:
         print(f"エラーが発生しました: {e}")
         sys.exit(1)
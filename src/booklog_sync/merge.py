@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from pathlib import Path
+import heapq
+import itertools
+import logging
+from typing import Final, Iterator, Optional, Sequence
+
+from booklog_sync.core import BooklogCSVRow, read_booklog_csv
+from booklog_sync.defaults import MERGE_POLICIES, MergePolicy
+from booklog_sync.extsort import DEFAULT_CHUNK_SIZE, external_sort
+
+logger = logging.getLogger(__name__)
+
+# 採用する行を決めるために必要な列
+POLICY_COLUMNS: Final = {
+    "first": (),
+    "latest_finished": ("finished_at",),
+    "highest_rating": ("rating",),
+}
+
+
+@dataclass
+class MergeReport:
+    sources: int = 0
+    rows: int = 0
+    duplicates: int = 0
+    conflicts: int = 0
+
+
+def _preference(row: BooklogCSVRow, policy: MergePolicy) -> tuple:
+    # 値が大きいほど優先する。同点の場合は先に指定したCSVを優先する（maxは最初の最大値を返す）。
+    if policy == "latest_finished":
+        return (row.get("finished_at") or "",)
+    if policy == "highest_rating":
+        rating = row.get("rating") or ""
+        return (int(rating) if rating.isdigit() else -1,)
+    return ()
+
+
+def merge_booklog_csvs(
+    csv_paths: Sequence[Path],
+    columns: Sequence[str],
+    policy: MergePolicy = "first",
+    report: Optional[MergeReport] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[BooklogCSVRow]:
+    """
+    複数のブクログCSVをitem_idで突き合わせ、item_idの昇順に1行ずつ返す。
+    同じitem_idの行が複数ある場合はpolicyに従って1行を選び、値が食い違う場合は競合として報告する。
+    各CSVは外部ソートしてから順次マージするため、CSVの数や大きさに関わらずメモリ使用量は一定に収まる。
+    """
+    if report is None:
+        report = MergeReport()
+    report.sources = len(csv_paths)
+    columns = tuple({*columns, "item_id", *POLICY_COLUMNS[policy]})
+
+    def sorted_source(source_index: int, csv_path: Path) -> Iterator[tuple[str, int, BooklogCSVRow]]:
+        rows = ((row.get("item_id") or "", source_index, row) for row in read_booklog_csv(csv_path, columns))
+        return external_sort(rows, key=lambda entry: entry[0], chunk_size=chunk_size)
+
+    merged = heapq.merge(
+        *(sorted_source(i, csv_path) for i, csv_path in enumerate(csv_paths)),
+        key=lambda entry: (entry[0], entry[1]),
+    )
+    for item_id, entries in itertools.groupby(merged, key=lambda entry: entry[0]):
+        candidates = [(source_index, row) for _, source_index, row in entries]
+        report.rows += 1
+        if len(candidates) == 1:
+            yield candidates[0][1]
+            continue
+
+        report.duplicates += 1
+        source_index, chosen = max(candidates, key=lambda candidate: _preference(candidate[1], policy))
+        if any(row != chosen for _, row in candidates):
+            report.conflicts += 1
+            logger.warning(
+                "Conflicting rows for item_id %s across %d CSV files: using %s (%s)",
+                item_id,
+                len(candidates),
+                csv_paths[source_index],
+                policy,
+            )
+        yield chosen
+
+    logger.info(
+        "Merged %d CSV files: %d books, %d duplicates, %d conflicts",
+        report.sources,
+        report.rows,
+        report.duplicates,
+        report.conflicts,
+    )
@@ -0,0 +1,124 @@
+from pathlib import Path
+import logging
+import os
+import re
+from typing import Callable, Final, Iterable, Optional
+
+import yaml
+
+from booklog_sync.core import write_text_atomic
+from booklog_sync.defaults import ORPHAN_ACTIONS, OrphanAction
+
+logger = logging.getLogger(__name__)
+
+# ブクログから削除された書籍のノートに付けるタグ
+ORPHAN_TAG: Final = "booklog/deleted"
+
+
+def find_orphans(id_book_index: dict[str, Path], seen_item_ids: set[str]) -> dict[str, Path]:
+    """
+    Vaultのインデックスにあり、CSVには現れなかったitem_idとそのファイルパスを返す。
+    """
+    return {
+        item_id: id_book_index[item_id]
+        for item_id in id_book_index.keys() - seen_item_ids
+    }
+
+
+def tag_orphans(
+    paths: Iterable[Path],
+    writer: Optional[Callable[[Path, str, str], None]] = None,
+    write_file: Callable[[Path, str], None] = write_text_atomic,
+) -> int:
+    """
+    孤立したノートのフロントマターのtagsにORPHAN_TAGを追加する。
+    writerを指定すると、ファイルへの書き込みを writer(パス, 内容, "tagged") の呼び出しに委ねる。
+    指定しない場合はwrite_fileで書き込む。
+    戻り値: タグを追加したファイル数。
+    """
+    tagged = 0
+    for path in paths:
+        content = path.read_text(encoding="utf-8")
+        parts = re.split(r"^---$", content, maxsplit=2, flags=re.MULTILINE)
+        if len(parts) < 3:
+            logger.warning("Frontmatter not found, skipping tag: %s", path)
+            continue
+        try:
+            props = yaml.safe_load(parts[1]) or {}
+        except yaml.YAMLError:
+            logger.warning("Failed to parse frontmatter, skipping tag: %s", path)
+            continue
+
+        tags = props.get("tags")
+        if isinstance(tags, str) and tags.strip():
+            # ブクログのCSVのタグと同じカンマ区切りの文字列は、文字列のまま末尾に追加する
+            if ORPHAN_TAG in (tag.strip() for tag in tags.split(",")):
+                continue
+            props["tags"] = f"{tags},{ORPHAN_TAG}"
+        else:
+            if tags is None or tags == "":
+                tags = []
+            elif not isinstance(tags, list):
+                tags = [tags]
+            if ORPHAN_TAG in tags:
+                continue
+            props["tags"] = [*tags, ORPHAN_TAG]
+        content = f"---\n{yaml.dump(props, allow_unicode=True, sort_keys=False)}---{parts[2]}"
+        if writer:
+            writer(path, content, "tagged")
+        else:
+            write_file(path, content)
+        tagged += 1
+    return tagged
+
+
+def archive_orphans(
+    paths: Iterable[Path], archive_path: Path, move: Callable[[Path, Path], None] = os.replace
+) -> int:
+    """
+    孤立したノートをmoveでarchive_pathに移動する。移動先に同名ファイルがある場合はスキップする。
+    戻り値: 移動したファイル数。
+    """
+    archive_path.mkdir(parents=True, exist_ok=True)
+    moved = 0
+    for path in paths:
+        if path.parent.resolve() == archive_path.resolve():
+            # Vaultを再帰的に走査した場合、アーカイブ済みのノートも孤立ノートとして見つかる
+            continue
+        destination = archive_path / path.name
+        if destination.exists():
+            logger.warning("Archive destination already exists, skipping: %s", destination)
+            continue
+        move(path, destination)
+        moved += 1
+    return moved
+
+
+def handle_orphans(
+    orphans: dict[str, Path],
+    action: OrphanAction = "report",
+    archive_path: Path | None = None,
+    writer: Optional[Callable[[Path, str, str], None]] = None,
+    write_file: Callable[[Path, str], None] = write_text_atomic,
+    move: Callable[[Path, Path], None] = os.replace,
+):
+    """
+    孤立したノートを報告し、actionに応じてタグ付けまたはアーカイブを一括で行う。
+    writerとwrite_fileはtag_orphans、moveはarchive_orphansに渡す。
+    """
+    if not orphans:
+        return
+
+    for item_id, path in sorted(orphans.items()):
+        logger.info("Orphan: %s (item_id: %s)", path, item_id)
+
+    if action == "tag":
+        tagged = tag_orphans(orphans.values(), writer, write_file)
+        logger.info("Orphans: %d found, %d tagged", len(orphans), tagged)
+    elif action == "archive":
+        if archive_path is None:
+            raise ValueError("archive_path is required to archive orphans")
+        moved = archive_orphans(orphans.values(), archive_path, move)
+        logger.info("Orphans: %d found, %d archived to %s", len(orphans), moved, archive_path)
+    else:
+        logger.info("Orphans: %d found", len(orphans))
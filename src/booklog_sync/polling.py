@@ -0,0 +1,149 @@
+from pathlib import Path
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Callable, Final, Optional, Sequence
+
+from booklog_sync.defaults import DEFAULT_POLL_INTERVAL, WATCH_BACKENDS, WatchBackend
+
+logger = logging.getLogger(__name__)
+
+# ファイル変更通知が届かないことがあるファイルシステム（/proc/mounts の種類名）。
+# このほか、sshfsやrcloneなどFUSEのファイルシステム（"fuse." で始まるもの）も対象とする。
+# 9pとdrvfsはWSLからWindowsのドライブを参照する場合に使われる。
+NETWORK_FILESYSTEMS: Final = frozenset(
+    {"nfs", "nfs4", "cifs", "smb3", "smbfs", "afpfs", "ncpfs", "9p", "drvfs", "davfs"}
+)
+
+# 内容のハッシュを計算するときに1回に読み込むバイト数
+_HASH_CHUNK_SIZE: Final = 1 << 20
+
+# Windowsの GetDriveTypeW が返すネットワークドライブの値
+_DRIVE_REMOTE: Final = 4
+
+
+def _linux_filesystem_type(path: Path) -> Optional[str]:
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[:3] for line in f]
+    except OSError:
+        return None
+
+    best_mount = ""
+    best_type = None
+    target = str(path)
+    for _, mount_point, fs_type in mounts:
+        # マウントポイントの空白などは \040 のような8進数でエスケープされている
+        mount_point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), mount_point)
+        prefix = mount_point.rstrip("/") + "/"
+        if (target == mount_point or target.startswith(prefix)) and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    return best_type
+
+
+def is_network_path(path: Path) -> bool:
+    """
+    pathがネットワークドライブなど、ファイル変更通知が届かないことがある場所にあるかを判定する。
+    判定できない場合はFalseを返す。
+    """
+    path = path.resolve()
+    if sys.platform == "win32":
+        if str(path).startswith("\\\\"):
+            return True
+        import ctypes
+
+        return ctypes.windll.kernel32.GetDriveTypeW(path.anchor) == _DRIVE_REMOTE
+    if sys.platform.startswith("linux"):
+        fs_type = _linux_filesystem_type(path)
+        return fs_type is not None and (fs_type in NETWORK_FILESYSTEMS or fs_type.startswith("fuse."))
+    return False
+
+
+def file_digest(path: Path) -> Optional[str]:
+    """
+    ファイルの内容を少しずつ読み込んでハッシュを計算する。ファイルがない場合はNoneを返す。
+    """
+    digest = hashlib.blake2b()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(_HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def _stat_key(path: Path) -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class CSVPoller(threading.Thread):
+    """
+    CSVファイル（複数可）のstatを一定間隔で確認し、内容が変わったときだけon_changeを呼び出す。
+    ネットワークドライブなど、ファイル変更通知が届かない環境で使う。
+    statが変わっても、次の確認で変わっていなければ書き込みが終わったとみなし、
+    内容のハッシュが前回の同期時と同じであれば同期を省略する。
+    """
+
+    def __init__(
+        self,
+        csv_paths: Sequence[Path],
+        on_change: Callable[[], None],
+        interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        super().__init__(daemon=True)
+        self._csv_paths = tuple(csv_paths)
+        self._on_change = on_change
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._stats = {path: _stat_key(path) for path in self._csv_paths}
+        self._digests = {path: file_digest(path) for path in self._csv_paths}
+        self._pending: set[Path] = set()
+
+    def poll(self) -> bool:
+        """
+        1回分の確認を行う。同期を実行した場合にTrueを返す。
+        """
+        still_changing = False
+        for path in self._csv_paths:
+            key = _stat_key(path)
+            if key != self._stats[path]:
+                self._stats[path] = key
+                self._pending.add(path)
+                still_changing = True
+
+        # 書き込み途中の可能性があるため、statが1周期変わらなくなるまで待つ
+        if still_changing or not self._pending:
+            return False
+
+        modified = False
+        for path in self._pending:
+            digest = file_digest(path)
+            if digest is not None and digest != self._digests[path]:
+                modified = True
+            self._digests[path] = digest
+        self._pending.clear()
+
+        if not modified:
+            logger.info("CSVファイルの更新日時が変わりましたが、内容が同じため同期を省略します。")
+            return False
+
+        self._on_change()
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("CSVファイルの確認中にエラーが発生しました。")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,217 @@
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+from typing import Callable, Final, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# pstatsの関数のキー: (ファイル名, 行番号, 関数名)
+FunctionKey = tuple[str, int, str]
+
+# 呼び出しグラフから積み上げた呼び出し履歴を、この深さで打ち切る
+_MAX_STACK_DEPTH: Final = 128
+
+# 呼び出し履歴を出力する最小の時間（マイクロ秒）。これより短い経路は省く。
+_MIN_STACK_MICROSECONDS: Final = 1
+
+
+def frame_label(key: FunctionKey) -> str:
+    """
+    collapsed stack形式の1フレームの表記。区切り文字の ; は含めない。
+    """
+    filename, line, name = key
+    if filename == "~":
+        # 組み込み関数
+        return name.replace(";", ",")
+    return f"{name} ({Path(filename).name}:{line})".replace(";", ",")
+
+
+def collapse_pstats(stats: dict) -> Counter[str]:
+    """
+    pstatsの呼び出しグラフから、collapsed stack形式の {呼び出し履歴: マイクロ秒} を作る。
+    cProfileは呼び出し元と呼び出し先の組ごとにしか時間を記録しないため、関数の時間を
+    呼び出し元ごとの時間の比で各経路に割り振る（flameprofなどと同じ近似）。再帰呼び出しは1段で打ち切る。
+    """
+    callees: dict[FunctionKey, list[tuple[FunctionKey, float]]] = {}
+    for callee, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((callee, edge[3]))
+
+    stacks: Counter[str] = Counter()
+
+    def visit(path: list[FunctionKey], labels: list[str], seconds: float):
+        function = path[-1]
+        _, _, self_seconds, cumulative, _ = stats[function]
+        share = seconds / cumulative if cumulative > 0 else 0.0
+        own = round(self_seconds * share * 1_000_000)
+        if own >= _MIN_STACK_MICROSECONDS:
+            stacks[";".join(labels)] += own
+        if len(path) >= _MAX_STACK_DEPTH:
+            return
+        for callee, edge_seconds in callees.get(function, ()):
+            if callee in path or callee not in stats:
+                continue
+            callee_seconds = edge_seconds * share
+            if callee_seconds * 1_000_000 >= _MIN_STACK_MICROSECONDS:
+                visit([*path, callee], [*labels, frame_label(callee)], callee_seconds)
+
+    for function, (_, _, _, cumulative, callers) in stats.items():
+        # 呼び出し元のない組み込み関数は、計測を止めるcProfile自身の呼び出し
+        if not callers and function[0] != "~":
+            visit([function], [frame_label(function)], cumulative)
+    return stacks
+
+
+class _Samples:
+    """
+    サンプリングで集めた呼び出し履歴。pstats.Statsに渡すと、サンプル数×間隔を時間とした統計になる。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[tuple[FunctionKey, ...]] = Counter()
+        self.stats: dict = {}
+
+    def create_stats(self):
+        self_counts: Counter[FunctionKey] = Counter()
+        total_counts: Counter[FunctionKey] = Counter()
+        edge_counts: Counter[tuple[FunctionKey, FunctionKey]] = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            for function in set(stack):
+                total_counts[function] += count
+            for edge in set(zip(stack, stack[1:])):
+                edge_counts[edge] += count
+
+        callers: dict[FunctionKey, dict] = {function: {} for function in total_counts}
+        for (caller, callee), count in edge_counts.items():
+            callers[callee][caller] = (count, count, 0.0, count * self.interval)
+        self.stats = {
+            function: (
+                count,
+                count,
+                self_counts[function] * self.interval,
+                count * self.interval,
+                callers[function],
+            )
+            for function, count in total_counts.items()
+        }
+
+
+class _Sampler(threading.Thread):
+    """
+    interval秒ごとに対象のスレッドの呼び出し履歴を記録する。
+    """
+
+    def __init__(self, thread_id: int, samples: _Samples, skip: int = 0):
+        super().__init__(daemon=True, name="booklog-sync-profiler")
+        self._thread_id = thread_id
+        self._samples = samples
+        # 計測を始めた関数より外側（呼び出し元）のフレーム数。どのサンプルでも同じため記録しない。
+        self._skip = skip
+        self._stopped = threading.Event()
+
+    def run(self):
+        samples = self._samples
+        while not self._stopped.wait(samples.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_qualname))
+                frame = frame.f_back
+            if self._stopped.is_set():
+                # 計測を終えたあとの呼び出し履歴は記録しない
+                break
+            stack = stack[: len(stack) - self._skip]
+            if stack:
+                samples.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class CPUProfiler:
+    """
+    同期1回ごとのCPUプロファイルを、output_pathに .pstats と .collapsed（flamegraph.plやspeedscope向けの
+    collapsed stack形式）で書き出す。
+
+    intervalを指定しない場合はcProfileで全ての関数呼び出しを計測する。intervalを指定すると、
+    interval秒ごとに同期のスレッドの呼び出し履歴を記録するサンプリングで計測する。
+    サンプリングのオーバーヘッドは間隔あたりの呼び出し履歴の深さ分だけのため、常時有効にしておける。
+    """
+
+    def __init__(self, output_path: Path, interval: Optional[float] = None, label: str = "sync"):
+        self.output_path = output_path
+        self.interval = interval
+        self._label = label
+
+    def _output_stem(self) -> Path:
+        # 監視モードの同期ごとにファイルを分ける
+        stem = f"{self._label}-{datetime.now():%Y%m%d-%H%M%S-%f}"
+        return self.output_path / stem
+
+    def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        funcを計測しながら呼び出し、終了後（例外の場合も）にプロファイルを書き出す。
+        """
+        started = time.perf_counter()
+        if self.interval is None:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                profiler.create_stats()
+                self._write(profiler, time.perf_counter() - started)
+
+        samples = _Samples(self.interval)
+        depth = 0
+        frame = sys._getframe()
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        sampler = _Sampler(threading.get_ident(), samples, skip=depth)
+        sampler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.stop()
+            self._write(samples, time.perf_counter() - started)
+
+    def wrap(self, func: Callable[..., T]) -> Callable[..., T]:
+        """
+        呼び出すたびにrunで計測する関数を返す。
+        """
+
+        def profiled(*args, **kwargs) -> T:
+            return self.run(func, *args, **kwargs)
+
+        return profiled
+
+    def _write(self, profile: cProfile.Profile | _Samples, elapsed: float):
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        stem = self._output_stem()
+        stats = pstats.Stats(profile)
+        stats.dump_stats(stem.with_suffix(".pstats"))
+
+        if isinstance(profile, _Samples):
+            # サンプリングでは呼び出し履歴をそのまま出力する（値はサンプル数）
+            stacks: Counter[str] = Counter()
+            for stack, count in profile.stacks.items():
+                stacks[";".join(map(frame_label, stack))] += count
+        else:
+            stacks = collapse_pstats(stats.stats)
+        with open(stem.with_suffix(".collapsed"), "w", encoding="utf-8") as f:
+            for stack, value in sorted(stacks.items()):
+                f.write(f"{stack} {value}\n")
+
+        logger.info("CPU profile (%.1fs) written to %s.{pstats,collapsed}", elapsed, stem)
@@ -0,0 +1,176 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Final, Optional, Sequence
+
+from booklog_sync.defaults import DEFAULT_CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME: Final = "sync-journal.jsonl"
+
+
+def options_digest(options: dict) -> str:
+    """
+    同期の結果に影響する設定のハッシュ。値はreprで比較するため、実行ごとにreprが変わらない値を渡す。
+    """
+    return hashlib.blake2b(repr(sorted(options.items())).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def source_signature(csv_paths: Path | Sequence[Path], options: Optional[dict] = None) -> list[dict]:
+    """
+    CSVファイルの同一性を判定するための情報を返す。optionsを渡すと、その設定のハッシュも含める。
+    CSVが差し替えられていたり、設定が変わっていたりすれば、古いジャーナルからは再開しない。
+    """
+    if isinstance(csv_paths, Path):
+        csv_paths = [csv_paths]
+    signature = []
+    for csv_path in csv_paths:
+        stat = csv_path.stat()
+        signature.append(
+            {"path": str(csv_path.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        )
+    if options is not None:
+        signature.append({"options": options_digest(options)})
+    return signature
+
+
+class SyncJournal:
+    """
+    同期の進捗を記録する先行書き込みジャーナル。
+
+    処理済みのitem_idと行数を、checkpoint_interval行ごとにJSON Linesで追記してfsyncする。
+    同期が途中で中断された場合、次回は最後のチェックポイントまでの行を読み飛ばして再開する。
+    チェックポイント以降の行は再処理されるが、差分がなければ書き込まないため、
+    中断時に処理中だったノートは再開時に検証されるだけになる。
+    書き込みを遅延させる場合は、行をadvanceで進め、書き込みが終わったときにmark_doneで完了を記録する。
+    チェックポイントは書き込みの完了を待たず、完了を記録していない行は再開時に処理し直す。
+    """
+
+    def __init__(
+        self,
+        journal_path: Path,
+        signature: list[dict],
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    ):
+        self._journal_path = journal_path
+        self._signature = signature
+        self._checkpoint_interval = checkpoint_interval
+        self._file = None
+        # mark_doneは書き込みのスレッドから呼ばれる
+        self._lock = threading.Lock()
+        self._pending: list[str] = []
+        self._rows = 0
+        self._written_rows = 0
+        self._since_checkpoint = 0
+        self.resumed_rows = 0
+        self.done_item_ids: frozenset[str] = frozenset()
+        self._load()
+
+    def _load(self):
+        if not self._journal_path.exists():
+            return
+
+        done: set[str] = set()
+        rows = 0
+        with open(self._journal_path, "r", encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except json.JSONDecodeError:
+                header = None
+            if header is None or header.get("source") != self._signature:
+                logger.info("Source CSV or sync options changed, discarding sync journal: %s", self._journal_path)
+                self._journal_path.unlink()
+                return
+            for line in f:
+                try:
+                    checkpoint = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された最後の行は無視する
+                    break
+                done.update(checkpoint["done"])
+                rows = checkpoint["rows"]
+
+        self.resumed_rows = rows
+        self.done_item_ids = frozenset(done)
+        self._rows = rows
+        self._written_rows = rows
+        if rows:
+            logger.info("Resuming sync from checkpoint: %d rows already done", rows)
+
+    def is_done(self, row_number: int, item_id: str) -> bool:
+        """
+        row_number行目（0始まり）が前回の同期で処理済みかどうかを返す。
+        """
+        return row_number < self.resumed_rows and item_id in self.done_item_ids
+
+    @property
+    def checkpoint_due(self) -> bool:
+        """
+        次のadvance（record）でチェックポイントを書き出す（fsyncでブロックする）かどうか。
+        """
+        return bool(self._checkpoint_interval) and self._since_checkpoint + 1 >= self._checkpoint_interval
+
+    def mark_done(self, item_id: str):
+        """
+        item_idの行の書き込みが終わったことを記録する。次のチェックポイントで書き出す。
+        """
+        with self._lock:
+            self._pending.append(item_id)
+
+    def advance(self, row_number: int):
+        """
+        row_number行目（0始まり）までを処理したことを記録する。checkpoint_interval行ごとにチェックポイントを書き出す。
+        """
+        checkpoint = self.checkpoint_due
+        self._rows = row_number + 1
+        self._since_checkpoint += 1
+        if checkpoint:
+            self.checkpoint()
+
+    def record(self, row_number: int, item_id: str):
+        """
+        row_number行目（0始まり）の処理完了を記録する。checkpoint_interval行ごとにチェックポイントを書き出す。
+        """
+        self.mark_done(item_id)
+        self.advance(row_number)
+
+    def checkpoint(self):
+        self._since_checkpoint = 0
+        with self._lock:
+            done, self._pending = self._pending, []
+        if not done and self._rows == self._written_rows:
+            return
+        if self._file is None:
+            self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+            is_new = not self._journal_path.exists()
+            self._file = open(self._journal_path, "a", encoding="utf-8")
+            if is_new:
+                self._file.write(json.dumps({"source": self._signature}) + "\n")
+        self._file.write(json.dumps({"rows": self._rows, "done": done}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._written_rows = self._rows
+
+    def close(self):
+        """
+        中断時に呼ぶ。ここまでの進捗をチェックポイントとして書き出す。
+        """
+        self.checkpoint()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def complete(self):
+        """
+        同期が最後まで完了したときに呼ぶ。ジャーナルを削除する。
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with self._lock:
+            self._pending = []
+        self._journal_path.unlink(missing_ok=True)
@@ -0,0 +1,222 @@
+from pathlib import Path
+import fnmatch
+import logging
+import os
+import random
+import re
+import sys
+import time
+from typing import Container, Final, Iterable, Optional
+
+from booklog_sync.core import DEFAULT_IGNORE_PATTERNS, build_id_book_index
+from booklog_sync.defaults import DEFAULT_IDLE_AFTER, DEFAULT_MAX_BACKOFF, DEFAULT_SERVE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# システムの使用できるメモリがこの割合を下回ったら、メモリが不足しているとみなす
+LOW_MEMORY_RATIO: Final = 0.1
+
+# 更新日時がこの時間（ナノ秒）以内のディレクトリは、同じ更新日時のまま変更される可能性があるため信用しない。
+# FATなど、更新日時の精度が2秒のファイルシステムに合わせている。
+_RACY_NANOSECONDS: Final = 2_000_000_000
+
+# 信用しない更新日時の代わりに記録する値。実際の更新日時とは一致しない。
+_UNSTABLE: Final = -1
+
+# backoff_delayで間隔を倍にする回数の上限（浮動小数点数があふれないようにする）
+_MAX_DOUBLINGS: Final = 32
+
+DirectoryMtimes = dict[Path, Optional[int]]
+
+
+def directory_mtimes(
+    root: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    trusted: Container[Path] = (),
+) -> DirectoryMtimes:
+    """
+    root（recursiveがTrueの場合はignoreに一致しないサブディレクトリも）の更新日時を返す。
+    ディレクトリの中でファイルを追加、削除、名前の変更をすると、そのディレクトリの更新日時が変わる。
+    rootがない場合は {root: None} を返す。
+    trustedのディレクトリは、更新日時が新しくてもそのまま記録する。
+    """
+    ignored = re.compile("|".join(fnmatch.translate(pattern) for pattern in ignore) or "(?!)")
+    now = time.time_ns()
+    mtimes: DirectoryMtimes = {}
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            mtimes[directory] = None
+            continue
+        racy = now - mtime < _RACY_NANOSECONDS and directory not in trusted
+        mtimes[directory] = _UNSTABLE if racy else mtime
+        if recursive:
+            with os.scandir(directory) as entries:
+                directories.extend(
+                    Path(entry.path)
+                    for entry in entries
+                    if entry.is_dir(follow_symlinks=False) and not ignored.match(entry.name)
+                )
+    return mtimes
+
+
+def directories_unchanged(mtimes: DirectoryMtimes) -> bool:
+    """
+    directory_mtimesで記録したディレクトリの更新日時がどれも変わっていなければTrueを返す。
+    サブディレクトリを作ると親ディレクトリの更新日時が変わるため、記録したディレクトリのstatだけで判定できる。
+    """
+    for directory, mtime in mtimes.items():
+        try:
+            current = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            current = None
+        if current != mtime:
+            return False
+    return True
+
+
+def settled_directory_mtimes(
+    before: DirectoryMtimes,
+    root: Path,
+    recursive: bool = False,
+    ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    written: Iterable[Path] = (),
+) -> DirectoryMtimes:
+    """
+    同期のあとに記録し直すディレクトリの更新日時を返す。beforeは同期の前にdirectory_mtimesで記録したもの、
+    writtenは同期でファイルを作成・更新したディレクトリ。
+    writtenのディレクトリ（とrootまでの親ディレクトリ）は同期のあとの更新日時を記録し、
+    同期自身の書き込みを次回に変更とみなさないようにする。それ以外に同期の間に変わったディレクトリは
+    同期の前の値のままにして、次回に変更として検知する。
+    """
+    written_dirs: set[Path] = set()
+    for directory in written:
+        if directory != root and root not in directory.parents:
+            continue
+        for parent in (directory, *directory.parents):
+            written_dirs.add(parent)
+            if parent == root:
+                break
+
+    settled: DirectoryMtimes = {}
+    for directory, mtime in directory_mtimes(root, recursive, ignore, trusted=written_dirs).items():
+        if directory in written_dirs or before.get(directory) == mtime:
+            settled[directory] = mtime
+        else:
+            settled[directory] = before.get(directory, _UNSTABLE)
+    # 同期の間に削除されたディレクトリも、次回に変更として検知する
+    for directory, mtime in before.items():
+        settled.setdefault(directory, mtime)
+    return settled
+
+
+class IdIndexCache:
+    """
+    同期の間で使い回すitem_idの索引（build_id_book_indexの結果）。
+    Vaultのディレクトリの更新日時が索引を作ったときから変わっていなければ、Vaultを走査せずに同じ索引を返す。
+
+    索引はノートの追加、削除、名前の変更でしか変わらず、これらはディレクトリの更新日時に現れる。
+    ノートの内容の編集では更新日時が変わらないため、フロントマターのitem_idを書き換えた場合は
+    次にディレクトリが変わるまで索引に反映されない。ResidentSyncHandlerは、CSVが変わった同期の前に
+    clearで索引を破棄し、書き換えられたitem_idで同じ書籍のノートを重複して作らないようにする。
+    """
+
+    def __init__(self):
+        self._key: Optional[tuple] = None
+        self._mtimes: DirectoryMtimes = {}
+        self._index: Optional[dict[str, Path]] = None
+        self.hits = 0
+        self.builds = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def get(
+        self,
+        books_path: Path,
+        recursive: bool = False,
+        ignore: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+    ) -> dict[str, Path]:
+        """
+        索引を返す。Vaultが変わっていた場合や、引数が前回と異なる場合は作り直す。
+        """
+        ignore = tuple(ignore)
+        key = (books_path, recursive, ignore)
+        if self._index is not None and key == self._key and directories_unchanged(self._mtimes):
+            self.hits += 1
+            logger.debug("Vaultの索引を再利用します（%d件）。", len(self._index))
+            return self._index
+
+        # 走査している間の変更を次回に検知できるよう、走査する前に更新日時を記録する
+        self._mtimes = directory_mtimes(books_path, recursive, ignore)
+        self._index = build_id_book_index(books_path, recursive, ignore)
+        self._key = key
+        self.builds += 1
+        return self._index
+
+    def clear(self):
+        self._key = None
+        self._mtimes = {}
+        self._index = None
+
+
+def available_memory_ratio() -> Optional[float]:
+    """
+    システムのメモリのうち、使用できる割合を返す。判定できない場合はNoneを返す。
+    """
+    if sys.platform == "win32":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            # MEMORYSTATUSEX
+            _fields_ = [
+                ("length", ctypes.c_ulong),
+                ("memory_load", ctypes.c_ulong),
+                ("total_phys", ctypes.c_ulonglong),
+                ("avail_phys", ctypes.c_ulonglong),
+                ("total_page_file", ctypes.c_ulonglong),
+                ("avail_page_file", ctypes.c_ulonglong),
+                ("total_virtual", ctypes.c_ulonglong),
+                ("avail_virtual", ctypes.c_ulonglong),
+                ("avail_extended_virtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.length = ctypes.sizeof(status)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)) or not status.total_phys:
+            return None
+        return status.avail_phys / status.total_phys
+
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            meminfo = dict(line.split(":", 1) for line in f if ":" in line)
+        total = int(meminfo["MemTotal"].split()[0])
+        available = int(meminfo["MemAvailable"].split()[0])
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+    return available / total if total else None
+
+
+def memory_is_low(ratio: float = LOW_MEMORY_RATIO) -> bool:
+    """
+    使用できるメモリの割合がratioを下回っていればTrueを返す。判定できない場合はFalseを返す。
+    """
+    available = available_memory_ratio()
+    return available is not None and available < ratio
+
+
+def backoff_delay(failures: int, interval: float, max_backoff: float = DEFAULT_MAX_BACKOFF) -> float:
+    """
+    failures回続けて同期に失敗したあと、次に同期するまでの秒数。
+    intervalを失敗のたびに倍にして（max_backoffまで）、同じ時刻に再試行が重ならないよう、
+    その半分から全体までの範囲でランダムにずらす。failuresが0の場合はintervalを返す。
+    """
+    if failures <= 0:
+        return interval
+    cap = min(max(max_backoff, interval), interval * 2 ** min(failures, _MAX_DOUBLINGS))
+    return random.uniform(cap / 2, cap)
@@ -0,0 +1,345 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, Final, Iterator, Optional
+
+from booklog_sync.core import write_text_atomic
+from booklog_sync.defaults import DEFAULT_SNAPSHOT_KEEP
+
+if TYPE_CHECKING:
+    import gzip
+
+logger = logging.getLogger(__name__)
+
+# state_path内のスナップショットパックを置くディレクトリ名
+SNAPSHOT_DIRNAME: Final = "snapshots"
+
+_PACK_SUFFIX: Final = ".pack.gz"
+
+_PACK_VERSION: Final = 1
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _encoded(content: str) -> bytes:
+    # write_text_atomic（テキストモードの書き込み）でディスクに書かれるバイト列
+    return content.replace("\n", os.linesep).encode("utf-8")
+
+
+def _write_bytes_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class SnapshotPack:
+    """
+    1回の同期で書き換えるノートの元の内容を、書き込む直前にgzipで圧縮して追記するスナップショットパック。
+
+    パックは同期ごとに1ファイルで、各レコードはJSONのヘッダ1行と、書き換える前のファイルのバイト列からなる。
+    新規作成したノートと孤立ノートの移動も記録し、rollbackで同期の前の状態に戻す。
+    変更のあったノートだけを記録するため、変更のない同期ではパックを作らない。
+    """
+
+    def __init__(self, snapshot_path: Path, books_path: Path):
+        self.snapshot_path = snapshot_path
+        self._books_path = books_path
+        self.path: Optional[Path] = None
+        self._file: Optional["gzip.GzipFile"] = None
+        # asyncio版の同期では、複数のスレッドから同時に書き込まれる
+        self._lock = threading.Lock()
+        self.recorded = 0
+        # recordingで予約し、まだ終わっていない書き込みの数。closeのあとも、これが0になるまでパックを開いておく。
+        self._scheduled = 0
+        self._closing = False
+
+    def _relative(self, path: Path) -> str:
+        try:
+            return path.relative_to(self._books_path).as_posix()
+        except ValueError:
+            # books_pathの外（孤立ノートのアーカイブ先など）は絶対パスで記録する
+            return str(path.resolve())
+
+    def _open(self) -> "gzip.GzipFile":
+        # 同期の起動を遅くしないよう、変更があって初めてgzipを読み込む
+        import gzip
+
+        self.snapshot_path.mkdir(parents=True, exist_ok=True)
+        started = datetime.now().astimezone()
+        # 名前の順が同期の順になるよう、マイクロ秒まで含める
+        run_id = started.strftime("%Y%m%d-%H%M%S-%f")
+        path = self.snapshot_path / f"{run_id}{_PACK_SUFFIX}"
+        suffix = 2
+        while path.exists():
+            path = self.snapshot_path / f"{run_id}-{suffix}{_PACK_SUFFIX}"
+            suffix += 1
+        self.path = path
+        pack = gzip.open(path, "xb")
+        header = {
+            "version": _PACK_VERSION,
+            "books_path": str(self._books_path),
+            "started": started.isoformat(timespec="seconds"),
+        }
+        pack.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+        return pack
+
+    def _append(self, header: dict, data: bytes = b""):
+        line = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(line)
+            self._file.write(data)
+            # ノートを書き換える前に、元の内容をファイルに書き出しておく
+            self._file.flush()
+            self.recorded += 1
+
+    def before_write(self, path: Path, content: str):
+        """
+        pathにcontentを書き込む前に、pathの今の内容（ない場合は新規作成したこと）を記録する。
+        """
+        try:
+            original = path.read_bytes()
+        except FileNotFoundError:
+            original = None
+        header = {
+            "op": "created" if original is None else "modified",
+            "path": self._relative(path),
+            # 同期のあとに編集されたノートをrollbackで上書きしないよう、書き込む内容のハッシュを残す
+            "written": _digest(_encoded(content)),
+        }
+        if original is not None:
+            header["size"] = len(original)
+        self._append(header, original or b"")
+
+    def write(self, path: Path, content: str):
+        """
+        元の内容を記録してから、write_text_atomicで書き込む。
+        """
+        self.before_write(path, content)
+        write_text_atomic(path, content)
+
+    def move(self, source: Path, destination: Path):
+        """
+        移動を記録してから、ファイルを移動する。
+        """
+        self._append({"op": "moved", "path": self._relative(source), "destination": self._relative(destination)})
+        os.replace(source, destination)
+
+    def recording(self, submit: Callable[..., None]) -> Callable[..., None]:
+        """
+        書き込みのスケジューラのsubmitを、実際に書き込むときにwriteで元の内容を記録する関数にする。
+        監視モードで共有するスケジューラのように、書き込みが同期のあとになる場合に使う。
+        マージし直した内容や、書き込みを見送ったことも、実際の書き込みのとおりに記録される。
+        """
+
+        def submit_recorded(path: Path, content: str, kind: str = "", guard=None, on_done=None):
+            with self._lock:
+                self._scheduled += 1
+
+            def done(outcome):
+                try:
+                    if on_done is not None:
+                        on_done(outcome)
+                finally:
+                    self._write_finished()
+
+            submit(path, content, kind, guard, done, writer=self.write)
+
+        return submit_recorded
+
+    def _write_finished(self):
+        with self._lock:
+            self._scheduled -= 1
+            if self._closing and not self._scheduled:
+                self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        パックを閉じる。recordingで予約した書き込みが残っている場合は、最後の書き込みが終わったときに閉じる。
+        """
+        with self._lock:
+            self._closing = True
+            if not self._scheduled:
+                self._close_file()
+
+
+def list_snapshots(snapshot_path: Path) -> list[Path]:
+    """
+    スナップショットパックを古い順に返す。
+    """
+    if not snapshot_path.is_dir():
+        return []
+    return sorted(snapshot_path.glob(f"*{_PACK_SUFFIX}"))
+
+
+def snapshot_run_id(pack_path: Path) -> str:
+    return pack_path.name[: -len(_PACK_SUFFIX)]
+
+
+def prune_snapshots(snapshot_path: Path, keep: int):
+    """
+    新しいものからkeep個を残して、古いスナップショットパックを削除する。
+    """
+    packs = list_snapshots(snapshot_path)
+    for pack_path in packs[: max(len(packs) - keep, 0)]:
+        pack_path.unlink(missing_ok=True)
+        logger.debug("Removed old snapshot: %s", pack_path)
+
+
+def read_snapshot(pack_path: Path) -> tuple[dict, Iterator[tuple[dict, bytes]]]:
+    """
+    スナップショットパックのヘッダと、レコード（ヘッダ, 元の内容）を順に返すイテレータを返す。
+    同期が強制終了されて途中で終わっているパックは、読み取れたレコードまでを返す。
+    """
+    import gzip
+    import zlib
+
+    pack = gzip.open(pack_path, "rb")
+    try:
+        info = json.loads(pack.readline())
+    except (OSError, EOFError, zlib.error, ValueError):
+        pack.close()
+        raise ValueError(f"スナップショットを読み込めません: {pack_path}") from None
+    if info.get("version") != _PACK_VERSION:
+        pack.close()
+        raise ValueError(f"対応していない形式のスナップショットです: {pack_path}")
+
+    def records() -> Iterator[tuple[dict, bytes]]:
+        with pack:
+            try:
+                while line := pack.readline():
+                    header = json.loads(line)
+                    size = header.get("size", 0)
+                    data = pack.read(size)
+                    if len(data) < size:
+                        raise EOFError
+                    yield header, data
+            except (EOFError, zlib.error, ValueError):
+                # 最後のレコードが書きかけの場合、そのノートはまだ書き換えられていない
+                logger.warning("Snapshot ends unexpectedly, using the records before it: %s", pack_path)
+
+    return info, records()
+
+
+@dataclass
+class RollbackResult:
+    restored: int = 0
+    removed: int = 0
+    moved_back: int = 0
+    # 同期のあとに編集されていたため元に戻さなかったファイル
+    skipped: list[Path] = field(default_factory=list)
+
+
+def _resolve(books_path: Path, recorded: str) -> Path:
+    # 絶対パスで記録したファイルは、books_pathと結合してもそのままのパスになる
+    return books_path / recorded
+
+
+def _current_digest(path: Path) -> Optional[str]:
+    try:
+        return _digest(path.read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def rollback_snapshot(pack_path: Path, books_path: Path, force: bool = False) -> RollbackResult:
+    """
+    スナップショットパックの同期で変更したノートを、同期の前の状態に戻す。
+    書き換えたノートは元の内容を書き戻し、新規作成したノートは削除し、アーカイブしたノートは元の場所に戻す。
+    同期のあとに編集されたノートは、forceがTrueでなければ上書きせずにskippedに入れる。
+    """
+    result = RollbackResult()
+    _, records = read_snapshot(pack_path)
+    # 同じノートを何度か書き換えた場合は、最初の記録が同期の前の内容で、最後の記録が同期のあとの内容
+    originals: dict[str, tuple[dict, bytes]] = {}
+    written: dict[str, str] = {}
+    moves: list[dict] = []
+    for header, data in records:
+        if header["op"] == "moved":
+            moves.append(header)
+            continue
+        originals.setdefault(header["path"], (header, data))
+        written[header["path"]] = header["written"]
+
+    # 移動を逆順に戻してから、元の場所のノートの内容を戻す
+    for header in reversed(moves):
+        source = _resolve(books_path, header["path"])
+        destination = _resolve(books_path, header["destination"])
+        if source.exists() or not destination.exists():
+            logger.warning("Cannot move back, skipped: %s -> %s", destination, source)
+            result.skipped.append(destination)
+            continue
+        source.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(destination, source)
+        result.moved_back += 1
+
+    for recorded, (header, data) in originals.items():
+        path = _resolve(books_path, recorded)
+        if not force and _current_digest(path) != written[recorded]:
+            logger.warning("Modified after the sync, skipped: %s", path)
+            result.skipped.append(path)
+            continue
+        if header["op"] == "created":
+            path.unlink(missing_ok=True)
+            result.removed += 1
+        else:
+            _write_bytes_atomic(path, data)
+            result.restored += 1
+    return result
+
+
+def rollback(
+    books_path: Path,
+    state_path: Optional[Path] = None,
+    run_id: Optional[str] = None,
+    force: bool = False,
+) -> RollbackResult:
+    """
+    run_idの同期（省略時は最後の同期）を元に戻す。すべてのノートを戻せた場合はスナップショットパックを削除する。
+    元に戻した同期の続きから再開しないよう同期ジャーナルを削除し、集計ノートは次回の同期で集計し直す。
+    """
+    from booklog_sync.aggregates import AGGREGATE_STATE_FILENAME, dirty_marker
+    from booklog_sync.core import default_state_path
+    from booklog_sync.resume import JOURNAL_FILENAME
+
+    state_path = state_path or default_state_path(books_path)
+    packs = list_snapshots(state_path / SNAPSHOT_DIRNAME)
+    if run_id is not None:
+        packs = [pack_path for pack_path in packs if snapshot_run_id(pack_path) == run_id]
+    if not packs:
+        raise ValueError(f"元に戻せる同期が見つかりません: {run_id or state_path / SNAPSHOT_DIRNAME}")
+    pack_path = packs[-1]
+
+    result = rollback_snapshot(pack_path, books_path, force)
+    (state_path / JOURNAL_FILENAME).unlink(missing_ok=True)
+    if (state_path / AGGREGATE_STATE_FILENAME).exists():
+        dirty_marker(state_path / AGGREGATE_STATE_FILENAME).touch()
+    if not result.skipped:
+        pack_path.unlink()
+
+    logger.info(
+        "Rolled back %s: %d restored, %d removed, %d moved back",
+        snapshot_run_id(pack_path),
+        result.restored,
+        result.removed,
+        result.moved_back,
+    )
+    if result.skipped:
+        logger.warning(
+            "%d files were not rolled back; run again with --force to overwrite them", len(result.skipped)
+        )
+    return result
@@ -0,0 +1,754 @@
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Generator, Iterator, Literal, Optional, Sequence
+
+from booklog_sync.core import (
+    DEFAULT_FRONTMATTER_FIELDS,
+    DEFAULT_IGNORE_PATTERNS,
+    REQUIRED_FRONTMATTER_FIELDS,
+    Book,
+    BooklogCSVRow,
+    Layout,
+    SavedBook,
+    convert_csv,
+    new_note_path,
+    read_booklog_csv,
+    save_book,
+    build_id_book_index,
+    default_state_path,
+    shard_directory,
+    write_text_atomic,
+)
+from booklog_sync.defaults import (
+    AGGREGATE_FIELDS,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_SNAPSHOT_KEEP,
+    DEFAULT_SORT_MEMORY_MB,
+    AdoptMode,
+    JoinMode,
+    MergePolicy,
+    OrphanAction,
+)
+from booklog_sync.filters import RowFilter
+from booklog_sync.resume import JOURNAL_FILENAME, SyncJournal, source_signature
+
+if TYPE_CHECKING:
+    from booklog_sync.serve import IdIndexCache
+    from booklog_sync.throttle import WriteScheduler
+    from booklog_sync.transforms import TransformStage
+
+logger = logging.getLogger(__name__)
+
+# 1冊ごとの処理結果。"resumed" は中断前の同期で処理済みのため読み飛ばした行、
+# "adoptable" は adopt="report" で取り込めると判定した行（書き込みは行わない）。
+# "conflict" は同期中にノートが編集され続けたため、書き込みを見送った行。
+BookResultKind = Literal["created", "updated", "unchanged", "conflict", "resumed", "adoptable"]
+
+
+@dataclass(frozen=True)
+class BookResult:
+    item_id: str
+    # 対象のノート。読み飛ばした行でVaultにノートが見つからない場合はNone。
+    path: Optional[Path]
+    result: BookResultKind
+    changed_fields: tuple[str, ...] = ()
+    adopted: bool = False
+    # 変換から書き込み（書き込みを予約する場合は予約）までにかかった秒数
+    elapsed: float = 0.0
+
+
+@dataclass
+class SyncStats:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    conflicts: int = 0
+    # 遅延させた書き込み（書き込み速度の制限）が失敗した行数。created、updatedには含めない。
+    failed: int = 0
+    resumed: int = 0
+    adopted: int = 0
+    orphans: int = 0
+    # 孤立ノートのパス（orphan_actionがtagとarchiveの場合は、タグを追加した、または移動したノートを含む）
+    orphan_paths: tuple[Path, ...] = ()
+    # 絞り込みで読み飛ばした行数。キーは最初に条件に合わなかった絞り込みの名前。
+    filtered: dict[str, int] = field(default_factory=dict)
+    # 変換ごとにかかった秒数の合計。キーは変換の名前。
+    transform_seconds: dict[str, float] = field(default_factory=dict)
+    elapsed: float = 0.0
+    # 最後まで処理した場合にTrue。途中で打ち切った場合はそれまでの件数が入る。
+    completed: bool = False
+
+
+def run_sync(csv_path: Path | Sequence[Path], books_path: Path, **options) -> SyncStats:
+    """
+    CSVファイルのパスを受け取り、ファイルを作成または更新して集計結果を返す。
+    optionsはiter_syncと同じ。
+    """
+    stats = SyncStats()
+    for _ in iter_sync(csv_path, books_path, stats=stats, **options):
+        pass
+    return stats
+
+
+def iter_sync(
+    csv_path: Path | Sequence[Path],
+    books_path: Path,
+    body_template: Optional[Path] = None,
+    fields: Sequence[str] = DEFAULT_FRONTMATTER_FIELDS,
+    orphan_action: OrphanAction = "report",
+    orphan_archive_path: Optional[Path] = None,
+    state_path: Optional[Path] = None,
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    max_writes_per_second: Optional[float] = None,
+    max_write_bytes_per_second: Optional[float] = None,
+    write_scheduler: Optional["WriteScheduler"] = None,
+    recursive: bool = False,
+    ignore: Sequence[str] = DEFAULT_IGNORE_PATTERNS,
+    layout: Layout = "flat",
+    merge_policy: MergePolicy = "first",
+    change_journal: Optional[Path] = None,
+    adopt: AdoptMode = "off",
+    join: JoinMode = "index",
+    sort_memory_mb: int = DEFAULT_SORT_MEMORY_MB,
+    row_filter: Optional[RowFilter] = None,
+    aggregate_path: Optional[Path] = None,
+    aggregate_by: Sequence[str] = AGGREGATE_FIELDS,
+    transforms: Sequence["TransformStage"] = (),
+    snapshot_keep: int = DEFAULT_SNAPSHOT_KEEP,
+    index_cache: Optional["IdIndexCache"] = None,
+    stats: Optional[SyncStats] = None,
+) -> Iterator[BookResult]:
+    """
+    CSVファイルのパスを受け取り、ファイルを作成または更新しながら1冊ごとの結果を返すジェネレータ。
+    statsを渡すと、処理した件数をそこに集計する。途中でループを抜けた場合も、処理済みの行までをジャーナルに記録する。
+    csv_pathに複数のパスを渡すと、各CSVの行をitem_idで突き合わせ、merge_policyに従って1行ずつ採用する。
+    body_templateを指定すると、新規作成するノートの本文をテンプレートから生成する。
+    fieldsはフロントマターに出力するCSVの列。CSVからはこの列とテンプレートが参照する列だけを読み込む。
+    CSVに存在しないitem_idを持つノートは孤立ノートとして報告し、orphan_actionに応じてタグ付けまたはアーカイブする。
+    進捗はcheckpoint_interval行ごとにstate_path内のジャーナルに記録され、中断後の同期は続きから再開する。
+    checkpoint_intervalに0を指定するとジャーナルを使わない。
+    max_writes_per_second、max_write_bytes_per_secondを指定すると、書き込みをその速度以下に抑える。
+    write_schedulerを渡した場合は書き込みをそこに予約し、完了を待たずに戻る（監視モード用）。
+    recursiveがTrueの場合はbooks_pathのサブディレクトリ（ignoreのパターンに一致するものを除く）も走査し、
+    新規ファイルはlayoutに従ったサブディレクトリに作成する。
+    change_journalを指定すると、更新したフィールドの旧値と新値をそのファイルにJSON Linesで追記する。
+    adoptが"on"の場合、item_idが一致するノートがない行は、item_idを持たない既存ノートを
+    ISBNまたは著者名+タイトルで探して取り込む。"report"の場合は取り込める組み合わせを報告するだけで書き込まない。
+    joinが"sort_merge"の場合は、CSVの行とノートをitem_idで外部ソートして順次突き合わせ、
+    Vaultの大きさに関わらずソートに使うメモリをおよそsort_memory_mb以内に抑える。行はitem_idの順に処理する。
+    row_filterを指定すると、条件に合わない行は変換やノートの検索を行わずに読み飛ばす。
+    読み飛ばした行のitem_idを持つノートは孤立ノートとして扱わない。
+    aggregate_pathを指定すると、aggregate_byのキー（ステータス、評価、著者）ごとのノート一覧をその下に作る。
+    集計はstate_path内に保存し、同期で検出した差分だけを反映して変更のあった一覧だけを書き直す。
+    transformsを指定すると、convert_csvで変換した書籍データに順に適用してから保存する。
+    書き換えるノートの元の内容は、書き込む直前にstate_path内のスナップショットパックに記録し、
+    rollbackで同期の前の状態に戻せるようにする。パックは新しいものからsnapshot_keep個を残す（0で記録しない）。
+    index_cacheを渡すと、Vaultが変わっていなければ前回の同期で作ったitem_idの索引を使い回す（常駐モード用）。
+    """
+    session = _SyncSession(
+        csv_path,
+        books_path,
+        body_template=body_template,
+        fields=fields,
+        orphan_action=orphan_action,
+        orphan_archive_path=orphan_archive_path,
+        state_path=state_path,
+        checkpoint_interval=checkpoint_interval,
+        max_writes_per_second=max_writes_per_second,
+        max_write_bytes_per_second=max_write_bytes_per_second,
+        write_scheduler=write_scheduler,
+        recursive=recursive,
+        ignore=ignore,
+        layout=layout,
+        merge_policy=merge_policy,
+        change_journal=change_journal,
+        adopt=adopt,
+        join=join,
+        sort_memory_mb=sort_memory_mb,
+        row_filter=row_filter,
+        aggregate_path=aggregate_path,
+        aggregate_by=aggregate_by,
+        transforms=transforms,
+        snapshot_keep=snapshot_keep,
+        index_cache=index_cache,
+        stats=stats,
+    )
+    session.open()
+
+    try:
+        for row_number, (row, existing_file) in enumerate(session.rows()):
+            step = session.prepare(row_number, row, existing_file)
+            if step is None:
+                continue
+            if isinstance(step, BookResult):
+                yield step
+                continue
+            yield session.complete(step, session.save(step))
+    except BaseException:
+        # Ctrl+Cや例外、呼び出し側がループを抜けた場合も、完了した行までを記録しておく
+        session.abort()
+        raise
+
+    session.finish()
+
+
+@dataclass
+class _PendingSave:
+    """
+    変換まで終わり、保存を待っている1行分のデータ。
+    """
+
+    row_number: int
+    item_id: str
+    book: Book
+    # 新規作成する場合のディレクトリ（layoutのサブディレクトリを含む）
+    directory: Path
+    body: str
+    existing_file: Optional[Path]
+    adopted: bool
+    started: float
+
+    @property
+    def target(self) -> Path:
+        """
+        書き込む予定のファイル。同じファイルへの書き込みの順序をそろえるために使う。
+        """
+        return self.existing_file or new_note_path(self.directory, self.book)
+
+
+class _SyncSession:
+    """
+    iter_syncとiter_sync_asyncで共有する、1回の同期の準備、1行ごとの処理、後始末。
+    save以外のメソッドはCSVの行の順に1つずつ呼び出す。saveは書き込むファイルが異なれば並行して呼び出せる。
+    """
+
+    def __init__(
+        self,
+        csv_path: Path | Sequence[Path],
+        books_path: Path,
+        body_template: Optional[Path] = None,
+        fields: Sequence[str] = DEFAULT_FRONTMATTER_FIELDS,
+        orphan_action: OrphanAction = "report",
+        orphan_archive_path: Optional[Path] = None,
+        state_path: Optional[Path] = None,
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+        max_writes_per_second: Optional[float] = None,
+        max_write_bytes_per_second: Optional[float] = None,
+        write_scheduler: Optional["WriteScheduler"] = None,
+        recursive: bool = False,
+        ignore: Sequence[str] = DEFAULT_IGNORE_PATTERNS,
+        layout: Layout = "flat",
+        merge_policy: MergePolicy = "first",
+        change_journal: Optional[Path] = None,
+        adopt: AdoptMode = "off",
+        join: JoinMode = "index",
+        sort_memory_mb: int = DEFAULT_SORT_MEMORY_MB,
+        row_filter: Optional[RowFilter] = None,
+        aggregate_path: Optional[Path] = None,
+        aggregate_by: Sequence[str] = AGGREGATE_FIELDS,
+        transforms: Sequence["TransformStage"] = (),
+        snapshot_keep: int = DEFAULT_SNAPSHOT_KEEP,
+        index_cache: Optional["IdIndexCache"] = None,
+        stats: Optional[SyncStats] = None,
+    ):
+        if join == "sort_merge" and adopt != "off":
+            raise ValueError("adopt cannot be combined with join='sort_merge'")
+
+        self.started = time.perf_counter()
+        self.stats = stats if stats is not None else SyncStats()
+        self._books_path = books_path
+        self._fields = fields
+        self._orphan_action = orphan_action
+        self._orphan_archive_path = orphan_archive_path
+        self._state_path = state_path or default_state_path(books_path)
+        self._checkpoint_interval = checkpoint_interval
+        self._max_writes_per_second = max_writes_per_second
+        self._max_write_bytes_per_second = max_write_bytes_per_second
+        self._recursive = recursive
+        self._ignore = ignore
+        self._layout = layout
+        self._merge_policy = merge_policy
+        self._change_journal = change_journal
+        self._adopt = adopt
+        self._join = join
+        self._aggregate_path = aggregate_path
+        self._aggregate_by = aggregate_by
+        self._snapshot_keep = snapshot_keep
+        self._index_cache = index_cache
+        self._body_template = body_template
+        self._transforms = tuple(transforms)
+        self._row_filter = row_filter
+
+        self._template = None
+        if body_template:
+            from booklog_sync.template import load_body_template
+
+            self._template = load_body_template(body_template)
+        self._columns = {
+            *fields,
+            *REQUIRED_FRONTMATTER_FIELDS,
+            *(self._template.fields if self._template else ()),
+        }
+
+        self._transform = None
+        if transforms:
+            from booklog_sync.transforms import TransformPipeline
+
+            self._transform = TransformPipeline(transforms)
+            self._columns |= self._transform.columns
+
+        self._rejected_by = None
+        if row_filter:
+            from booklog_sync.filters import compile_filter
+
+            self._columns |= row_filter.columns
+            self._rejected_by = compile_filter(row_filter)
+
+        self.csv_paths = (
+            [Path(csv_path)] if isinstance(csv_path, (str, Path)) else [Path(p) for p in csv_path]
+        )
+
+        if join == "sort_merge":
+            from booklog_sync.join import sort_chunk_size
+
+            # CSVごとのソートとノートのソートで上限を分け合う
+            self._chunk_size = sort_chunk_size(sort_memory_mb, sorts=len(self.csv_paths) + 1)
+        elif adopt != "off":
+            self._columns.add("isbn13")
+
+        self._vault_index = None
+        self._id_book_index: dict[str, Path] = {}
+        self._orphans: dict[str, Path] = {}
+        self._seen_item_ids: set[str] = set()
+        self._has_rows = False
+        self._change_log = None
+        self._aggregates = None
+        self._scheduler = write_scheduler
+        self._owns_scheduler = False
+        self._writer = None
+        self._snapshot = None
+        # 遅延させた書き込みの (item_id, 結果の種別, 書き込みの結果)。
+        # 書き込みのスレッドから追加され、_apply_write_outcomesで集計に反映する。
+        self._write_outcomes: list[tuple[str, str, str]] = []
+        self._write_outcomes_lock = threading.Lock()
+        # 書き込みが終わってから変更の記録と集計ノートに反映する行 {item_id: (保存の予定, 保存の結果)}
+        self._deferred: dict[str, tuple[_PendingSave, SavedBook]] = {}
+        # aiosyncで並行して保存した場合など、completeより先に書き込みが終わった行の結果 {item_id: 書き込みの結果}
+        self._early_outcomes: dict[str, str] = {}
+        self._write_file = write_text_atomic
+        self._move = os.replace
+        self.journal = None
+
+    def open(self):
+        """
+        Vaultの索引を作り、ジャーナルや書き込みのスケジューラなど同期中に使うものを準備する。
+        """
+        if self._join == "index":
+            # row_filterで絞り込む場合も、孤立ノートの検出にVault全体の索引が必要なため、ここで走査する
+            if self._adopt != "off":
+                from booklog_sync.adopt import build_vault_index
+
+                self._vault_index = build_vault_index(self._books_path, self._recursive, self._ignore)
+                self._id_book_index = self._vault_index.by_id
+            elif self._index_cache is not None:
+                self._id_book_index = self._index_cache.get(self._books_path, self._recursive, self._ignore)
+            else:
+                self._id_book_index = build_id_book_index(self._books_path, self._recursive, self._ignore)
+            logger.debug("id_book_index: %s", self._id_book_index)
+
+        if self._change_journal:
+            from booklog_sync.changelog import ChangeJournal
+
+            self._change_log = ChangeJournal(self._change_journal)
+
+        if self._aggregate_path:
+            from booklog_sync.aggregates import AGGREGATE_STATE_FILENAME, AggregateIndex
+
+            self._aggregates = AggregateIndex(
+                self._state_path / AGGREGATE_STATE_FILENAME, self._aggregate_path, self._aggregate_by
+            )
+            # 初回や設定を変えた場合だけVault全体から集計する。以降は差分だけを反映する。
+            if not self._aggregates.loaded:
+                self._aggregates.rebuild(self._books_path, self._recursive, self._ignore)
+
+        if self._snapshot_keep:
+            from booklog_sync.snapshots import SNAPSHOT_DIRNAME, SnapshotPack
+
+            self._snapshot = SnapshotPack(self._state_path / SNAPSHOT_DIRNAME, self._books_path)
+            self._write_file = self._snapshot.write
+            self._move = self._snapshot.move
+
+        if self._scheduler is None and (self._max_writes_per_second or self._max_write_bytes_per_second):
+            from booklog_sync.throttle import WriteScheduler
+
+            self._scheduler = WriteScheduler(
+                self._max_writes_per_second, self._max_write_bytes_per_second, writer=self._write_file
+            )
+            self._owns_scheduler = True
+        self._writer = self._scheduler.submit if self._scheduler else None
+        if self._snapshot is not None and self._scheduler is not None and not self._owns_scheduler:
+            # 監視モードで共有するスケジューラは同期のあとに書き込むため、書き込むときに元の内容を記録する
+            self._writer = self._snapshot.recording(self._scheduler.submit)
+
+        if self._checkpoint_interval:
+            self.journal = SyncJournal(
+                self._state_path / JOURNAL_FILENAME,
+                source_signature(self.csv_paths, self._journal_options()),
+                self._checkpoint_interval,
+            )
+
+    def _journal_options(self) -> dict:
+        """
+        ノートの内容や処理する行に影響する設定。設定を変えた場合は、前回の同期の続きから再開しない。
+        """
+        return {
+            "fields": tuple(self._fields),
+            "body_template": (
+                (str(self._body_template), self._body_template.read_bytes()) if self._body_template else None
+            ),
+            "transforms": tuple(
+                (stage.name, stage.columns, stage.options, stage.source_digest) for stage in self._transforms
+            ),
+            "row_filter": self._row_filter,
+            "merge_policy": self._merge_policy,
+            "layout": self._layout,
+            "adopt": self._adopt,
+            "recursive": self._recursive,
+            "ignore": tuple(self._ignore),
+        }
+
+    def rows(self) -> Generator[tuple[BooklogCSVRow, Optional[Path]], None, None]:
+        """
+        CSVの行と、sort_mergeの場合は突き合わせたノートのパスを順に返す。indexの場合、パスはprepareで探す。
+        """
+        if len(self.csv_paths) == 1:
+            rows = read_booklog_csv(self.csv_paths[0], self._columns)
+            if self._join == "sort_merge":
+                from booklog_sync.extsort import external_sort
+                from booklog_sync.join import row_item_id
+
+                rows = external_sort(rows, key=row_item_id, chunk_size=self._chunk_size)
+        else:
+            from booklog_sync.merge import merge_booklog_csvs
+
+            # 統合した行はitem_idの昇順に並ぶため、sort_mergeでもそのまま突き合わせられる
+            if self._join == "sort_merge":
+                rows = merge_booklog_csvs(
+                    self.csv_paths, self._columns, self._merge_policy, chunk_size=self._chunk_size
+                )
+            else:
+                rows = merge_booklog_csvs(self.csv_paths, self._columns, self._merge_policy)
+
+        if self._join == "sort_merge":
+            from booklog_sync.join import iter_sorted_notes, sort_merge_join
+
+            notes = iter_sorted_notes(self._books_path, self._recursive, self._ignore, self._chunk_size)
+            return sort_merge_join(rows, notes, self._orphans)
+        # 絞り込みのあとで検索するため、ここではノートを探さない
+        return ((row, None) for row in rows)
+
+    def prepare(
+        self, row_number: int, row: BooklogCSVRow, existing_file: Optional[Path]
+    ) -> Optional[BookResult | _PendingSave]:
+        """
+        1行を絞り込み、変換して保存の準備をする。保存しない行は結果を返し、絞り込みで除いた行はNoneを返す。
+        """
+        item_id = row.get("item_id")
+        self._has_rows = True
+        # sort_mergeでは突き合わせの中で孤立ノートが決まるため、item_idを保持しない
+        if self._join == "index":
+            self._seen_item_ids.add(item_id)
+
+        if self._rejected_by is not None:
+            rejected = self._rejected_by(row)
+            if rejected is not None:
+                self.stats.filtered[rejected] = self.stats.filtered.get(rejected, 0) + 1
+                return None
+
+        if self._join == "index":
+            existing_file = self._id_book_index.get(item_id)
+
+        if self.journal and self.journal.is_done(row_number, item_id):
+            self.stats.resumed += 1
+            return BookResult(item_id, existing_file, "resumed")
+
+        started = time.perf_counter()
+        book: Book = convert_csv(row, self._fields)
+        if self._transform is not None:
+            book = self._transform(book, row)
+
+        adopted = False
+        if existing_file is None and self._vault_index is not None:
+            existing_file = self._vault_index.find_adoptable(row)
+            if existing_file is not None:
+                adopted = True
+                self.stats.adopted += 1
+                if self._adopt == "report":
+                    logger.info("Adoptable: %s (item_id: %s)", existing_file, item_id)
+                    return BookResult(
+                        item_id,
+                        existing_file,
+                        "adoptable",
+                        adopted=True,
+                        elapsed=time.perf_counter() - started,
+                    )
+                logger.debug("Adopting: %s (item_id: %s)", existing_file, item_id)
+
+        if existing_file:
+            return _PendingSave(row_number, item_id, book, self._books_path, "", existing_file, adopted, started)
+        body = self._template.render(row) if self._template else ""
+        directory = self._books_path / shard_directory(row, self._layout)
+        return _PendingSave(row_number, item_id, book, directory, body, None, adopted, started)
+
+    def save(self, pending: _PendingSave) -> SavedBook:
+        """
+        ノートを読み込んで差分を取り、書き込む（書き込みを予約する）。
+        """
+        writer = None
+        if self._writer is not None:
+            # 書き込みが終わったときに、その行の完了をジャーナルに記録する
+            writer = partial(self._submit, pending.item_id)
+        return save_book(
+            pending.directory,
+            pending.book,
+            pending.body,
+            pending.existing_file,
+            writer=writer,
+            write_file=self._write_file,
+        )
+
+    def _submit(self, item_id: str, path: Path, content: str, kind: str = "", guard=None):
+        self._writer(path, content, kind, guard, on_done=partial(self._write_done, item_id, kind))
+
+    def _write_done(self, item_id: str, kind: str, outcome: str):
+        """
+        遅延させた書き込みの結果を受け取る。書き込みのスレッドから呼ばれる。
+        """
+        # マージし直すと変更がなくなった行も、ノートが最新の状態なので完了として記録する
+        if outcome in ("written", "unchanged") and self.journal:
+            self.journal.mark_done(item_id)
+        with self._write_outcomes_lock:
+            self._write_outcomes.append((item_id, kind, outcome))
+
+    def _apply_write_outcomes(self):
+        """
+        遅延させた書き込みの結果を反映する。書き込めた行は変更の記録と集計ノートに反映し、書き込まなかった行は
+        予約した時点で数えたcreated、updatedから結果に合わせて数え直す。
+        """
+        with self._write_outcomes_lock:
+            outcomes, self._write_outcomes = self._write_outcomes, []
+        for item_id, kind, outcome in outcomes:
+            if self._aggregates is not None or self._change_log is not None:
+                deferred = self._deferred.pop(item_id, None)
+                if deferred is None:
+                    self._early_outcomes[item_id] = outcome
+                else:
+                    self._apply_written(outcome, *deferred)
+            if outcome == "written":
+                continue
+            if kind == "created":
+                self.stats.created -= 1
+            elif kind == "updated":
+                self.stats.updated -= 1
+            if outcome == "unchanged":
+                self.stats.unchanged += 1
+            elif outcome == "conflict":
+                self.stats.conflicts += 1
+            else:
+                self.stats.failed += 1
+
+    def complete(self, pending: _PendingSave, saved: SavedBook) -> BookResult:
+        """
+        保存の結果を集計し、変更の記録、集計ノート、ジャーナルに反映する。
+        """
+        if saved.result == "created":
+            self.stats.created += 1
+        elif saved.result == "updated":
+            self.stats.updated += 1
+        elif saved.result == "unchanged":
+            self.stats.unchanged += 1
+        elif saved.result == "conflict":
+            self.stats.conflicts += 1
+
+        deferred = self._writer is not None and saved.result in ("created", "updated")
+        if self._aggregates is not None or self._change_log is not None:
+            if deferred:
+                # 書き込めなかった変更を記録しないよう、書き込みの結果を受け取ってから反映する
+                outcome = self._early_outcomes.pop(pending.item_id, None)
+                if outcome is None:
+                    self._deferred[pending.item_id] = (pending, saved)
+                else:
+                    self._apply_written(outcome, pending, saved)
+            else:
+                self._apply_written("written", pending, saved)
+
+        if self.journal:
+            if deferred:
+                # 書き込みが終わるまでは完了として記録しない（_write_doneで記録する）
+                self.journal.advance(pending.row_number)
+            else:
+                self.journal.record(pending.row_number, pending.item_id)
+
+        if self._writer is not None:
+            self._apply_write_outcomes()
+
+        return BookResult(
+            pending.item_id,
+            saved.path,
+            saved.result,
+            tuple(saved.changes),
+            pending.adopted,
+            time.perf_counter() - pending.started,
+        )
+
+    def _apply_written(self, outcome: str, pending: _PendingSave, saved: SavedBook):
+        if outcome == "written" and self._change_log is not None and saved.result == "updated":
+            self._change_log.record(pending.item_id, saved.path, saved.changes)
+        # マージし直すと変更がなくなった行も、ノートは予約した内容になっている
+        if outcome in ("written", "unchanged") and self._aggregates is not None:
+            self._apply_aggregates(pending, saved)
+
+    def _apply_aggregates(self, pending: _PendingSave, saved: SavedBook):
+        if saved.result == "created" or (pending.adopted and saved.result == "updated"):
+            self._aggregates.add_book(pending.item_id, saved.path, pending.book)
+        elif saved.result == "updated":
+            self._aggregates.apply_changes(pending.item_id, saved.path, saved.changes)
+
+    def _finish_writes(self):
+        """
+        この同期の書き込みが終わるのを待ち、結果を反映する。監視モードで共有するスケジューラの場合は、
+        書き込みの結果を待っている行があるときだけ、予約済みの書き込みが終わるのを待つ。
+        """
+        if self._owns_scheduler:
+            self._scheduler.close()
+        elif self._deferred:
+            self._scheduler.flush()
+        self._apply_write_outcomes()
+
+    def abort(self):
+        """
+        同期を途中で打ち切るときに呼ぶ。完了した行までを記録する。
+        """
+        self.stats.elapsed = time.perf_counter() - self.started
+        if self._transform is not None:
+            self.stats.transform_seconds = dict(self._transform.seconds)
+        # 書き込みが終わった行までをジャーナル、変更の記録、集計ノートに反映できるよう、書き込みを終えてから閉じる
+        self._finish_writes()
+        if self._change_log:
+            self._change_log.flush()
+        if self._aggregates is not None:
+            self._aggregates.flush()
+        if self.journal:
+            self.journal.close()
+        self._close_snapshot()
+
+    def _close_snapshot(self):
+        if self._snapshot is None:
+            return
+        from booklog_sync.snapshots import prune_snapshots
+
+        self._snapshot.close()
+        if self._snapshot.recorded:
+            logger.info("Snapshot: %d changes recorded in %s", self._snapshot.recorded, self._snapshot.path)
+            prune_snapshots(self._snapshot.snapshot_path, self._snapshot_keep)
+
+    def finish(self):
+        """
+        すべての行を処理したあとに呼ぶ。孤立ノートを処理し、結果をログに出力する。
+        """
+        stats = self.stats
+        if self._has_rows:
+            from booklog_sync.orphans import find_orphans, handle_orphans
+
+            orphans = self._orphans
+            if self._join == "index":
+                orphans = find_orphans(self._id_book_index, self._seen_item_ids)
+            stats.orphans = len(orphans)
+            stats.orphan_paths = tuple(orphans.values())
+            handle_orphans(
+                orphans,
+                self._orphan_action,
+                self._orphan_archive_path,
+                self._writer,
+                self._write_file,
+                self._move,
+            )
+            if self._aggregates is not None and self._orphan_action == "archive":
+                self._aggregates.remove_books(item_id for item_id, path in orphans.items() if not path.exists())
+        else:
+            # 空のCSVで全ノートを孤立扱いにしないよう、孤立ノートの処理は行わない
+            logger.warning(
+                "No rows found in CSV, skipping orphan detection: %s", ", ".join(map(str, self.csv_paths))
+            )
+
+        # 監視モードで共有するスケジューラの場合は、変更の記録や集計ノートに反映する行がなければ、
+        # この時点までに終わった書き込みの結果だけを反映する
+        self._finish_writes()
+        if self._owns_scheduler:
+            write_stats = self._scheduler.stats()
+            logger.info(
+                "Writes: %d files, %d bytes in %.1fs (%.1f files/s, %.0f bytes/s)",
+                write_stats.files,
+                write_stats.bytes,
+                write_stats.elapsed,
+                write_stats.files_per_second,
+                write_stats.bytes_per_second,
+            )
+        elif self._scheduler:
+            logger.info("Writes queued: %d files pending", self._scheduler.stats().pending)
+        self._close_snapshot()
+
+        if self._change_log:
+            self._change_log.flush()
+            logger.info(
+                "Change journal: %d field changes written to %s", self._change_log.recorded, self._change_journal
+            )
+
+        if self._aggregates is not None:
+            written = self._aggregates.flush()
+            if written:
+                logger.info("Aggregates: %d notes updated in %s", written, self._aggregate_path)
+
+        if self.journal:
+            self.journal.complete()
+
+        stats.elapsed = time.perf_counter() - self.started
+        stats.completed = True
+        if self._transform is not None:
+            stats.transform_seconds = dict(self._transform.seconds)
+
+        if self._adopt == "report":
+            logger.info("Adoption report: %d existing notes can be adopted", stats.adopted)
+        elif stats.adopted:
+            logger.info("Adopted %d existing notes without item_id", stats.adopted)
+        if stats.filtered:
+            logger.info(
+                "Filtered out %d rows (%s)",
+                sum(stats.filtered.values()),
+                ", ".join(f"{name}: {count}" for name, count in stats.filtered.items()),
+            )
+        if stats.transform_seconds:
+            # 遅い変換がすぐに分かるよう、時間のかかった順に出力する
+            logger.info(
+                "Transforms: %s",
+                ", ".join(
+                    f"{name} {seconds:.3f}s"
+                    for name, seconds in sorted(stats.transform_seconds.items(), key=lambda item: -item[1])
+                ),
+            )
+        if stats.resumed:
+            logger.info("Skipped %d rows already synced before interruption", stats.resumed)
+        if stats.failed:
+            logger.warning("Failed to write %d notes; they will be retried next time", stats.failed)
+        if stats.conflicts:
+            logger.warning(
+                "Skipped %d notes that kept changing during sync; they will be retried next time", stats.conflicts
+            )
+        logger.info(
+            "Sync completed: %d created, %d updated, %d unchanged", stats.created, stats.updated, stats.unchanged
+        )
@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+from pathlib import Path
+import string
+
+from booklog_sync.core import BOOKLOG_CSV_COLUMNS, BooklogCSVRow
+
+
+@dataclass(frozen=True)
+class BodyTemplate:
+    """
+    コンパイル済みのノート本文テンプレート。
+    `{review}` のようにBooklogCSVRowのフィールド名を参照できる。
+    """
+
+    format_string: str
+    fields: tuple[str, ...]
+
+    def render(self, row: BooklogCSVRow) -> str:
+        # DictReaderは列が足りない行の値をNoneにするため、空文字に寄せる
+        return self.format_string.format(*[row.get(field) or "" for field in self.fields])
+
+
+def compile_template(text: str) -> BodyTemplate:
+    """
+    テンプレート文字列を解析し、位置引数の書式文字列に変換する。
+    解析は一度だけ行い、描画時は文字列の組み立てだけで済むようにする。
+    """
+    pieces: list[str] = []
+    fields: list[str] = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+        pieces.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field_name is None:
+            continue
+        if field_name not in BOOKLOG_CSV_COLUMNS:
+            raise ValueError(f"テンプレートエラー: 不明なフィールド '{field_name}' です。")
+        if format_spec or conversion:
+            raise ValueError(f"テンプレートエラー: 書式指定はサポートしていません: '{field_name}'")
+        pieces.append(f"{{{len(fields)}}}")
+        fields.append(field_name)
+
+    return BodyTemplate(format_string="".join(pieces), fields=tuple(fields))
+
+
+# テンプレートファイルのキャッシュ。キーは解決済みパス、値は (st_mtime_ns, コンパイル結果)。
+_template_cache: dict[Path, tuple[int, BodyTemplate]] = {}
+
+
+def load_body_template(template_path: Path) -> BodyTemplate:
+    """
+    テンプレートファイルを読み込んでコンパイルする。
+    ファイルの更新時刻が変わっていなければキャッシュ済みの結果を返す。
+    """
+    path = template_path.resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"テンプレートファイルが見つかりません: {path}")
+
+    mtime_ns = path.stat().st_mtime_ns
+    cached = _template_cache.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    text = path.read_text(encoding="utf-8")
+    # save_book_to_markdown が本文の後ろに改行を付けるため、末尾の改行を1つ取り除く
+    if text.endswith("\n"):
+        text = text[:-1]
+
+    template = compile_template(text)
+    _template_cache[path] = (mtime_ns, template)
+    return template
@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from pathlib import Path
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Final, Literal, Optional
+
+from booklog_sync.core import FileVersion, write_if_unchanged, write_text_atomic
+
+logger = logging.getLogger(__name__)
+
+# 書き込みの優先度。値が小さいほど先に書き込む。
+WRITE_PRIORITIES: Final = {"created": 0, "updated": 1}
+DEFAULT_WRITE_PRIORITY: Final = 2
+
+# 書き込む直前の確認に使う (読み込んだ時点のFileVersion, マージし直す関数)
+Guard = tuple[FileVersion, Callable[[], Optional[tuple[str, FileVersion]]]]
+
+# 予約した書き込みの結果。on_doneに渡される。
+# "unchanged" と "conflict" はguardの確認で書き込みを見送った場合（write_if_unchangedの結果）。
+WriteOutcome = Literal["written", "unchanged", "conflict", "failed"]
+
+# 書き込み待ちの1件: (優先度, 内容, guard, on_doneのリスト, 書き込む関数)
+_Queued = tuple[int, str, Optional[Guard], list[Callable[[WriteOutcome], None]], Callable[[Path, str], None]]
+
+# 書き込み待ちにできるファイル数の上限。超えた場合はsubmitが空きを待つ。
+DEFAULT_MAX_PENDING: Final = 10000
+
+
+@dataclass(frozen=True)
+class WriteStats:
+    files: int
+    bytes: int
+    elapsed: float
+    pending: int
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _TokenBucket:
+    """1秒分のバーストを許すトークンバケット。rateがNoneなら制限しない。"""
+
+    def __init__(self, rate: Optional[float]):
+        self._rate = rate
+        self._tokens = rate or 0.0
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """amount分のトークンが貯まるまでの秒数を返す。0なら今すぐ消費できる。"""
+        if self._rate is None:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        # 1秒分を超える書き込みは、バケットが満杯になった時点で許可する
+        needed = min(amount, self._rate)
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) / self._rate
+
+    def consume(self, amount: float):
+        if self._rate is not None:
+            self._tokens -= amount
+
+
+class WriteScheduler:
+    """
+    ノートの書き込みを1秒あたりのファイル数とバイト数で制限しながら、バックグラウンドで実行する。
+
+    新規作成を更新より優先して書き込む。同じファイルへの書き込みが待機中に再度投入された場合は、
+    最新の内容だけを書き込む。guardを付けて予約した書き込みは、書き込む直前にwrite_if_unchangedで
+    ファイルが読み込んだ時点から変わっていないことを確かめる。
+    on_doneを付けて予約した書き込みは、書き込みのスレッドで結果（WriteOutcome）を渡して呼び出す。
+    """
+
+    def __init__(
+        self,
+        max_writes_per_second: Optional[float] = None,
+        max_bytes_per_second: Optional[float] = None,
+        writer: Callable[[Path, str], None] = write_text_atomic,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self._ops = _TokenBucket(max_writes_per_second)
+        self._bytes = _TokenBucket(max_bytes_per_second)
+        self._writer = writer
+        self._max_pending = max_pending
+        self._queue: list[tuple[int, int, Path]] = []
+        self._pending: dict[Path, _Queued] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._files = 0
+        self._bytes_written = 0
+        self._started: Optional[float] = None
+        self._last_write: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="booklog-sync-writer", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        path: Path,
+        content: str,
+        kind: str = "",
+        guard: Optional[Guard] = None,
+        on_done: Optional[Callable[[WriteOutcome], None]] = None,
+        writer: Optional[Callable[[Path, str], None]] = None,
+    ):
+        """
+        書き込みを予約する。kindは "created" や "updated" などの優先度の種別。
+        guardは (読み込んだ時点のFileVersion, マージし直す関数)。
+        writerを指定すると、スケジューラの書き込む関数の代わりに使う（同期ごとにスナップショットを取る場合など）。
+        同じファイルの書き込み待ちを置き換えた場合、置き換えられた書き込みのon_doneにも新しい書き込みの結果を渡す。
+        """
+        priority = WRITE_PRIORITIES.get(kind, DEFAULT_WRITE_PRIORITY)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("WriteScheduler is closed")
+            while path not in self._pending and len(self._pending) >= self._max_pending:
+                self._condition.wait()
+            queued = self._pending.get(path)
+            if queued is None or priority < queued[0]:
+                heapq.heappush(self._queue, (priority, next(self._sequence), path))
+            callbacks = [on_done] if on_done is not None else []
+            if queued is not None:
+                priority = min(priority, queued[0])
+                callbacks = queued[3] + callbacks
+            self._pending[path] = (priority, content, guard, callbacks, writer or self._writer)
+            if self._started is None:
+                self._started = time.monotonic()
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[tuple[Path, _Queued]]:
+        with self._condition:
+            while True:
+                # 優先度が上がって再投入された古いエントリは読み飛ばす
+                while self._queue and (
+                    self._queue[0][2] not in self._pending
+                    or self._pending[self._queue[0][2]][0] != self._queue[0][0]
+                ):
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    if self._closed:
+                        return None
+                    self._condition.wait()
+                    continue
+
+                path = self._queue[0][2]
+                queued = self._pending[path]
+                size = len(queued[1].encode("utf-8"))
+                wait = max(self._ops.wait_time(1), self._bytes.wait_time(size))
+                if wait > 0:
+                    # 待っている間に優先度の高い書き込みが投入されることがあるため、先頭から選び直す
+                    self._condition.wait(wait)
+                    continue
+
+                heapq.heappop(self._queue)
+                del self._pending[path]
+                self._ops.consume(1)
+                self._bytes.consume(size)
+                self._writing = True
+                self._condition.notify_all()
+                return path, queued
+
+    def _run(self):
+        while (item := self._next()) is not None:
+            path, (_, content, guard, callbacks, writer) = item
+            outcome: WriteOutcome = "written"
+            try:
+                if guard is None:
+                    writer(path, content)
+                else:
+                    outcome = write_if_unchanged(path, content, *guard, writer=writer)
+            except Exception:
+                logger.exception("Failed to write: %s", path)
+                outcome = "failed"
+            else:
+                if outcome == "written":
+                    now = time.monotonic()
+                    with self._condition:
+                        self._last_write = now
+                        self._files += 1
+                        self._bytes_written += len(content.encode("utf-8"))
+            finally:
+                # flushを待つ側が結果を受け取れるよう、_writingを戻す前に呼び出す
+                for on_done in callbacks:
+                    try:
+                        on_done(outcome)
+                    except Exception:
+                        logger.exception("Write callback failed: %s", path)
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def flush(self):
+        """
+        予約済みの書き込みがすべて終わるまで待つ。
+        """
+        with self._condition:
+            while self._pending or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        """
+        予約済みの書き込みをすべて終えてから、書き込みスレッドを停止する。
+        """
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def stats(self) -> WriteStats:
+        with self._condition:
+            elapsed = 0.0
+            if self._started is not None and self._last_write is not None:
+                elapsed = self._last_write - self._started
+            return WriteStats(
+                files=self._files,
+                bytes=self._bytes_written,
+                elapsed=elapsed,
+                pending=len(self._pending),
+            )
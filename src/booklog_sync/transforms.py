@@ -0,0 +1,199 @@
+from dataclasses import dataclass, replace
+from functools import partial
+from pathlib import Path
+import hashlib
+import importlib
+import importlib.util
+import time
+from typing import Callable, Final, Iterable, Optional
+
+from booklog_sync.core import BOOKLOG_CSV_COLUMNS, Book, BooklogCSVRow
+
+# 変換の関数。convert_csvが作った書籍データとCSVの行を受け取り、書籍データを返す（受け取ったものを変更してよい）。
+TransformFunction = Callable[[Book, BooklogCSVRow], Book]
+
+
+@dataclass(frozen=True)
+class TransformStage:
+    """
+    コンパイル済みの変換の1段。columnsは変換がCSVの行から読む列。
+    optionsは設定ファイルで指定したオプション、source_digestは独自の関数を定義したファイルの内容のハッシュ
+    （同期の再開で、設定や変換のコードが変わっていないかの判定に使う）。
+    """
+
+    name: str
+    function: TransformFunction
+    columns: tuple[str, ...] = ()
+    options: tuple[tuple[str, object], ...] = ()
+    source_digest: Optional[str] = None
+
+
+def _as_list(value) -> list:
+    # ブクログのCSVのタグはカンマ区切り
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return list(value)
+    return [tag.strip() for tag in str(value).split(",") if tag.strip()]
+
+
+def split_tags(separator: str = ",") -> TransformFunction:
+    """
+    tagsの文字列をリストにする。
+    """
+
+    def split_tags(book: Book, row: BooklogCSVRow) -> Book:
+        tags = book.get("tags")
+        if isinstance(tags, str):
+            book["tags"] = [tag.strip() for tag in tags.split(separator) if tag.strip()] or None
+        return book
+
+    return split_tags
+
+
+def category_tag(prefix: str = "") -> TransformFunction:
+    """
+    CSVのカテゴリを、prefixを付けてtagsに追加する。
+    """
+
+    def category_tag(book: Book, row: BooklogCSVRow) -> Book:
+        category = (row.get("category") or "").strip()
+        if category:
+            tags = _as_list(book.get("tags"))
+            tag = f"{prefix}{category}"
+            if tag not in tags:
+                tags.append(tag)
+            book["tags"] = tags
+        return book
+
+    return category_tag
+
+
+def rating_stars(field: str = "rating", scale: int = 5, filled: str = "★", empty: str = "☆") -> TransformFunction:
+    """
+    CSVの評価を "★★★☆☆" のような文字列（scale個）にしてfieldに入れる。評価がない場合は何もしない。
+    """
+
+    def rating_stars(book: Book, row: BooklogCSVRow) -> Book:
+        rating = row.get("rating")
+        if rating and rating.isdigit() and int(rating) > 0:
+            stars = min(int(rating), scale)
+            book[field] = filled * stars + empty * (scale - stars)
+        return book
+
+    return rating_stars
+
+
+# 組み込みの変換: 名前 -> (変換の関数を作る関数, CSVから読む列)
+BUILTIN_TRANSFORMS: Final[dict[str, tuple[Callable[..., TransformFunction], tuple[str, ...]]]] = {
+    "split_tags": (split_tags, ()),
+    "category_tag": (category_tag, ("category",)),
+    "rating_stars": (rating_stars, ("rating",)),
+}
+
+
+def _load_function(reference: str, base_dir: Optional[Path]) -> tuple[Callable, Optional[str]]:
+    module_name, _, attribute = reference.rpartition(":")
+    if module_name.endswith(".py"):
+        module_path = Path(module_name)
+        if base_dir is not None and not module_path.is_absolute():
+            module_path = base_dir / module_path
+        spec = importlib.util.spec_from_file_location(module_path.stem, module_path)
+        if spec is None or not module_path.exists():
+            raise ValueError(f"設定エラー: 変換のファイルが見つかりません: {module_path}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            raise ValueError(f"設定エラー: 変換のモジュールを読み込めません: {module_name} ({e})") from None
+    function = getattr(module, attribute, None)
+    if not callable(function):
+        raise ValueError(f"設定エラー: 変換の関数が見つかりません: {reference}")
+    source_file = getattr(module, "__file__", None)
+    if source_file is None:
+        return function, None
+    try:
+        return function, hashlib.blake2b(Path(source_file).read_bytes(), digest_size=16).hexdigest()
+    except OSError:
+        return function, None
+
+
+def compile_transform(spec, base_dir: Optional[Path] = None) -> TransformStage:
+    """
+    設定ファイルの変換の指定を1段の変換にする。
+    名前だけの文字列か、nameとオプションの辞書で指定する。nameが "モジュール:関数" または
+    "ファイル.py:関数" の場合は、その関数を function(book, row, **オプション) として呼び出す。
+    独自の関数がCSVの行から読む列はcolumnsで指定する（省略時はすべての列を読み込む）。
+    """
+    options = {}
+    if isinstance(spec, dict):
+        options = dict(spec)
+        name = options.pop("name", None)
+    else:
+        name = spec
+    if not isinstance(name, str) or not name:
+        raise ValueError("設定エラー: 'transforms' の各要素には変換の名前を指定してください。")
+
+    if name in BUILTIN_TRANSFORMS:
+        factory, columns = BUILTIN_TRANSFORMS[name]
+        try:
+            function = factory(**options)
+        except TypeError:
+            raise ValueError(f"設定エラー: 変換 '{name}' のオプションが正しくありません: {options}") from None
+        return TransformStage(name, function, columns, tuple(sorted(options.items())))
+
+    if ":" not in name:
+        raise ValueError(
+            f"設定エラー: 不明な変換 '{name}' です。{', '.join(BUILTIN_TRANSFORMS)}、"
+            "または 'モジュール:関数' を指定してください。"
+        )
+    columns = options.pop("columns", BOOKLOG_CSV_COLUMNS)
+    if not isinstance(columns, list) or any(column not in BOOKLOG_CSV_COLUMNS for column in columns):
+        raise ValueError(f"設定エラー: 変換 '{name}' の 'columns' はCSVの列名のリストで指定してください。")
+    function, source_digest = _load_function(name, base_dir)
+    if options:
+        function = partial(function, **options)
+    return TransformStage(name, function, tuple(columns), tuple(sorted(options.items())), source_digest)
+
+
+def compile_transforms(specs, base_dir: Optional[Path] = None) -> tuple[TransformStage, ...]:
+    """
+    設定ファイルの transforms を順に変換にする。同じ名前の変換が複数ある場合は "名前#2" のように番号を付ける。
+    """
+    if specs is None:
+        return ()
+    if not isinstance(specs, list):
+        raise ValueError("設定エラー: 'transforms' は変換のリストで指定してください。")
+    stages = []
+    counts: dict[str, int] = {}
+    for spec in specs:
+        stage = compile_transform(spec, base_dir)
+        counts[stage.name] = counts.get(stage.name, 0) + 1
+        if counts[stage.name] > 1:
+            stage = replace(stage, name=f"{stage.name}#{counts[stage.name]}")
+        stages.append(stage)
+    return tuple(stages)
+
+
+class TransformPipeline:
+    """
+    convert_csvのあとに変換を順に適用し、変換ごとにかかった時間を合計する。
+    """
+
+    def __init__(self, stages: Iterable[TransformStage]):
+        self.stages = tuple(stages)
+        self.seconds: dict[str, float] = {stage.name: 0.0 for stage in self.stages}
+
+    @property
+    def columns(self) -> set[str]:
+        return {column for stage in self.stages for column in stage.columns}
+
+    def __call__(self, book: Book, row: BooklogCSVRow) -> Book:
+        seconds = self.seconds
+        for stage in self.stages:
+            started = time.perf_counter()
+            book = stage.function(book, row)
+            seconds[stage.name] += time.perf_counter() - started
+        return book
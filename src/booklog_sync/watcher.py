@@ -1,25 +1,106 @@
 import logging
 import threading
+import time
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional, Sequence
 
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 from watchdog.observers import Observer
 
-from booklog_sync.main import run_sync
+from booklog_sync.core import DEFAULT_IGNORE_PATTERNS
+from booklog_sync.defaults import AGGREGATE_FIELDS
+from booklog_sync.polling import DEFAULT_POLL_INTERVAL, CSVPoller, WatchBackend, file_digest, is_network_path
+from booklog_sync.resume import source_signature
+from booklog_sync.serve import (
+    DEFAULT_IDLE_AFTER,
+    DEFAULT_MAX_BACKOFF,
+    DEFAULT_SERVE_INTERVAL,
+    IdIndexCache,
+    backoff_delay,
+    directories_unchanged,
+    directory_mtimes,
+    memory_is_low,
+    settled_directory_mtimes,
+)
+from booklog_sync.sync import SyncStats, iter_sync, run_sync
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from booklog_sync.profiling import CPUProfiler
 
 logger = logging.getLogger(__name__)
 
 
+def _as_paths(csv_path: Path | Sequence[Path]) -> tuple[Path, ...]:
+    if isinstance(csv_path, Path):
+        return (csv_path.resolve(),)
+    return tuple(path.resolve() for path in csv_path)
+
+
+def _sync_recording_writes(
+    written: set[Path], csv_path: Path | Sequence[Path], books_path: Path, **sync_options
+) -> SyncStats:
+    """
+    run_syncと同じく同期し、ノートを作成・更新したディレクトリをwrittenに追加する。
+    孤立ノートにタグを追加した、またはアーカイブしたディレクトリと、集計ノートのディレクトリも追加する。
+    """
+    stats = SyncStats()
+    for result in iter_sync(csv_path, books_path, stats=stats, **sync_options):
+        if result.result in ("created", "updated") and result.path is not None:
+            written.add(result.path.parent)
+
+    orphan_action = sync_options.get("orphan_action")
+    if orphan_action in ("tag", "archive"):
+        written.update(path.parent for path in stats.orphan_paths)
+    if orphan_action == "archive" and stats.orphan_paths and sync_options.get("orphan_archive_path"):
+        written.add(sync_options["orphan_archive_path"])
+    aggregate_path = sync_options.get("aggregate_path")
+    if aggregate_path:
+        written.add(aggregate_path)
+        written.update(aggregate_path / key for key in sync_options.get("aggregate_by", AGGREGATE_FIELDS))
+    return stats
+
+
 class CSVSyncHandler(FileSystemEventHandler):
-    """CSVファイルの変更を検知して同期を実行するハンドラ"""
+    """CSVファイル（複数可）の変更を検知して同期を実行するハンドラ"""
 
-    def __init__(self, csv_path: Path, books_path: Path, debounce_seconds: float = 2.0):
+    def __init__(
+        self,
+        csv_path: Path | Sequence[Path],
+        books_path: Path,
+        debounce_seconds: float = 2.0,
+        profiler: Optional["CPUProfiler"] = None,
+        **sync_options,
+    ):
         super().__init__()
-        self._csv_path = csv_path.resolve()
+        self._csv_paths = _as_paths(csv_path)
         self._books_path = books_path
         self._debounce_seconds = debounce_seconds
+        self._sync_options = sync_options
+        self._profiler = profiler
         self._timer: threading.Timer | None = None
         self._lock = threading.Lock()
+        # 同期の実行中に次の同期が並行して始まらないようにするロック
+        self._sync_lock = threading.Lock()
+        self._sync_waiting = False
+        self._closed = False
+
+        # 書き込み速度を制限する場合は、書き込みを同期間で共有するスケジューラに任せ、
+        # 書き込みの完了を待たずに次のCSVの変更を受け付けられるようにする
+        self._write_scheduler = None
+        max_writes = sync_options.get("max_writes_per_second")
+        max_bytes = sync_options.get("max_write_bytes_per_second")
+        if max_writes or max_bytes:
+            from booklog_sync.throttle import WriteScheduler
+
+            self._write_scheduler = WriteScheduler(max_writes, max_bytes)
+            self._sync_options = {**sync_options, "write_scheduler": self._write_scheduler}
+
+    @property
+    def csv_paths(self) -> tuple[Path, ...]:
+        return self._csv_paths
 
     def _schedule_sync(self):
         with self._lock:
@@ -29,17 +110,61 @@ class CSVSyncHandler(FileSystemEventHandler):
             self._timer.start()
 
     def _do_sync(self):
-        logger.info("CSVファイルの変更を検知しました。同期を開始します。")
+        with self._lock:
+            # 実行待ちの同期があれば、その同期が最新のCSVを読み込むため、ここでは何もしない
+            if self._sync_waiting or self._closed:
+                return
+            self._sync_waiting = True
+
+        with self._sync_lock:
+            with self._lock:
+                self._sync_waiting = False
+            logger.info("CSVファイルの変更を検知しました。同期を開始します。")
+            self._run_sync()
+
+    def sync_now(self):
+        """
+        実行待ちの同期とまとめずに、この呼び出しの中で同期する。ほかのプロセスから依頼された同期に使う。
+        """
+        with self._sync_lock:
+            if self._closed:
+                return
+            self._run_sync()
+
+    def _sync_once(self, sync: Optional[Callable[..., SyncStats]] = None):
+        """
+        同期を1回実行する。syncを省略するとrun_syncで同期する。エラーはそのまま送出する。
+        """
+        sync = sync or run_sync
+        csv_path = self._csv_paths[0] if len(self._csv_paths) == 1 else self._csv_paths
+        if self._profiler is not None:
+            # 同期ごとにプロファイルを書き出す
+            self._profiler.run(sync, csv_path, self._books_path, **self._sync_options)
+        else:
+            sync(csv_path, self._books_path, **self._sync_options)
+
+    def _run_sync(self):
         try:
-            run_sync(self._csv_path, self._books_path)
+            self._sync_once()
             logger.info("同期が完了しました。")
         except Exception:
             logger.exception("同期中にエラーが発生しました。")
 
+    def close(self):
+        """保留中の同期を取り消し、実行中の同期と予約済みの書き込みを終えてから停止する。"""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+        with self._sync_lock:
+            pass
+        if self._write_scheduler is not None:
+            self._write_scheduler.close()
+
     def _is_target(self, event: FileSystemEvent) -> bool:
         if event.is_directory:
             return False
-        return Path(event.src_path).resolve() == self._csv_path
+        return Path(event.src_path).resolve() in self._csv_paths
 
     def on_modified(self, event: FileSystemEvent):
         if self._is_target(event):
@@ -50,24 +175,300 @@ class CSVSyncHandler(FileSystemEventHandler):
             self._schedule_sync()
 
     def on_moved(self, event: FileSystemEvent):
-        if hasattr(event, "dest_path") and Path(event.dest_path).resolve() == self._csv_path:
+        if hasattr(event, "dest_path") and Path(event.dest_path).resolve() in self._csv_paths:
             self._schedule_sync()
 
 
-def start_watching(csv_path: Path, books_path: Path, debounce_seconds: float = 2.0):
-    """CSVファイルの監視を開始し、変更時に同期を実行する。Ctrl+Cで停止。"""
-    csv_path = csv_path.resolve()
-    watch_dir = csv_path.parent
+class RestartingSyncHandler(CSVSyncHandler):
+    """
+    CSVの変更を検知すると、aiosyncのLatestSyncで同期するハンドラ。
+    同期中にCSVが更新された場合は、実行中の同期を取り消し（完了した行はジャーナルに記録される）、
+    最新のCSVで同期し直す。同期はこのハンドラが持つイベントループのスレッドで実行する。
+    """
+
+    def __init__(
+        self,
+        csv_path: Path | Sequence[Path],
+        books_path: Path,
+        debounce_seconds: float = 2.0,
+        **sync_options,
+    ):
+        # asyncioは読み込みに時間がかかるため、このハンドラを使う場合だけ読み込む
+        import asyncio
+
+        from booklog_sync.aiosync import LatestSync
+
+        super().__init__(csv_path, books_path, debounce_seconds, **sync_options)
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="booklog-sync-loop", daemon=True)
+        self._loop_thread.start()
+        csv_path = self._csv_paths[0] if len(self._csv_paths) == 1 else self._csv_paths
+        self._latest = LatestSync(csv_path, books_path, **self._sync_options)
+
+    def _do_sync(self):
+        with self._lock:
+            if self._closed:
+                return
+        logger.info("CSVファイルの変更を検知しました。同期を開始します。")
+        # 同期の完了を待たずに戻り、同期中の変更も受け付ける
+        self._run_in_loop(self._trigger())
+
+    def sync_now(self):
+        """
+        同期を始め、その同期が終わる（または新しいCSVの同期に取り消される）まで待つ。
+        """
+        with self._lock:
+            if self._closed:
+                return
+        self._run_in_loop(self._trigger()).result()
+
+    def _run_in_loop(self, coroutine) -> "Future":
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _trigger(self):
+        import asyncio
+
+        task = self._latest.trigger()
+        await asyncio.wait({task})
+        if task.cancelled():
+            # 新しいCSVで同期し直す場合は、その同期が結果を報告する
+            return
+        if task.exception() is not None:
+            logger.error("同期中にエラーが発生しました。", exc_info=task.exception())
+            return
+        logger.info("同期が完了しました。")
+
+    def close(self):
+        """保留中の同期を取り消し、実行中の同期の後始末と予約済みの書き込みを終えてから停止する。"""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+        self._run_in_loop(self._latest.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+        super().close()
+
+
+class ResidentSyncHandler(CSVSyncHandler):
+    """
+    常駐モードのハンドラ。CSVの変更の検知とほかのプロセスからの依頼に加えて、interval秒ごとに同期する。
+
+    定期的な同期の前にCSVのstat（変わっていれば内容のハッシュ）とVaultのディレクトリの更新日時を確かめ、
+    前回の同期から変わっていなければ同期を省略する。ノートの内容だけの編集はVaultの変更とみなさない。
+    同期ではIdIndexCacheの索引を使い回し、Vaultを毎回走査しない。
+    同期に失敗したあとは、backoff_delayの間隔を空けて再試行する。
+    idle_after秒以上同期していない間にメモリが不足したら、索引を破棄する（次の同期で作り直す）。
+    """
+
+    def __init__(
+        self,
+        csv_path: Path | Sequence[Path],
+        books_path: Path,
+        interval: float = DEFAULT_SERVE_INTERVAL,
+        idle_after: float = DEFAULT_IDLE_AFTER,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        debounce_seconds: float = 2.0,
+        profiler: Optional["CPUProfiler"] = None,
+        **sync_options,
+    ):
+        self.index_cache = IdIndexCache()
+        super().__init__(
+            csv_path, books_path, debounce_seconds, profiler, index_cache=self.index_cache, **sync_options
+        )
+        self.interval = interval
+        self._idle_after = idle_after
+        self._max_backoff = max_backoff
+        self._recursive = sync_options.get("recursive", False)
+        self._ignore = sync_options.get("ignore", DEFAULT_IGNORE_PATTERNS)
+        self.failures = 0
+        self.next_delay = interval
+        # 最後に成功した同期の前に記録したCSVのstatと内容のハッシュと、同期のあとに記録し直したVaultのディレクトリの更新日時
+        self._synced_source: Optional[list[dict]] = None
+        self._synced_digests: list[Optional[str]] = []
+        self._vault_mtimes: dict = {}
+        self._last_synced = time.monotonic()
+        self._stopped = threading.Event()
+
+    def _changed(self) -> bool:
+        """
+        前回の同期のあとにCSVかVaultが変わっていればTrueを返す。
+        """
+        if self._synced_source is None or not directories_unchanged(self._vault_mtimes):
+            return True
+        signature = source_signature(self._csv_paths)
+        if signature == self._synced_source:
+            return False
+        if [file_digest(path) for path in self._csv_paths] != self._synced_digests:
+            return True
+        # 次回からはstatだけで判定できるよう、新しいstatを記録しておく
+        self._synced_source = signature
+        logger.info("CSVファイルの更新日時が変わりましたが、内容が同じため同期を省略します。")
+        return False
+
+    def _run_sync(self, force: bool = False) -> bool:
+        """
+        前回の同期から変わっていれば（forceがTrueの場合と、前回の同期に失敗した場合は常に）同期する。
+        同期した場合にTrueを返す。
+        """
+        try:
+            if not force and not self.failures and not self._changed():
+                logger.debug("CSVとVaultに変更がないため、同期を省略します。")
+                return False
+            # 同期している間の変更を次回に検知できるよう、同期の前に記録する
+            signature = source_signature(self._csv_paths)
+            digests = [file_digest(path) for path in self._csv_paths]
+            vault_mtimes = directory_mtimes(self._books_path, self._recursive, self._ignore)
+            if signature != self._synced_source:
+                # ノートのitem_idをその場で書き換えてもディレクトリの更新日時は変わらず、索引が古いままになる。
+                # 古い索引で新しいCSVを同期するとノートが重複して作られるため、CSVが変わったら作り直す。
+                self.index_cache.clear()
+            written: set[Path] = set()
+            self._sync_once(partial(_sync_recording_writes, written))
+            if self._write_scheduler is not None:
+                # 予約した書き込みもディレクトリの更新日時を変えるため、書き込みが終わってから記録し直す
+                self._write_scheduler.flush()
+            # 同期自身の書き込みは次回の変更とみなさず、同期の間のほかの変更は次回に検知する
+            vault_mtimes = settled_directory_mtimes(
+                vault_mtimes, self._books_path, self._recursive, self._ignore, written
+            )
+        except Exception:
+            self.failures += 1
+            self.next_delay = backoff_delay(self.failures, self.interval, self._max_backoff)
+            logger.exception(
+                "同期中にエラーが発生しました（%d回連続）。%.0f秒後に再試行します。", self.failures, self.next_delay
+            )
+            return False
+
+        self.failures = 0
+        self.next_delay = self.interval
+        self._synced_source = signature
+        self._synced_digests = digests
+        self._vault_mtimes = vault_mtimes
+        self._last_synced = time.monotonic()
+        logger.info("同期が完了しました。")
+        return True
+
+    def sync_now(self):
+        """
+        ほかのプロセスから依頼された同期は、変更がなくても実行する。
+        """
+        with self._sync_lock:
+            if self._closed:
+                return
+            self._run_sync(force=True)
+
+    def tick(self) -> bool:
+        """
+        定期的な同期を1回分行う。同期した場合にTrueを返す。
+        """
+        with self._sync_lock:
+            if self._closed:
+                return False
+            if self._run_sync():
+                return True
+            self._drop_caches_if_idle()
+            return False
+
+    def _drop_caches_if_idle(self):
+        if not self.index_cache.loaded or time.monotonic() - self._last_synced < self._idle_after:
+            return
+        if memory_is_low():
+            self.index_cache.clear()
+            logger.info("メモリが不足しているため、Vaultの索引を破棄しました。次の同期で作り直します。")
+
+    def serve_forever(self):
+        """
+        stopが呼ばれるまで、next_delay秒ごとにtickを呼び出す。
+        """
+        while not self._stopped.wait(self.next_delay):
+            self.tick()
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        self.stop()
+        super().close()
+        self.index_cache.clear()
+
 
-    if not watch_dir.is_dir():
-        raise FileNotFoundError(f"監視対象のディレクトリが存在しません: {watch_dir}")
+def select_backend(backend: WatchBackend, watch_dirs: Sequence[Path]) -> WatchBackend:
+    """
+    backendが"auto"の場合、監視するディレクトリにネットワークドライブがあればpolling、なければnativeを返す。
+    """
+    if backend != "auto":
+        return backend
+    return "polling" if any(is_network_path(watch_dir) for watch_dir in watch_dirs) else "native"
+
+
+def create_observer(
+    handler: CSVSyncHandler,
+    backend: WatchBackend = "auto",
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> Observer | CSVPoller:
+    """
+    handlerのCSVファイルを監視するスレッドを作成する。start、stop、joinで操作する。
+    """
+    csv_paths = handler.csv_paths
+    watch_dirs = list(dict.fromkeys(path.parent for path in csv_paths))
+    if select_backend(backend, watch_dirs) == "polling":
+        # 書き込みが終わったかはポーリング側で判定するため、デバウンスせずに同期する
+        logger.info("ポーリングで監視します（%.1f秒間隔）。", poll_interval)
+        return CSVPoller(csv_paths, handler._do_sync, poll_interval)
 
-    handler = CSVSyncHandler(csv_path, books_path, debounce_seconds)
     observer = Observer()
-    observer.schedule(handler, str(watch_dir), recursive=False)
+    for watch_dir in watch_dirs:
+        observer.schedule(handler, str(watch_dir), recursive=False)
+    return observer
+
+
+def start_watching(
+    csv_path: Path | Sequence[Path],
+    books_path: Path,
+    debounce_seconds: float = 2.0,
+    backend: WatchBackend = "auto",
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    handoff_file: Path | None = None,
+    profiler: Optional["CPUProfiler"] = None,
+    restart_on_change: bool = False,
+    **sync_options,
+):
+    """
+    CSVファイル（複数可）の監視を開始し、変更時に同期を実行する。Ctrl+Cで停止。
+    backendが"polling"の場合はファイル変更通知を使わず、poll_interval秒ごとにCSVのstatを確認する。
+    handoff_fileを指定すると、ほかのプロセスがそのファイルで依頼した同期も実行する（VaultLockを参照）。
+    profilerを指定すると、同期ごとにCPUプロファイルを書き出す。
+    restart_on_changeがTrueの場合は、同期中にCSVが更新されたら実行中の同期を取り消し、
+    最新のCSVで同期し直す（RestartingSyncHandlerを参照）。この場合profilerは使えない。
+    sync_optionsはそのままrun_syncに渡される。
+    """
+    csv_paths = _as_paths(csv_path)
+    watch_dirs = list(dict.fromkeys(path.parent for path in csv_paths))
+
+    for watch_dir in watch_dirs:
+        if not watch_dir.is_dir():
+            raise FileNotFoundError(f"監視対象のディレクトリが存在しません: {watch_dir}")
+
+    if restart_on_change:
+        if profiler is not None:
+            raise ValueError("profilerとrestart_on_changeは同時に指定できません。")
+        handler = RestartingSyncHandler(csv_paths, books_path, debounce_seconds, **sync_options)
+    else:
+        handler = CSVSyncHandler(csv_paths, books_path, debounce_seconds, profiler, **sync_options)
+    observer = create_observer(handler, backend, poll_interval)
     observer.start()
+    listener = None
+    if handoff_file is not None:
+        from booklog_sync.lock import HandoffListener
+
+        listener = HandoffListener(handoff_file, handler.sync_now)
+        listener.start()
 
-    logger.info("CSVファイルの監視を開始しました: %s", csv_path)
+    logger.info("CSVファイルの監視を開始しました: %s", ", ".join(map(str, csv_paths)))
     logger.info("停止するには Ctrl+C を押してください。")
 
     try:
@@ -76,3 +477,59 @@ def start_watching(csv_path: Path, books_path: Path, debounce_seconds: float = 2
         logger.info("監視を停止します。")
         observer.stop()
     observer.join()
+    if listener is not None:
+        listener.stop()
+        listener.join()
+    handler.close()
+
+
+def start_serving(
+    csv_path: Path | Sequence[Path],
+    books_path: Path,
+    interval: float = DEFAULT_SERVE_INTERVAL,
+    idle_after: float = DEFAULT_IDLE_AFTER,
+    max_backoff: float = DEFAULT_MAX_BACKOFF,
+    debounce_seconds: float = 2.0,
+    backend: WatchBackend = "auto",
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    handoff_file: Path | None = None,
+    profiler: Optional["CPUProfiler"] = None,
+    **sync_options,
+):
+    """
+    常駐モードを開始する。最初に同期してから、CSVファイル（複数可）の監視、ほかのプロセスから依頼された同期、
+    interval秒ごとの同期を1つのプロセスで行う（ResidentSyncHandlerを参照）。Ctrl+Cで停止。
+    同期に失敗しても終了せず、間隔を空けて再試行する。その他の引数はstart_watchingと同じ。
+    """
+    csv_paths = _as_paths(csv_path)
+    for watch_dir in dict.fromkeys(path.parent for path in csv_paths):
+        if not watch_dir.is_dir():
+            raise FileNotFoundError(f"監視対象のディレクトリが存在しません: {watch_dir}")
+
+    handler = ResidentSyncHandler(
+        csv_paths, books_path, interval, idle_after, max_backoff, debounce_seconds, profiler, **sync_options
+    )
+    # 初回同期
+    handler.tick()
+    observer = create_observer(handler, backend, poll_interval)
+    observer.start()
+    listener = None
+    if handoff_file is not None:
+        from booklog_sync.lock import HandoffListener
+
+        listener = HandoffListener(handoff_file, handler.sync_now)
+        listener.start()
+
+    logger.info("常駐モードを開始しました（%.0f秒ごとに同期）: %s", interval, ", ".join(map(str, csv_paths)))
+    logger.info("停止するには Ctrl+C を押してください。")
+
+    try:
+        handler.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("常駐モードを停止します。")
+    observer.stop()
+    observer.join()
+    if listener is not None:
+        listener.stop()
+        listener.join()
+    handler.close()
@@ -0,0 +1,55 @@
+from conftest import create_booklog_csv_row
+
+from booklog_sync.adopt import build_vault_index, normalize_title_key
+
+
+def test_normalize_title_key():
+    assert normalize_title_key("村上 春樹", "ノルウェイの森（上）") == normalize_title_key(
+        "村上春樹", "ﾉﾙｳｪｲの森(上)"
+    )
+    assert normalize_title_key("Author", "Title") == normalize_title_key("author", "ＴＩＴＬＥ")
+    assert normalize_title_key("著者", "") is None
+
+
+def test_build_vault_index_secondary_indexes(tmp_path):
+    books_dir = tmp_path / "Books"
+    books_dir.mkdir()
+    indexed = books_dir / "Indexed.md"
+    indexed.write_text("---\nitem_id: '1000000000'\nisbn13: '9784000000001'\n---\n", encoding="utf-8")
+    by_isbn = books_dir / "ByIsbn.md"
+    by_isbn.write_text("---\nisbn13: '9784000000002'\ntitle: 別のタイトル\n---\n", encoding="utf-8")
+    by_title = books_dir / "ByTitle.md"
+    by_title.write_text("---\ntitle: 'テスト タイトル'\nauthor: テスト作者名\n---\n", encoding="utf-8")
+
+    index = build_vault_index(books_dir)
+
+    assert index.by_id == {"1000000000": indexed}
+    assert index.by_isbn == {"9784000000002": by_isbn}
+    assert index.by_title[normalize_title_key("テスト作者名", "テストタイトル")] == by_title
+    assert "9784000000001" not in index.by_isbn
+
+
+def test_find_adoptable_prefers_isbn_and_claims_once(tmp_path):
+    books_dir = tmp_path / "Books"
+    books_dir.mkdir()
+    by_isbn = books_dir / "ByIsbn.md"
+    by_isbn.write_text("---\nisbn13: '9784000000001'\n---\n", encoding="utf-8")
+    by_title = books_dir / "ByTitle.md"
+    by_title.write_text("---\ntitle: テストタイトル\nauthor: テスト作者名\n---\n", encoding="utf-8")
+    index = build_vault_index(books_dir)
+    row = create_booklog_csv_row()
+
+    assert index.find_adoptable(row) == by_isbn
+    # ISBNのノートは取り込み済みのため、同じ行では2度目は見つからない
+    assert index.find_adoptable(row) is None
+    assert index.find_adoptable(create_booklog_csv_row({"isbn13": ""})) == by_title
+
+
+def test_find_adoptable_ambiguous_title(tmp_path):
+    books_dir = tmp_path / "Books"
+    books_dir.mkdir()
+    for name in ["A.md", "B.md"]:
+        (books_dir / name).write_text("---\ntitle: テストタイトル\nauthor: テスト作者名\n---\n", encoding="utf-8")
+    index = build_vault_index(books_dir)
+
+    assert index.find_adoptable(create_booklog_csv_row({"isbn13": ""})) is None
@@ -0,0 +1,111 @@
+import json
+
+from conftest import create_book
+
+from booklog_sync.aggregates import AggregateIndex
+from booklog_sync.core import save_book
+
+
+def _index(tmp_path, by=("status", "rating", "author")):
+    return AggregateIndex(tmp_path / "state" / "aggregates.json", tmp_path / "Index", by)
+
+
+def test_aggregate_index_applies_changes_to_affected_groups_only(tmp_path):
+    aggregates = _index(tmp_path)
+    aggregates.add_book("1", tmp_path / "本A.md", create_book({"item_id": "1", "status": "積読"}))
+    aggregates.add_book("2", tmp_path / "本B.md", create_book({"item_id": "2", "author": "別の著者"}))
+    assert aggregates.flush() == 5
+
+    aggregates.apply_changes("1", tmp_path / "本A.md", {"status": ("積読", "読み終わった")})
+    assert aggregates.flush() == 1
+
+    assert not (tmp_path / "Index" / "status" / "積読.md").exists()
+    content = (tmp_path / "Index" / "status" / "読み終わった.md").read_text(encoding="utf-8")
+    assert content == (
+        "---\naggregate: status\nvalue: 読み終わった\ncount: 2\n---\n# 読み終わった\n\n- [[本A]]\n- [[本B]]\n"
+    )
+    assert (tmp_path / "Index" / "rating" / "5.md").exists()
+    assert (tmp_path / "Index" / "author" / "テスト作者名.md").exists()
+
+
+def test_aggregate_index_flush_without_changes_writes_nothing(tmp_path):
+    aggregates = _index(tmp_path)
+    assert aggregates.flush() == 0
+    assert not (tmp_path / "state").exists()
+
+    aggregates.apply_changes("1", tmp_path / "本A.md", {"title": ("旧", "新")})
+    assert aggregates.flush() == 0
+
+
+def test_aggregate_index_persists_state(tmp_path):
+    aggregates = _index(tmp_path)
+    aggregates.add_book("1", tmp_path / "本A.md", create_book({"item_id": "1"}))
+    aggregates.flush()
+
+    reloaded = _index(tmp_path)
+    assert reloaded.loaded
+    reloaded.apply_changes("1", tmp_path / "本A.md", {"rating": (5, 3)})
+    reloaded.flush()
+    assert not (tmp_path / "Index" / "rating" / "5.md").exists()
+
+    # 変更のあったグループだけを追記し、読み込むときに反映する
+    state = json.loads((tmp_path / "state" / "aggregates.json").read_text(encoding="utf-8"))
+    assert state["groups"]["rating"] == {"5": {"1": "本A"}}
+    log = (tmp_path / "state" / "aggregates.json.log").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in log] == [["rating", "3", {"1": "本A"}], ["rating", "5", None]]
+
+    again = _index(tmp_path)
+    assert again.loaded
+    assert "- [[本A]]\n" in again.render("rating", "3")
+    again.remove_books(["1"])
+    again.flush()
+    assert not (tmp_path / "Index" / "rating" / "3.md").exists()
+
+    # 追記した行がグループの数を超えたら、まとめて保存し直す
+    assert not (tmp_path / "state" / "aggregates.json.log").exists()
+    state = json.loads((tmp_path / "state" / "aggregates.json").read_text(encoding="utf-8"))
+    assert state["groups"] == {"status": {}, "rating": {}, "author": {}}
+
+
+def test_aggregate_index_rebuilds_when_settings_change_or_state_is_dirty(tmp_path):
+    aggregates = _index(tmp_path)
+    aggregates.add_book("1", tmp_path / "本A.md", create_book({"item_id": "1"}))
+    aggregates.flush()
+
+    assert not _index(tmp_path, by=("status",)).loaded
+
+    # 差分を反映したまま保存されずに終了した状態
+    interrupted = _index(tmp_path)
+    interrupted.apply_changes("1", tmp_path / "本A.md", {"status": ("読み終わった", "積読")})
+    assert not _index(tmp_path).loaded
+
+
+def test_aggregate_index_uses_state_when_old_value_differs(tmp_path):
+    aggregates = _index(tmp_path, by=("status",))
+    aggregates.add_book("1", tmp_path / "本A.md", create_book({"item_id": "1", "status": "積読"}))
+
+    # 前回の同期のあとにノートのstatusが手で書き換えられていた場合
+    aggregates.apply_changes("1", tmp_path / "本A.md", {"status": ("いま読んでる", "読み終わった")})
+    aggregates.flush()
+
+    assert not (tmp_path / "Index" / "status" / "積読.md").exists()
+    assert (tmp_path / "Index" / "status" / "読み終わった.md").exists()
+
+
+def test_aggregate_index_rebuild_from_vault(tmp_path):
+    books_path = tmp_path / "Books"
+    save_book(books_path, create_book({"item_id": "1", "title": "本A"}))
+    save_book(books_path, create_book({"item_id": "2", "title": "本B", "status": "積読", "rating": None}))
+    (books_path / "メモ.md").write_text("---\nstatus: 積読\n---\n", encoding="utf-8")
+
+    aggregates = _index(tmp_path)
+    aggregates.rebuild(books_path)
+    aggregates.flush()
+
+    content = (tmp_path / "Index" / "status" / "積読.md").read_text(encoding="utf-8")
+    assert "count: 1\n" in content
+    assert "- [[テスト作者名『本B』（テスト出版社、2020）]]\n" in content
+    assert sorted(path.name for path in (tmp_path / "Index" / "rating").iterdir()) == ["5.md"]
+    aggregates.remove_books(["1"])
+    aggregates.flush()
+    assert not (tmp_path / "Index" / "rating" / "5.md").exists()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from conftest import create_book
+
+from booklog_sync.aiosync import LatestSync, iter_sync_async, run_sync_async
+from booklog_sync.core import save_book
+from booklog_sync.sync import iter_sync
+
+
+def _write_csv(csv_file: Path, rows: int, status: str = "読み終わった"):
+    lines = [
+        f"1,{1000000000 + i},{9784000000000 + i},...,{i % 5 + 1},{status if i % 3 else '積読'},"
+        f"...,...,...,...,...,本{i},著者{i % 7},出版社,2020,..."
+        for i in range(rows)
+    ]
+    # item_idが違っても同じファイル名になる行
+    lines.append("1,1999999999,9784999999999,...,5,読み終わった,...,...,...,...,...,本0,著者0,出版社,2020,...")
+    csv_file.write_text("\n".join(lines), encoding="cp932")
+
+
+def _prepare_vault(tmp_path: Path) -> Path:
+    books_path = tmp_path / "Vault" / "Books"
+    for i in range(0, 120, 2):
+        save_book(
+            books_path,
+            create_book(
+                {
+                    "item_id": str(1000000000 + i),
+                    "title": f"本{i}",
+                    "author": f"著者{i % 7}",
+                    "isbn13": str(9784000000000 + i),
+                    "publisher": "出版社",
+                    "status": "いま読んでる",
+                    "rating": i % 5 + 1,
+                }
+            ),
+        )
+    return books_path
+
+
+def _snapshot(root: Path) -> dict[str, str]:
+    return {
+        str(path.relative_to(root)): path.read_text(encoding="utf-8")
+        for path in sorted(root.rglob("*"))
+        if path.is_file() and path.suffix in (".md", ".jsonl")
+    }
+
+
+def _comparable(results, root: Path):
+    return [
+        (result.item_id, result.path.relative_to(root), result.result, result.changed_fields, result.adopted)
+        for result in results
+    ]
+
+
+def test_iter_sync_async_matches_sync_engine(tmp_path):
+    _prepare_vault(tmp_path / "sync")
+    shutil.copytree(tmp_path / "sync", tmp_path / "async")
+    _write_csv(tmp_path / "test.csv", 200)
+
+    def options(root: Path):
+        return {
+            "aggregate_path": root / "Vault" / "Index",
+            "change_journal": root / "changes.jsonl",
+            "checkpoint_interval": 7,
+        }
+
+    sync_results = list(iter_sync(tmp_path / "test.csv", tmp_path / "sync" / "Vault" / "Books", **options(tmp_path / "sync")))
+
+    async def collect():
+        return [
+            result
+            async for result in iter_sync_async(
+                tmp_path / "test.csv", tmp_path / "async" / "Vault" / "Books", 4, **options(tmp_path / "async")
+            )
+        ]
+
+    async_results = asyncio.run(collect())
+
+    assert _comparable(async_results, tmp_path / "async") == _comparable(sync_results, tmp_path / "sync")
+
+    def strip_time(snapshot):
+        journal = [json.loads(line) for line in snapshot.pop("changes.jsonl").splitlines()]
+        return snapshot, [{**entry, "time": None, "path": Path(entry["path"]).name} for entry in journal]
+
+    assert strip_time(_snapshot(tmp_path / "async")) == strip_time(_snapshot(tmp_path / "sync"))
+
+
+def _slow_save_book(*args, **kwargs):
+    time.sleep(0.005)
+    return save_book(*args, **kwargs)
+
+
+def test_iter_sync_async_records_completed_rows_when_stopped_early(tmp_path):
+    books_path = tmp_path / "Vault" / "Books"
+    _write_csv(tmp_path / "test.csv", 100)
+
+    async def stop_early():
+        results = iter_sync_async(tmp_path / "test.csv", books_path, 4, checkpoint_interval=10)
+        async for result in results:
+            if result.item_id == "1000000019":
+                break
+        await results.aclose()
+
+    with patch("booklog_sync.sync.save_book", side_effect=_slow_save_book):
+        asyncio.run(stop_early())
+
+    created = len(list(books_path.glob("*.md")))
+    assert 20 <= created < 100
+
+    stats = asyncio.run(run_sync_async(tmp_path / "test.csv", books_path, checkpoint_interval=10))
+    assert stats.completed
+    assert stats.resumed >= 20
+    assert len(list(books_path.glob("*.md"))) == 100
+
+
+def test_latest_sync_cancels_running_sync(tmp_path):
+    books_path = tmp_path / "Vault" / "Books"
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, 100)
+
+    async def resync():
+        latest = LatestSync(csv_file, books_path, concurrency=2)
+        first = latest.trigger()
+        await asyncio.sleep(0.05)
+        _write_csv(csv_file, 100, status="読みたい")
+        second = latest.trigger()
+        stats = await second
+        return first, stats
+
+    with patch("booklog_sync.sync.save_book", side_effect=_slow_save_book):
+        first, stats = asyncio.run(resync())
+
+    assert first.cancelled()
+    assert stats.completed
+    assert stats.resumed == 0
+    notes = [path.read_text(encoding="utf-8") for path in books_path.glob("*.md")]
+    assert len(notes) == 100
+    assert sum("status: 読みたい\n" in note for note in notes) == 66
@@ -0,0 +1,40 @@
+import json
+
+from booklog_sync.changelog import ChangeJournal
+
+
+def test_change_journal_records_each_field(tmp_path):
+    journal_path = tmp_path / "changes.jsonl"
+    journal = ChangeJournal(journal_path)
+
+    journal.record("1000000000", tmp_path / "Book.md", {"rating": (5, 3), "status": ("積読", "読み終わった")})
+    journal.flush()
+
+    entries = [json.loads(line) for line in journal_path.read_text(encoding="utf-8").splitlines()]
+    assert [(e["item_id"], e["field"], e["old"], e["new"]) for e in entries] == [
+        ("1000000000", "rating", 5, 3),
+        ("1000000000", "status", "積読", "読み終わった"),
+    ]
+    assert entries[0]["path"] == str(tmp_path / "Book.md")
+    assert journal.recorded == 2
+
+
+def test_change_journal_writes_in_batches(tmp_path):
+    journal_path = tmp_path / "changes.jsonl"
+    journal = ChangeJournal(journal_path, batch_size=3)
+
+    journal.record("1", tmp_path / "1.md", {"rating": (1, 2)})
+    journal.record("2", tmp_path / "2.md", {"rating": (1, 2)})
+    assert not journal_path.exists()
+
+    journal.record("3", tmp_path / "3.md", {"rating": (1, 2)})
+    assert len(journal_path.read_text(encoding="utf-8").splitlines()) == 3
+
+
+def test_change_journal_flush_without_changes(tmp_path):
+    journal_path = tmp_path / "changes.jsonl"
+
+    ChangeJournal(journal_path).flush()
+
+    assert not journal_path.exists()
+
@@ -0,0 +1,89 @@
+import json
+
+from conftest import create_book
+
+from booklog_sync.check import VaultIssue, check_vault
+from booklog_sync.core import build_id_book_index, save_book
+
+
+def _check(books_path, **options):
+    issues = []
+    stats = check_vault(books_path, issues.append, **options)
+    return issues, stats
+
+
+def test_check_vault_without_issues(tmp_path):
+    save_book(tmp_path, create_book())
+    save_book(tmp_path, create_book({"item_id": "2000000000", "title": "別の本"}))
+    (tmp_path / "メモ.md").write_text("本のメモ\n", encoding="utf-8")
+
+    issues, stats = _check(tmp_path)
+
+    assert issues == []
+    assert (stats.notes, stats.indexed, stats.total) == (3, 2, 0)
+
+
+def test_check_vault_reports_duplicates_other_than_note_used_by_sync(tmp_path):
+    saved = save_book(tmp_path, create_book())
+    duplicate = tmp_path / "sub" / saved.path.name
+    duplicate.parent.mkdir()
+    duplicate.write_text(saved.path.read_text(encoding="utf-8"), encoding="utf-8")
+
+    # 外部ソートのランが複数になる場合も、走査の順を保って重複を見つける
+    issues, stats = _check(tmp_path, recursive=True, chunk_size=1)
+
+    used = build_id_book_index(tmp_path, recursive=True)["1000000000"]
+    (issue,) = issues
+    assert issue.kind == "duplicate_item_id"
+    assert issue.item_id == "1000000000"
+    assert issue.detail == str(used)
+    assert {issue.path, used} == {saved.path, duplicate}
+    assert stats.issues == {"duplicate_item_id": 1}
+
+
+def test_check_vault_reports_unparsable_frontmatter(tmp_path):
+    (tmp_path / "broken.md").write_text("---\nitem_id: '1'\ntitle: [unclosed\n---\n", encoding="utf-8")
+    (tmp_path / "unterminated.md").write_text("---\nitem_id: '2'\ntitle: t\n本文\n", encoding="utf-8")
+    (tmp_path / "list.md").write_text("---\nitem_id: '3'\n- a\n---\n", encoding="utf-8")
+    (tmp_path / "binary.md").write_bytes(b"\xff\xfe---\n")
+    # item_idを持たないノートは同期の対象ではないため調べない
+    (tmp_path / "other.md").write_text("---\ntitle: [unclosed\n---\n", encoding="utf-8")
+
+    issues, _ = _check(tmp_path)
+
+    found = {issue.path.name: (issue.item_id, issue.detail) for issue in issues}
+    assert set(found) == {"broken.md", "unterminated.md", "list.md", "binary.md"}
+    assert found["unterminated.md"] == ("2", "closing '---' not found")
+    assert found["binary.md"] == (None, "not UTF-8")
+    assert found["broken.md"][0] == "1"
+    assert "line" in found["broken.md"][1]
+    assert all(issue.kind == "unparsable_frontmatter" for issue in issues)
+
+
+def test_check_vault_reports_filename_drift_and_long_names(tmp_path):
+    saved = save_book(tmp_path, create_book())
+    renamed = saved.path.with_name("改名したノート.md")
+    saved.path.rename(renamed)
+    long_name = tmp_path / f"{'長' * 70}.md"
+    long_name.write_text("メモ\n", encoding="utf-8")
+
+    issues, stats = _check(tmp_path)
+
+    assert VaultIssue("filename_drift", renamed, "1000000000", saved.path.name) in issues
+    assert VaultIssue("name_too_long", long_name, detail="213 bytes") in issues
+    assert stats.issues == {"filename_drift": 1, "name_too_long": 1}
+
+    issues, stats = _check(tmp_path, kinds=["name_too_long"])
+    assert [issue.kind for issue in issues] == ["name_too_long"]
+
+
+def test_vault_issue_output_formats(tmp_path):
+    issue = VaultIssue("filename_drift", tmp_path / "a.md", "1000000000", "b.md")
+
+    assert json.loads(issue.to_json()) == {
+        "kind": "filename_drift",
+        "path": str(tmp_path / "a.md"),
+        "item_id": "1000000000",
+        "detail": "b.md",
+    }
+    assert str(issue) == f"[ファイル名のずれ] {tmp_path / 'a.md'} (item_id: 1000000000): b.md"
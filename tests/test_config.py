@@ -35,3 +35,355 @@ def test_load_config_without_books_path(tmp_path):
 
     with pytest.raises(ValueError, match="books_path"):
         load_config(config_file)
+
+
+def test_load_config_with_body_template(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nbody_template: 'template.md'",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.body_template == Path("template.md")
+
+
+def test_load_config_without_body_template(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.body_template is None
+
+
+def test_load_config_with_fields(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "fields: [item_id, title, author, publisher, publish_year, review, tags]",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.fields == ("item_id", "title", "author", "publisher", "publish_year", "review", "tags")
+
+
+def test_load_config_with_unknown_field(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "fields: [item_id, title, author, publisher, publish_year, unknown]",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="unknown"):
+        load_config(config_file)
+
+
+def test_load_config_fields_without_required_field(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nfields: [title, author, publisher, publish_year]",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="item_id"):
+        load_config(config_file)
+
+
+def test_load_config_with_orphan_archive(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "orphan_action: archive\norphan_archive_path: 'MyVault/Archive'",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.orphan_action == "archive"
+    assert config.orphan_archive_path == Path("MyVault/Archive")
+
+
+def test_load_config_orphan_archive_without_path(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\norphan_action: archive",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="orphan_archive_path"):
+        load_config(config_file)
+
+
+def test_load_config_invalid_orphan_action(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\norphan_action: delete",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="orphan_action"):
+        load_config(config_file)
+
+
+def test_load_config_with_write_rate_limit(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "max_writes_per_second: 20\nmax_write_bytes_per_second: 500000",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.max_writes_per_second == 20
+    assert config.max_write_bytes_per_second == 500000
+
+
+def test_load_config_invalid_write_rate_limit(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nmax_writes_per_second: 0",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="max_writes_per_second"):
+        load_config(config_file)
+
+
+def test_load_config_sharded_layout_enables_recursive(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nlayout: author_initial",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.layout == "author_initial"
+    assert config.recursive is True
+
+
+def test_load_config_sharded_layout_without_recursive(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nlayout: publish_year\nrecursive: false",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="recursive"):
+        load_config(config_file)
+
+
+def test_load_config_with_multiple_csv_paths(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: ['a.csv', 'b.csv']\nbooks_path: 'MyVault/Books'\nmerge_policy: latest_finished",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.csv_path == (Path("a.csv"), Path("b.csv"))
+    assert config.merge_policy == "latest_finished"
+
+
+def test_load_config_adopt_yaml_boolean(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nadopt: on",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.adopt == "on"
+
+
+def test_load_config_watch_backend(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nwatch_backend: polling\npoll_interval: 30",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.watch_options() == {"backend": "polling", "poll_interval": 30.0}
+
+
+def test_load_config_invalid_watch_backend(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nwatch_backend: inotify",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="'watch_backend' は auto, native, polling のいずれか"):
+        load_config(config_file)
+
+
+def test_load_config_watch_restart_on_change(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nwatch_restart_on_change: true",
+        encoding="utf-8",
+    )
+    assert load_config(config_file).watch_restart_on_change
+
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nwatch_restart_on_change: 'yes'",
+        encoding="utf-8",
+    )
+    with pytest.raises(ValueError, match="'watch_restart_on_change' は true または false"):
+        load_config(config_file)
+
+
+def test_load_config_serve(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nserve_interval: 60\nserve_idle_after: 0",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.serve_options() == {"interval": 60.0, "idle_after": 0.0, "max_backoff": 3600.0}
+    assert "serve_interval" not in config.sync_options()
+
+    config_file.write_text("csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nserve_interval: 0", encoding="utf-8")
+    with pytest.raises(ValueError, match="'serve_interval' は正の数"):
+        load_config(config_file)
+
+
+def test_load_config_snapshot_keep(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nsnapshot_keep: 0", encoding="utf-8")
+
+    config = load_config(config_file)
+    assert config.sync_options()["snapshot_keep"] == 0
+
+    config_file.write_text("csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nsnapshot_keep: -1", encoding="utf-8")
+    with pytest.raises(ValueError, match="'snapshot_keep' は0以上の整数"):
+        load_config(config_file)
+
+
+@pytest.mark.parametrize("value", ["-1", "true", "1.5"])
+def test_load_config_rejects_invalid_checkpoint_interval(tmp_path, value):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        f"csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\ncheckpoint_interval: {value}", encoding="utf-8"
+    )
+    with pytest.raises(ValueError, match="'checkpoint_interval' は0以上の整数"):
+        load_config(config_file)
+
+
+def test_load_config_lock(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nlock: fail\nlock_timeout: 60",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.lock_mode == "fail"
+    assert config.lock_timeout == 60.0
+    assert "lock_mode" not in config.sync_options()
+
+
+def test_load_config_invalid_lock(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nlock: skip",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="'lock' は wait, fail, handoff のいずれか"):
+        load_config(config_file)
+
+
+def test_load_config_sort_merge_join(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\njoin: sort_merge\nsort_memory_mb: 128",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.sync_options()["join"] == "sort_merge"
+    assert config.sync_options()["sort_memory_mb"] == 128
+
+
+def test_load_config_sort_merge_join_with_adopt(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\njoin: sort_merge\nadopt: report",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="'adopt' は指定できません"):
+        load_config(config_file)
+
+
+def test_load_config_filters(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "filters:\n"
+        "  since: 2026-10-01\n"
+        "  finished_at: {from: 2026-01-01}\n"
+        "  status: [読み終わった, いま読んでる]\n"
+        "  service_id: 1\n",
+        encoding="utf-8",
+    )
+
+    row_filter = load_config(config_file).row_filter
+    assert row_filter.since == "2026-10-01"
+    assert (row_filter.finished_from, row_filter.finished_to) == ("2026-01-01", None)
+    assert row_filter.statuses == ("読み終わった", "いま読んでる")
+    assert row_filter.service_ids == ("1",)
+
+
+def test_load_config_unknown_filter(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\nfilters:\n  rating: 5\n",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="'filters' の 'rating' は不明です"):
+        load_config(config_file)
+
+
+def test_load_config_aggregates(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "fields: [item_id, title, author, publisher, publish_year, status]\n"
+        "aggregate_path: 'MyVault/Index'\n",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert config.aggregate_path == Path("MyVault/Index")
+    assert config.aggregate_by == ("status", "author")
+
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "fields: [item_id, title, author, publisher, publish_year]\n"
+        "aggregate_path: 'MyVault/Index'\naggregate_by: [rating]\n",
+        encoding="utf-8",
+    )
+    with pytest.raises(ValueError, match="'aggregate_by' の 'rating' は 'fields' にも指定してください"):
+        load_config(config_file)
+
+
+def test_load_config_transforms(tmp_path):
+    (tmp_path / "my_transforms.py").write_text("def noop(book, row):\n    return book\n", encoding="utf-8")
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        "csv_path: 'data.csv'\nbooks_path: 'MyVault/Books'\n"
+        "transforms:\n  - split_tags\n  - {name: category_tag, prefix: 'genre/'}\n  - my_transforms.py:noop\n",
+        encoding="utf-8",
+    )
+
+    config = load_config(config_file)
+    assert [stage.name for stage in config.transforms] == ["split_tags", "category_tag", "my_transforms.py:noop"]
+    assert config.sync_options()["transforms"] == config.transforms
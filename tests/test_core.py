@@ -1,3 +1,5 @@
+import os
+
 from conftest import create_book, create_booklog_csv_row
 
 from booklog_sync.core import (
@@ -6,7 +8,15 @@ from booklog_sync.core import (
     convert_csv,
     diff_frontmatter,
     generate_filename,
+    iter_markdown_files,
+    read_booklog_csv,
+    read_frontmatter_text,
+    read_text_versioned,
+    save_book,
     save_book_to_markdown,
+    shard_directory,
+    write_if_unchanged,
+    write_text_atomic,
 )
 
 
@@ -40,6 +50,52 @@ def test_convert_row_to_properties_without_rating():
     assert book["rating"] is None
 
 
+def test_convert_row_with_selected_fields():
+    row = create_booklog_csv_row(
+        {"review": "面白かった", "tags": "小説,SF", "page_count": "320", "book_type": "単行本"}
+    )
+
+    book = convert_csv(row, ["item_id", "title", "review", "tags", "page_count", "book_type"])
+
+    assert book == {
+        "item_id": "1000000000",
+        "title": "テストタイトル",
+        "review": "面白かった",
+        "tags": "小説,SF",
+        "page_count": 320,
+        "book_type": "単行本",
+    }
+
+
+def test_read_booklog_csv_projects_columns(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "1,1000000000,9784000000001,本,5,読み終わった,面白かった,小説,メモ,2020-01-01,2020-02-01,テストタイトル,テスト作者名,テスト出版社,2020,単行本,320\n"
+        "\n"
+        "1,2000000000,9784000000002,本,4,積読",
+        encoding="cp932",
+    )
+
+    rows = list(read_booklog_csv(csv_file, ["title", "item_id", "review"]))
+
+    assert rows == [
+        {"item_id": "1000000000", "review": "面白かった", "title": "テストタイトル"},
+        {"item_id": "2000000000", "review": None, "title": None},
+    ]
+
+
+def test_read_booklog_csv_multiline_field(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        '1,1000000000,9784000000001,本,5,読み終わった,"1行目\n2行目",小説\n',
+        encoding="cp932",
+    )
+
+    rows = list(read_booklog_csv(csv_file, ["item_id", "review"]))
+
+    assert rows == [{"item_id": "1000000000", "review": "1行目\n2行目"}]
+
+
 def test_save_book_to_markdown(tmp_path):
     books_path = tmp_path / "MyVault" / "Books"
     book = create_book()
@@ -394,3 +450,151 @@ def test_build_id_book_index_when_item_id_is_not_a_number(tmp_path):
     assert index["B0D143YRBP"] == file1
     assert "B0D143YRBP" in index
     assert len(index) == 1
+
+
+def test_write_text_atomic(tmp_path):
+    file_path = tmp_path / "Book.md"
+    file_path.write_text("old", encoding="utf-8")
+
+    write_text_atomic(file_path, "new")
+
+    assert file_path.read_text(encoding="utf-8") == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["Book.md"]
+
+
+def test_iter_markdown_files_recursive_with_ignore(tmp_path):
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "nested").mkdir()
+    (tmp_path / ".obsidian").mkdir()
+    (tmp_path / "attachments").mkdir()
+    (tmp_path / "top.md").touch()
+    (tmp_path / "A" / "a.md").touch()
+    (tmp_path / "A" / "nested" / "b.md").touch()
+    (tmp_path / "A" / "image.png").touch()
+    (tmp_path / ".obsidian" / "workspace.md").touch()
+    (tmp_path / "attachments" / "c.md").touch()
+    (tmp_path / ".top.md.tmp").touch()
+
+    flat = {p.relative_to(tmp_path).as_posix() for p in iter_markdown_files(tmp_path)}
+    recursive = {
+        p.relative_to(tmp_path).as_posix() for p in iter_markdown_files(tmp_path, recursive=True)
+    }
+
+    assert flat == {"top.md"}
+    assert recursive == {"top.md", "A/a.md", "A/nested/b.md"}
+
+
+def test_build_id_book_index_recursive(tmp_path):
+    books_dir = tmp_path / "Books"
+    (books_dir / "T").mkdir(parents=True)
+    file1 = books_dir / "T" / "Book1.md"
+    file1.write_text("---\nitem_id: 1000000000\n---", encoding="utf-8")
+
+    assert build_id_book_index(books_dir) == {}
+    assert build_id_book_index(books_dir, recursive=True) == {"1000000000": file1}
+
+
+def test_shard_directory():
+    book = create_book({"author": "abc", "publish_year": "2020"})
+
+    assert shard_directory(book, "flat") == ""
+    assert shard_directory(book, "author_initial") == "A"
+    assert shard_directory(book, "publish_year") == "2020"
+    assert shard_directory(create_book({"author": "", "publish_year": None}), "author_initial") == "_"
+    assert shard_directory(create_book({"author": "", "publish_year": None}), "publish_year") == "unknown"
+
+
+def test_read_frontmatter_text(tmp_path):
+    file_path = tmp_path / "Book.md"
+    file_path.write_text("---\nitem_id: '1000000000'\ntitle: タイトル\n---\n## メモ\n---\n", encoding="utf-8")
+
+    assert read_frontmatter_text(file_path) == "item_id: '1000000000'\ntitle: タイトル\n"
+
+
+def test_read_frontmatter_text_without_frontmatter(tmp_path):
+    file_path = tmp_path / "Note.md"
+    file_path.write_text("# メモ\nitem_id: 1000000000\n", encoding="utf-8")
+
+    assert read_frontmatter_text(file_path) is None
+
+
+def test_build_id_book_index_ignores_item_id_in_body(tmp_path):
+    books_dir = tmp_path / "Books"
+    books_dir.mkdir()
+    file1 = books_dir / "Book1.md"
+    file1.write_text("---\ntitle: タイトル\n---\nitem_id: 1000000000\n", encoding="utf-8")
+
+    assert build_id_book_index(books_dir) == {}
+
+
+def _edit_note(path, text: str):
+    # 同じ秒のうちに書き換えても更新日時が変わるよう、明示的に進める
+    mtime_ns = path.stat().st_mtime_ns + 1_000_000_000
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_write_if_unchanged_merges_concurrent_edit(tmp_path):
+    note = tmp_path / "note.md"
+    note.write_text("---\nitem_id: '1000000000'\nstatus: 積読\n---\n本文\n", encoding="utf-8")
+    book = create_book({"status": "読み終わった"})
+
+    writes = []
+
+    def writer(path, content, kind, guard):
+        # 読み込んでから書き込むまでの間に、Obsidianで本文が編集されたとする
+        _edit_note(path, "---\nitem_id: '1000000000'\nstatus: 積読\n---\n本文\n追記\n")
+        writes.append(write_if_unchanged(path, content, *guard))
+
+    result = save_book(tmp_path, book, existing_file=note, writer=writer)
+
+    assert result.result == "updated"
+    assert writes == ["written"]
+    content = note.read_text(encoding="utf-8")
+    assert "status: 読み終わった" in content
+    assert content.endswith("本文\n追記\n")
+
+
+def test_write_if_unchanged_gives_up_after_retries(tmp_path):
+    note = tmp_path / "note.md"
+    note.write_text("---\nitem_id: '1000000000'\n---\n本文\n", encoding="utf-8")
+    _, version = read_text_versioned(note)
+    rebases = []
+
+    def rebase():
+        rebases.append(1)
+        _edit_note(note, f"---\nitem_id: '1000000000'\n---\n編集{len(rebases)}\n")
+        return "上書き", version
+
+    _edit_note(note, "---\nitem_id: '1000000000'\n---\n編集0\n")
+
+    assert write_if_unchanged(note, "上書き", version, rebase, retries=2) == "conflict"
+    assert len(rebases) == 2
+    assert note.read_text(encoding="utf-8").endswith("編集2\n")
+
+
+def test_write_if_unchanged_skips_deleted_note(tmp_path):
+    note = tmp_path / "note.md"
+    note.write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+    _, version = read_text_versioned(note)
+    note.unlink()
+
+    # 削除されたノートは作り直さず、書き込みを見送ったものとして扱う
+    assert write_if_unchanged(note, "内容", version, lambda: None) == "conflict"
+    assert not note.exists()
+
+
+def test_write_if_unchanged_reports_unchanged_after_merge(tmp_path):
+    note = tmp_path / "note.md"
+    note.write_text("---\nitem_id: '1000000000'\nstatus: 積読\n---\n", encoding="utf-8")
+    book = create_book({"status": "読み終わった"})
+
+    def writer(path, content, kind, guard):
+        # 書き込む前に、同じ変更がほかの同期で行われたとする
+        _edit_note(path, content)
+        writes.append(write_if_unchanged(path, content, *guard))
+
+    writes = []
+    save_book(tmp_path, book, existing_file=note, writer=writer)
+
+    assert writes == ["unchanged"]
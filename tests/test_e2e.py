@@ -234,3 +234,33 @@ def test_e2e_sync_multiple_books(tmp_path):
     # 変更なしファイルはそのまま
     unchanged_content = unchanged_file.read_text(encoding="utf-8")
     assert "rating: 4" in unchanged_content
+
+
+def test_e2e_export(tmp_path):
+    """VaultからブクログCSVへの書き出し"""
+    csv_path = tmp_path / "booklog.csv"
+    books_path = tmp_path / "Vault" / "Books"
+    output_path = tmp_path / "export.csv"
+
+    write_csv(csv_path, [
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+    ])
+    config_file = write_config(tmp_path, csv_path, books_path)
+    assert run_booklog_sync(config_file).returncode == 0
+
+    # Obsidianで評価を編集する
+    note = books_path / "テスト作者名『テストタイトル』（テスト出版社、2020）.md"
+    note.write_text(note.read_text(encoding="utf-8").replace("rating: 5", "rating: 3"), encoding="utf-8")
+
+    result = subprocess.run(
+        [sys.executable, "-m", "booklog_sync.main", "export", "--config", str(config_file), "--output", str(output_path)],
+        capture_output=True,
+        text=True,
+    )
+    print(result.stderr)
+
+    assert result.returncode == 0, f"Exit code != 0\nstderr:\n{result.stderr}"
+    assert output_path.read_bytes().decode("cp932") == (
+        ",1000000000,9784000000001,,3,読み終わった,,,,,,テストタイトル,テスト作者名,テスト出版社,2020,,\r\n"
+    )
+    assert "Exported 1 books" in result.stderr
@@ -0,0 +1,84 @@
+import logging
+
+from booklog_sync.core import BOOKLOG_CSV_COLUMNS, read_booklog_csv
+from booklog_sync.export import export_vault_to_csv
+
+
+def test_export_vault_to_csv(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    (books_path / "Book1.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: テストタイトル\nauthor: テスト作者名\nisbn13: '9784000000001'\n"
+        "publisher: テスト出版社\npublish_year: '2020'\nstatus: 読み終わった\nrating: 5\ntags:\n- 小説\n- SF\n---\n## メモ\n",
+        encoding="utf-8",
+    )
+    (books_path / "Note.md").write_text("# item_idのないノート\n", encoding="utf-8")
+    output_path = tmp_path / "export.csv"
+
+    exported = export_vault_to_csv(books_path, output_path)
+
+    assert exported == 1
+    rows = list(read_booklog_csv(output_path, BOOKLOG_CSV_COLUMNS))
+    assert rows == [
+        {
+            "service_id": "",
+            "item_id": "1000000000",
+            "isbn13": "9784000000001",
+            "category": "",
+            "rating": "5",
+            "status": "読み終わった",
+            "review": "",
+            "tags": "小説,SF",
+            "memo": "",
+            "registered_at": "",
+            "finished_at": "",
+            "title": "テストタイトル",
+            "author": "テスト作者名",
+            "publisher": "テスト出版社",
+            "publish_year": "2020",
+            "book_type": "",
+            "page_count": "",
+        }
+    ]
+
+
+def test_export_vault_to_csv_utf8(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    (books_path / "Book1.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: 🍣の本\nrating:\n---\n", encoding="utf-8"
+    )
+    output_path = tmp_path / "export.csv"
+
+    export_vault_to_csv(books_path, output_path, encoding="utf-8")
+
+    content = output_path.read_bytes().decode("utf-8")
+    assert content == ",1000000000,,,,,,,,,,🍣の本,,,,,\r\n"
+
+
+def test_export_vault_to_csv_warns_about_replaced_characters(tmp_path, caplog):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    (books_path / "Book1.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: 🍣の本\nauthor: 作者\n---\n", encoding="utf-8"
+    )
+    output_path = tmp_path / "export.csv"
+
+    with caplog.at_level(logging.WARNING, logger="booklog_sync.export"):
+        export_vault_to_csv(books_path, output_path)
+
+    assert output_path.read_bytes().decode("cp932") == ",1000000000,,,,,,,,,,?の本,作者,,,,\r\n"
+    assert [record.getMessage() for record in caplog.records] == [
+        f"Characters not representable in cp932 were replaced with '?': {books_path / 'Book1.md'} (title)"
+    ]
+
+
+def test_export_vault_to_csv_skips_broken_frontmatter(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    (books_path / "Broken.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: [invalid yaml\n---\n", encoding="utf-8"
+    )
+    output_path = tmp_path / "export.csv"
+
+    assert export_vault_to_csv(books_path, output_path) == 0
@@ -0,0 +1,62 @@
+import gc
+import random
+import weakref
+
+from booklog_sync.extsort import external_sort
+
+
+def test_external_sort_in_memory():
+    assert list(external_sort([3, 1, 2], key=lambda x: x, chunk_size=10)) == [1, 2, 3]
+
+
+def test_external_sort_spills_runs(tmp_path):
+    items = list(range(1000))
+    random.Random(0).shuffle(items)
+
+    result = list(external_sort(items, key=lambda x: x, chunk_size=64, tmp_dir=tmp_path))
+
+    assert result == list(range(1000))
+    # 一時ファイルは読み終わったら削除される
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_external_sort_is_stable(tmp_path):
+    items = [(i % 3, i) for i in range(100)]
+
+    result = list(external_sort(items, key=lambda x: x[0], chunk_size=7, tmp_dir=tmp_path))
+
+    assert result == sorted(items, key=lambda x: x[0])
+
+
+def test_external_sort_keeps_shared_references_per_item(tmp_path):
+    # 1つの要素の中で同じオブジェクトを参照していても、別の要素の値と取り違えない
+    items = []
+    for i in range(20):
+        value = f"value{i}"
+        items.append((i % 5, {"a": value, "b": value}))
+
+    result = list(external_sort(items, key=lambda x: x[0], chunk_size=3, tmp_dir=tmp_path))
+
+    assert result == sorted(items, key=lambda x: x[0])
+
+
+class _Item:
+    def __init__(self, key):
+        self.key = key
+
+
+def test_external_sort_merge_releases_items_already_returned(tmp_path):
+    # 各ランに全体の範囲のキーが入るように並べ、8つのランをマージする
+    items = [_Item(key) for key in sorted(range(32), key=lambda key: key % 8)]
+    merged = external_sort(items, key=lambda item: item.key, chunk_size=4, tmp_dir=tmp_path)
+
+    first = next(merged)
+    assert first.key == 0
+    first_ref = weakref.ref(first)
+    del first
+    assert [next(merged).key for _ in range(10)] == list(range(1, 11))
+    gc.collect()
+
+    # 返した要素のランを読み終わる前でも、返した要素を参照し続けない
+    assert first_ref() is None
+    assert [item.key for item in merged] == list(range(11, 32))
@@ -0,0 +1,51 @@
+import pytest
+from conftest import create_booklog_csv_row
+
+from booklog_sync.filters import RowFilter, compile_filter, parse_filter_date
+
+
+def test_compile_filter_date_ranges_are_inclusive():
+    rejected_by = compile_filter(RowFilter(registered_from="2024-01-01", registered_to="2024-12-31"))
+
+    assert rejected_by(create_booklog_csv_row({"registered_at": "2024-01-01 00:00:00"})) is None
+    assert rejected_by(create_booklog_csv_row({"registered_at": "2024-12-31 23:59:59"})) is None
+    assert rejected_by(create_booklog_csv_row({"registered_at": "2023-12-31 23:59:59"})) == "registered_at"
+    assert rejected_by(create_booklog_csv_row({"registered_at": ""})) == "registered_at"
+
+
+def test_compile_filter_since_matches_registered_or_finished():
+    rejected_by = compile_filter(RowFilter(since="2026-10-01"))
+
+    assert rejected_by(create_booklog_csv_row({"registered_at": "2026-10-02 09:00:00", "finished_at": ""})) is None
+    assert (
+        rejected_by(create_booklog_csv_row({"registered_at": "2020-01-01 09:00:00", "finished_at": "2026-10-01"}))
+        is None
+    )
+    assert (
+        rejected_by(create_booklog_csv_row({"registered_at": "2020-01-01 09:00:00", "finished_at": ""})) == "since"
+    )
+
+
+def test_compile_filter_reports_first_rejecting_filter():
+    rejected_by = compile_filter(RowFilter(statuses=("読み終わった",), categories=("小説",), service_ids=("1",)))
+
+    assert rejected_by(create_booklog_csv_row({"category": "小説", "service_id": "1"})) is None
+    assert rejected_by(create_booklog_csv_row({"status": "積読", "category": "漫画", "service_id": "1"})) == "status"
+    assert rejected_by(create_booklog_csv_row({"category": "漫画", "service_id": "1"})) == "category"
+    assert rejected_by(create_booklog_csv_row({"category": "小説", "service_id": "2"})) == "service_id"
+
+
+def test_row_filter_columns():
+    assert not RowFilter()
+    assert RowFilter(since="2026-10-01").columns == {"registered_at", "finished_at"}
+    assert RowFilter(finished_to="2026-10-01", statuses=("積読",)).columns == {"finished_at", "status"}
+
+
+def test_parse_filter_date():
+    from datetime import date
+
+    assert parse_filter_date(date(2026, 10, 1), "since") == "2026-10-01"
+    assert parse_filter_date("2026-10-01", "since") == "2026-10-01"
+    assert parse_filter_date(None, "since") is None
+    with pytest.raises(ValueError, match="'since' は YYYY-MM-DD"):
+        parse_filter_date("10/01", "since")
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from conftest import create_booklog_csv_row
+
+from booklog_sync.join import iter_sorted_notes, sort_chunk_size, sort_merge_join
+
+
+def test_sort_merge_join_matches_rows_and_collects_orphans():
+    rows = [create_booklog_csv_row({"item_id": item_id}) for item_id in ["1", "3", "3", "5"]]
+    notes = [("0", Path("0.md")), ("3", Path("3.md")), ("4", Path("4.md")), ("6", Path("6.md"))]
+    orphans: dict[str, Path] = {}
+
+    joined = [(row["item_id"], path) for row, path in sort_merge_join(rows, notes, orphans)]
+
+    assert joined == [("1", None), ("3", Path("3.md")), ("3", Path("3.md")), ("5", None)]
+    assert orphans == {"0": Path("0.md"), "4": Path("4.md"), "6": Path("6.md")}
+
+
+def test_sort_merge_join_uses_last_duplicate_note():
+    rows = [create_booklog_csv_row({"item_id": "1"})]
+    notes = [("1", Path("a.md")), ("1", Path("b.md"))]
+    orphans: dict[str, Path] = {}
+
+    assert [path for _, path in sort_merge_join(rows, notes, orphans)] == [Path("b.md")]
+    assert orphans == {}
+
+
+def test_iter_sorted_notes(tmp_path):
+    for item_id in ["30", "10", "20"]:
+        (tmp_path / f"{item_id}.md").write_text(f"---\nitem_id: '{item_id}'\n---\n", encoding="utf-8")
+    (tmp_path / "no_id.md").write_text("---\ntitle: メモ\n---\n", encoding="utf-8")
+
+    assert list(iter_sorted_notes(tmp_path)) == [
+        ("10", tmp_path / "10.md"),
+        ("20", tmp_path / "20.md"),
+        ("30", tmp_path / "30.md"),
+    ]
+
+
+def test_sort_chunk_size():
+    assert sort_chunk_size(64) == 64 * 1024 * 1024 // 2 // 2048
+    # 3つのCSVとノートの4つのソートで上限を分け合う
+    assert sort_chunk_size(64, sorts=4) == 64 * 1024 * 1024 // 4 // 2048
+    assert sort_chunk_size(64, sorts=1) == 64 * 1024 * 1024 // 2048
+    assert sort_chunk_size(1) == 1000
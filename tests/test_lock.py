@@ -0,0 +1,187 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, replace
+
+import pytest
+
+from booklog_sync import lock as lock_module
+from booklog_sync.lock import HandoffListener, SyncLockError, VaultLock, read_lock_owner
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(lock_module, "_POLL_INTERVAL", 0.01)
+
+
+def test_vault_lock_acquire_and_release(tmp_path):
+    books_path = tmp_path / "Books"
+    lock = VaultLock(books_path)
+
+    assert lock.acquire("fail")
+    owner = read_lock_owner(lock.lock_file)
+    assert lock.lock_file == books_path / ".booklog-sync" / "sync.lock"
+    assert owner.pid == os.getpid()
+    assert owner.command == "sync"
+
+    lock.release()
+    assert not lock.lock_file.exists()
+
+
+def test_vault_lock_fail_when_held(tmp_path):
+    with VaultLock(tmp_path):
+        with pytest.raises(SyncLockError, match="同期中です"):
+            VaultLock(tmp_path).acquire("fail")
+
+
+def test_vault_lock_waits_for_release(tmp_path):
+    holder = VaultLock(tmp_path)
+    holder.acquire()
+    with pytest.raises(SyncLockError, match="終わりませんでした"):
+        VaultLock(tmp_path).acquire("wait", timeout=0.05)
+
+    threading.Timer(0.05, holder.release).start()
+    waiter = VaultLock(tmp_path)
+    assert waiter.acquire("wait", timeout=5)
+    waiter.release()
+
+
+def _write_owner(lock, **changes):
+    lock.lock_file.parent.mkdir(parents=True, exist_ok=True)
+    owner = replace(lock._owner, **changes)
+    lock.lock_file.write_text(json.dumps(asdict(owner)), encoding="utf-8")
+
+
+def test_vault_lock_removes_lock_of_exited_process(tmp_path):
+    process = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    lock = VaultLock(tmp_path)
+    _write_owner(lock, pid=int(process.stdout))
+
+    assert lock.acquire("fail")
+    assert read_lock_owner(lock.lock_file).pid == os.getpid()
+    lock.release()
+
+
+def test_vault_lock_detects_reused_pid(tmp_path):
+    lock = VaultLock(tmp_path)
+    _write_owner(lock, process_start="0")
+
+    if lock._owner.process_start is None:
+        pytest.skip("プロセスの開始時刻を取得できない環境")
+    assert lock.acquire("fail")
+    lock.release()
+
+
+def test_vault_lock_remote_host_uses_heartbeat_age(tmp_path):
+    lock = VaultLock(tmp_path)
+    _write_owner(lock, host="other-host", pid=1)
+
+    with pytest.raises(SyncLockError):
+        lock.acquire("fail")
+
+    old = time.time() - lock_module.STALE_LOCK_SECONDS - 1
+    os.utime(lock.lock_file, (old, old))
+    assert lock.acquire("fail")
+    lock.release()
+
+
+def test_vault_lock_hands_off_to_watch_daemon(tmp_path):
+    daemon = VaultLock(tmp_path, "watch", handoff=True)
+    daemon.acquire()
+    synced = []
+    listener = HandoffListener(daemon.handoff_file, lambda: synced.append(time.monotonic()), interval=0.01)
+    listener.start()
+    try:
+        requester = VaultLock(tmp_path)
+        assert requester.acquire("handoff", timeout=5) is False
+        assert len(synced) == 1
+        assert not requester.handoff_file.exists()
+        # 監視モード同士では依頼できない
+        with pytest.raises(SyncLockError, match="すでに監視モード"):
+            VaultLock(tmp_path, "watch", handoff=True).acquire("handoff")
+    finally:
+        listener.stop()
+        listener.join()
+        daemon.release()
+
+
+def test_vault_lock_does_not_hand_off_when_filters_differ(tmp_path):
+    from booklog_sync.config import SyncConfig
+    from booklog_sync.filters import RowFilter
+    from booklog_sync.main import _handoff_digest
+
+    config = SyncConfig(csv_path=tmp_path / "booklog.csv", books_path=tmp_path / "Books")
+    filtered = replace(config, row_filter=RowFilter(statuses=("読了",), since="2024-01-01"))
+    assert _handoff_digest(config) == _handoff_digest(replace(config))
+    assert _handoff_digest(config) != _handoff_digest(filtered)
+
+    daemon = VaultLock(tmp_path, "watch", handoff=True, options=_handoff_digest(config))
+    daemon.acquire()
+    synced = []
+    listener = HandoffListener(daemon.handoff_file, lambda: synced.append(time.monotonic()), interval=0.01)
+    listener.start()
+    try:
+        # 絞り込みが異なる同期は依頼せず、監視モードのプロセスが終わるのを待つ
+        requester = VaultLock(tmp_path, options=_handoff_digest(filtered))
+        with pytest.raises(SyncLockError, match="終わりませんでした"):
+            requester.acquire("handoff", timeout=0.1)
+        assert synced == []
+        assert not requester.handoff_file.exists()
+
+        # 設定が同じ同期は依頼し、依頼には設定のハッシュを記録する
+        requester = VaultLock(tmp_path, options=_handoff_digest(config))
+        requests = []
+        listener._on_request = lambda: requests.append(listener._processing_file.read_text(encoding="utf-8"))
+        assert requester.acquire("handoff", timeout=5) is False
+        assert requests == [_handoff_digest(config)]
+    finally:
+        listener.stop()
+        listener.join()
+        daemon.release()
+
+
+def test_vault_lock_does_not_wait_for_daemon_when_asked(tmp_path):
+    daemon = VaultLock(tmp_path, "serve", handoff=True)
+    daemon.acquire()
+    try:
+        with pytest.raises(SyncLockError, match="監視モードを止めてから"):
+            VaultLock(tmp_path, "rollback").acquire("wait", wait_for_handoff=False)
+    finally:
+        daemon.release()
+
+    # 監視モードでないプロセスのロックは待つ
+    holder = VaultLock(tmp_path)
+    holder.acquire()
+    threading.Timer(0.05, holder.release).start()
+    waiter = VaultLock(tmp_path, "rollback")
+    assert waiter.acquire("wait", timeout=5, wait_for_handoff=False)
+    waiter.release()
+
+
+def test_vault_lock_handoff_to_sync_process_waits(tmp_path):
+    holder = VaultLock(tmp_path)
+    holder.acquire()
+    threading.Timer(0.05, holder.release).start()
+
+    requester = VaultLock(tmp_path)
+    assert requester.acquire("handoff", timeout=5) is True
+    assert not requester.handoff_file.exists()
+    requester.release()
+
+
+def test_vault_lock_handoff_falls_back_when_daemon_exits(tmp_path):
+    process = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    lock = VaultLock(tmp_path)
+    _write_owner(lock, command="watch", handoff=True)
+
+    # 依頼を受け付ける前に監視モードのプロセスが終了した場合
+    def exit_daemon():
+        _write_owner(lock, command="watch", handoff=True, pid=int(process.stdout))
+
+    threading.Timer(0.05, exit_daemon).start()
+    assert lock.acquire("handoff", timeout=5) is True
+    assert not lock.handoff_file.exists()
+    lock.release()
@@ -1,6 +1,12 @@
 import logging
+from unittest.mock import patch
 
+import pytest
+
+from booklog_sync.core import convert_csv, save_book
+from booklog_sync.filters import RowFilter
 from booklog_sync.main import run_sync
+from booklog_sync.sync import BookResult, SyncStats, iter_sync
 
 
 def test_run_sync(tmp_path):
@@ -69,7 +75,547 @@ def test_run_sync_logs_summary(tmp_path, caplog):
 
     books_path = tmp_path / "Vault" / "Books"
 
-    with caplog.at_level(logging.INFO, logger="booklog_sync.main"):
+    with caplog.at_level(logging.INFO, logger="booklog_sync.sync"):
         run_sync(csv_file, books_path)
 
     assert "Sync completed: 1 created, 0 updated, 0 unchanged" in caplog.text
+
+
+def test_run_sync_with_body_template(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,面白かった,...,...,2020-01-01 10:00:00,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    template_file = tmp_path / "template.md"
+    template_file.write_text("## 感想\n{review}\n\n登録日: {registered_at}\n", encoding="utf-8")
+
+    books_path = tmp_path / "Vault" / "Books"
+
+    run_sync(csv_file, books_path, body_template=template_file)
+
+    content = (
+        books_path / "テスト作者名『テストタイトル』（テスト出版社、2020）.md"
+    ).read_text(encoding="utf-8")
+    assert content.endswith("---\n## 感想\n面白かった\n\n登録日: 2020-01-01 10:00:00\n")
+
+
+def test_run_sync_body_template_not_applied_to_existing_file(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,面白かった,...,...,...,...,タイトル,著者A,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    template_file = tmp_path / "template.md"
+    template_file.write_text("{review}", encoding="utf-8")
+
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    existing_file = books_path / "Existing_Book.md"
+    existing_file.write_text(
+        "---\nitem_id: '1000000000'\ntitle: タイトル\n---\n## メモ\n",
+        encoding="utf-8",
+    )
+
+    run_sync(csv_file, books_path, body_template=template_file)
+
+    content = existing_file.read_text(encoding="utf-8")
+    assert "## メモ" in content
+    assert "面白かった" not in content
+
+
+def test_run_sync_with_fields(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,小説,5,読み終わった,面白かった,SF,...,2020-01-01 10:00:00,...,テストタイトル,テスト作者名,テスト出版社,2020,単行本,320",
+        encoding="cp932",
+    )
+
+    books_path = tmp_path / "Vault" / "Books"
+
+    run_sync(
+        csv_file,
+        books_path,
+        fields=["item_id", "title", "author", "publisher", "publish_year", "category", "page_count"],
+    )
+
+    content = (
+        books_path / "テスト作者名『テストタイトル』（テスト出版社、2020）.md"
+    ).read_text(encoding="utf-8")
+    assert "category: 小説\n" in content
+    assert "page_count: 320\n" in content
+    assert "rating" not in content
+    assert "status" not in content
+
+
+def test_run_sync_archives_orphans(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,タイトル,著者A,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    kept_file = books_path / "Kept.md"
+    kept_file.write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+    orphan_file = books_path / "Orphan.md"
+    orphan_file.write_text("---\nitem_id: '2000000000'\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Vault" / "Archive"
+
+    run_sync(csv_file, books_path, orphan_action="archive", orphan_archive_path=archive_path)
+
+    assert kept_file.exists()
+    assert not orphan_file.exists()
+    assert (archive_path / "Orphan.md").exists()
+
+
+def test_run_sync_empty_csv_skips_orphans(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text("", encoding="cp932")
+
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    note = books_path / "Book.md"
+    note.write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Vault" / "Archive"
+
+    with caplog.at_level(logging.WARNING, logger="booklog_sync.sync"):
+        run_sync(csv_file, books_path, orphan_action="archive", orphan_archive_path=archive_path)
+
+    assert note.exists()
+    assert "skipping orphan detection" in caplog.text
+
+
+def test_run_sync_resumes_after_interruption(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "\n".join(
+            f"...,{i}000000000,978400000000{i},...,5,読み終わった,...,...,...,...,...,タイトル{i},著者,出版社,2020,..."
+            for i in range(1, 5)
+        ),
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    state_path = tmp_path / "state"
+
+    calls = []
+
+    def interrupted_save(*args, **kwargs):
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        calls.append(args[1]["item_id"])
+        return save_book(*args, **kwargs)
+
+    with patch("booklog_sync.sync.save_book", side_effect=interrupted_save):
+        with pytest.raises(KeyboardInterrupt):
+            run_sync(csv_file, books_path, state_path=state_path, checkpoint_interval=2)
+
+    assert (state_path / "sync-journal.jsonl").exists()
+
+    with caplog.at_level(logging.INFO, logger="booklog_sync.sync"):
+        run_sync(csv_file, books_path, state_path=state_path, checkpoint_interval=2)
+
+    # 中断前に完了した3行は読み飛ばし、4行目だけを処理する
+    assert "Skipped 3 rows already synced before interruption" in caplog.text
+    assert "Sync completed: 1 created, 0 updated, 0 unchanged" in caplog.text
+    assert len(list(books_path.glob("*.md"))) == 4
+    assert not (state_path / "sync-journal.jsonl").exists()
+
+
+def test_run_sync_does_not_resume_after_options_change(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "\n".join(
+            f"...,{i}000000000,978400000000{i},...,5,読み終わった,...,...,...,...,...,タイトル{i},著者,出版社,2020,..."
+            for i in range(1, 5)
+        ),
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    state_path = tmp_path / "state"
+
+    for result in iter_sync(csv_file, books_path, state_path=state_path, checkpoint_interval=1):
+        if result.item_id == "2000000000":
+            break
+    assert (state_path / "sync-journal.jsonl").exists()
+
+    # 出力する列を変えたため、処理済みの行も読み飛ばさずに新しい設定で確かめる
+    with caplog.at_level(logging.INFO, logger="booklog_sync.resume"):
+        stats = run_sync(
+            csv_file,
+            books_path,
+            state_path=state_path,
+            checkpoint_interval=1,
+            fields=("item_id", "title", "author", "publisher", "publish_year", "rating"),
+        )
+    assert (stats.resumed, stats.unchanged, stats.created) == (0, 2, 2)
+    assert "Source CSV or sync options changed" in caplog.text
+
+
+def test_run_sync_with_write_rate_limit(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+
+    books_path = tmp_path / "Vault" / "Books"
+
+    with caplog.at_level(logging.INFO, logger="booklog_sync.sync"):
+        run_sync(csv_file, books_path, max_writes_per_second=5, max_write_bytes_per_second=100_000)
+
+    assert (
+        books_path / "テスト作者名『テストタイトル』（テスト出版社、2020）.md"
+    ).exists()
+    assert "Writes: 1 files" in caplog.text
+
+
+def test_run_sync_sharded_layout(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...\n"
+        "...,2000000000,9784000000002,...,3,積読,...,...,...,...,...,タイトル,著者A,出版社,2021,...",
+        encoding="cp932",
+    )
+
+    books_path = tmp_path / "Vault" / "Books"
+    (books_path / "2021").mkdir(parents=True)
+    existing_file = books_path / "2021" / "Existing_Book.md"
+    existing_file.write_text("---\nitem_id: '2000000000'\nstatus: 読み終わった\n---\n", encoding="utf-8")
+
+    run_sync(csv_file, books_path, recursive=True, layout="publish_year")
+
+    assert (books_path / "2020" / "テスト作者名『テストタイトル』（テスト出版社、2020）.md").exists()
+    assert "status: 積読" in existing_file.read_text(encoding="utf-8")
+    assert len(list(books_path.rglob("*.md"))) == 2
+
+
+def test_run_sync_multiple_csv_files(tmp_path):
+    csv1 = tmp_path / "a.csv"
+    csv1.write_text(
+        "...,1000000000,9784000000001,...,3,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    csv2 = tmp_path / "b.csv"
+    csv2.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...\n"
+        "...,2000000000,9784000000002,...,4,積読,...,...,...,...,...,タイトル,著者A,出版社,2021,...",
+        encoding="cp932",
+    )
+
+    books_path = tmp_path / "Vault" / "Books"
+
+    run_sync([csv1, csv2], books_path, merge_policy="highest_rating")
+
+    content = (
+        books_path / "テスト作者名『テストタイトル』（テスト出版社、2020）.md"
+    ).read_text(encoding="utf-8")
+    assert "rating: 5" in content
+    assert len(list(books_path.glob("*.md"))) == 2
+
+
+def test_run_sync_with_change_journal(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,タイトル,著者A,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    (books_path / "Existing_Book.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: タイトル\nauthor: 著者A\nisbn13: '9784000000001'\npublisher: テスト出版社\npublish_year: '2020'\nstatus: 積読\nrating:\n---\n",
+        encoding="utf-8",
+    )
+    journal_path = tmp_path / "changes.jsonl"
+
+    with caplog.at_level(logging.INFO):
+        run_sync(csv_file, books_path, change_journal=journal_path)
+
+    lines = journal_path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    assert "Change journal: 2 field changes" in caplog.text
+    # フィールドごとの差分はINFOでは出力しない
+    assert "Changes detected" not in caplog.text
+
+
+def test_run_sync_adopts_existing_note(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    note = books_path / "My note.md"
+    note.write_text("---\ntitle: テストタイトル\nauthor: テスト作者名\n---\n## 感想\n", encoding="utf-8")
+
+    run_sync(csv_file, books_path, adopt="on")
+
+    content = note.read_text(encoding="utf-8")
+    assert "item_id: '1000000000'" in content
+    assert "## 感想" in content
+    assert len(list(books_path.glob("*.md"))) == 1
+
+
+def test_run_sync_adopt_report_does_not_write(tmp_path, caplog):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    note = books_path / "My note.md"
+    original = "---\nisbn13: '9784000000001'\n---\n"
+    note.write_text(original, encoding="utf-8")
+
+    with caplog.at_level(logging.INFO, logger="booklog_sync.sync"):
+        run_sync(csv_file, books_path, adopt="report")
+
+    assert note.read_text(encoding="utf-8") == original
+    assert len(list(books_path.glob("*.md"))) == 1
+    assert "Adoption report: 1 existing notes can be adopted" in caplog.text
+
+
+def test_run_sync_returns_stats(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "\n".join(
+            f"...,{i}000000000,978400000000{i},...,5,読み終わった,...,...,...,...,...,タイトル{i},著者,出版社,2020,..."
+            for i in range(1, 4)
+        ),
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+
+    stats = run_sync(csv_file, books_path, checkpoint_interval=0)
+    assert (stats.created, stats.updated, stats.unchanged) == (3, 0, 0)
+    assert stats.completed
+
+    stats = run_sync(csv_file, books_path, checkpoint_interval=0)
+    assert (stats.created, stats.updated, stats.unchanged) == (0, 0, 3)
+
+
+def test_iter_sync_yields_per_book_results(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,タイトル,著者A,テスト出版社,2020,...\n"
+        "...,2000000000,9784000000002,...,3,読みたい,...,...,...,...,...,新しい本,著者B,テスト出版社,2021,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    existing_file = books_path / "Existing_Book.md"
+    existing_file.write_text(
+        "---\nitem_id: '1000000000'\ntitle: タイトル\nauthor: 著者A\nisbn13: '9784000000001'\npublisher: テスト出版社\npublish_year: '2020'\nstatus: 積読\nrating:\n---\n",
+        encoding="utf-8",
+    )
+
+    results = list(iter_sync(csv_file, books_path, checkpoint_interval=0))
+
+    assert [(r.item_id, r.result) for r in results] == [("1000000000", "updated"), ("2000000000", "created")]
+    assert isinstance(results[0], BookResult)
+    assert results[0].path == existing_file
+    assert results[0].changed_fields == ("status", "rating")
+    assert results[1].path == books_path / "著者B『新しい本』（テスト出版社、2021）.md"
+    assert results[1].changed_fields == ()
+    assert all(r.elapsed >= 0 for r in results)
+
+
+def test_iter_sync_stop_early_records_progress(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "\n".join(
+            f"...,{i}000000000,978400000000{i},...,5,読み終わった,...,...,...,...,...,タイトル{i},著者,出版社,2020,..."
+            for i in range(1, 5)
+        ),
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    state_path = tmp_path / "state"
+
+    stats = SyncStats()
+    results = iter_sync(csv_file, books_path, state_path=state_path, checkpoint_interval=10, stats=stats)
+    for result in results:
+        if result.item_id == "2000000000":
+            break
+    results.close()
+
+    assert stats.created == 2
+    assert not stats.completed
+    assert (state_path / "sync-journal.jsonl").exists()
+
+    results = list(iter_sync(csv_file, books_path, state_path=state_path, checkpoint_interval=10))
+    assert [r.result for r in results] == ["resumed", "resumed", "created", "created"]
+    assert results[0].path is not None
+
+
+def test_run_sync_sort_merge_join(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,3000000000,9784000000003,...,5,読み終わった,...,...,...,...,...,タイトル3,著者,出版社,2020,...\n"
+        "...,1000000000,9784000000001,...,4,読み終わった,...,...,...,...,...,タイトル1,著者,出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    existing_file = books_path / "Existing.md"
+    existing_file.write_text("---\nitem_id: '3000000000'\nstatus: 積読\n---\n本文", encoding="utf-8")
+    orphan_file = books_path / "Orphan.md"
+    orphan_file.write_text("---\nitem_id: '2000000000'\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Vault" / "Archive"
+
+    results = list(
+        iter_sync(
+            csv_file,
+            books_path,
+            join="sort_merge",
+            orphan_action="archive",
+            orphan_archive_path=archive_path,
+        )
+    )
+
+    # 行はitem_idの順に処理される
+    assert [(r.item_id, r.result) for r in results] == [("1000000000", "created"), ("3000000000", "updated")]
+    assert results[1].path == existing_file
+    assert "status: 読み終わった" in existing_file.read_text(encoding="utf-8")
+    assert (archive_path / "Orphan.md").exists()
+
+
+def test_run_sync_sort_merge_join_rejects_adopt(tmp_path):
+    with pytest.raises(ValueError, match="adopt"):
+        run_sync(tmp_path / "test.csv", tmp_path / "Books", join="sort_merge", adopt="on")
+
+
+def test_run_sync_row_filter_skips_rows_before_conversion(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "1,1000000000,9784000000001,...,5,読み終わった,...,...,...,2026-10-02 09:00:00,,新しい本,著者,出版社,2020,...\n"
+        "1,2000000000,9784000000002,...,5,読み終わった,...,...,...,2020-01-01 09:00:00,,古い本,著者,出版社,2020,...\n"
+        "1,3000000000,9784000000003,...,5,積読,...,...,...,2026-10-03 09:00:00,,積読の本,著者,出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    old_note = books_path / "Old.md"
+    old_note.write_text("---\nitem_id: '2000000000'\nstatus: 積読\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Vault" / "Archive"
+
+    with patch("booklog_sync.sync.convert_csv", wraps=convert_csv) as mock_convert:
+        stats = run_sync(
+            csv_file,
+            books_path,
+            row_filter=RowFilter(since="2026-10-01", statuses=("読み終わった",)),
+            orphan_action="archive",
+            orphan_archive_path=archive_path,
+        )
+
+    assert mock_convert.call_count == 1
+    assert stats.created == 1
+    assert stats.filtered == {"since": 1, "status": 1}
+    # 絞り込みで読み飛ばした行のノートは更新せず、孤立ノートとしても扱わない
+    assert old_note.read_text(encoding="utf-8") == "---\nitem_id: '2000000000'\nstatus: 積読\n---\n"
+    assert stats.orphans == 0
+
+
+def test_run_sync_maintains_aggregates_from_changes(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    rows = [
+        "1,1000000000,9784000000001,...,5,積読,...,...,...,...,...,本A,著者,出版社,2020,...",
+        "1,2000000000,9784000000002,...,3,読み終わった,...,...,...,...,...,本B,著者,出版社,2020,...",
+    ]
+    csv_file.write_text("\n".join(rows), encoding="cp932")
+    books_path = tmp_path / "Vault" / "Books"
+    index_path = tmp_path / "Vault" / "Index"
+
+    run_sync(csv_file, books_path, aggregate_path=index_path)
+    assert (index_path / "status" / "積読.md").exists()
+    assert "count: 2\n" in (index_path / "author" / "著者.md").read_text(encoding="utf-8")
+
+    rows[0] = rows[0].replace("積読", "読み終わった")
+    csv_file.write_text("\n".join(rows), encoding="cp932")
+    with patch("booklog_sync.aggregates.iter_frontmatters") as mock_scan:
+        run_sync(csv_file, books_path, aggregate_path=index_path)
+
+    # 2回目は保存済みの集計に差分だけを反映し、Vaultは走査しない
+    mock_scan.assert_not_called()
+    assert not (index_path / "status" / "積読.md").exists()
+    assert "count: 2\n" in (index_path / "status" / "読み終わった.md").read_text(encoding="utf-8")
+
+
+def test_run_sync_with_transforms_does_not_rewrite_unchanged_notes(tmp_path):
+    from booklog_sync.transforms import compile_transforms
+
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "1,1000000000,9784000000001,小説,4,読み終わった,...,SF,...,...,...,本A,著者,出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    options = {
+        "fields": ("item_id", "title", "author", "publisher", "publish_year", "tags"),
+        "transforms": compile_transforms(
+            ["split_tags", {"name": "category_tag", "prefix": "genre/"}, {"name": "rating_stars", "field": "stars"}]
+        ),
+    }
+
+    stats = run_sync(csv_file, books_path, **options)
+    assert stats.created == 1
+    assert set(stats.transform_seconds) == {"split_tags", "category_tag", "rating_stars"}
+    (note,) = books_path.glob("*.md")
+    content = note.read_text(encoding="utf-8")
+    assert "tags:\n- SF\n- genre/小説\nstars: ★★★★☆\n" in content
+
+    stats = run_sync(csv_file, books_path, **options)
+    assert stats.unchanged == 1
+    assert note.read_text(encoding="utf-8") == content
+
+
+def test_run_sync_counts_failed_deferred_writes(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+
+    with patch("booklog_sync.sync.write_text_atomic", side_effect=OSError("書き込めない")):
+        stats = run_sync(csv_file, books_path, max_writes_per_second=5, checkpoint_interval=1, snapshot_keep=0)
+    assert (stats.created, stats.failed) == (0, 1)
+
+    # 書き込めなかった行は完了として記録されず、次の同期で作成される
+    stats = run_sync(csv_file, books_path)
+    assert (stats.created, stats.resumed) == (1, 0)
+
+
+def test_run_sync_counts_deferred_conflicts(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    note = books_path / "note.md"
+    note.write_text("---\nitem_id: '1000000000'\nstatus: 積読\n---\n", encoding="utf-8")
+
+    # 書き込む直前の確認で、同期中に編集され続けていたと判定される
+    index_path = tmp_path / "Vault" / "Index"
+    journal_path = tmp_path / "changes.jsonl"
+    options = {"max_writes_per_second": 5, "aggregate_path": index_path, "change_journal": journal_path}
+    with patch("booklog_sync.throttle.write_if_unchanged", return_value="conflict"):
+        stats = run_sync(csv_file, books_path, **options)
+
+    assert (stats.updated, stats.conflicts) == (0, 1)
+    assert "status: 積読" in note.read_text(encoding="utf-8")
+    # 書き込めなかった変更は、変更の記録と集計ノートにも反映しない
+    assert not journal_path.exists()
+    assert (index_path / "status" / "積読.md").exists()
+    assert not (index_path / "status" / "読み終わった.md").exists()
+
+    stats = run_sync(csv_file, books_path, **options)
+    assert stats.updated == 1
+    assert '"field": "status"' in journal_path.read_text(encoding="utf-8")
+    assert not (index_path / "status" / "積読.md").exists()
+    assert (index_path / "status" / "読み終わった.md").exists()
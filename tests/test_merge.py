@@ -0,0 +1,84 @@
+import logging
+
+from booklog_sync.merge import MergeReport, merge_booklog_csvs
+
+
+def write_csv(path, rows):
+    path.write_text("\n".join(rows), encoding="cp932")
+    return path
+
+
+def test_merge_booklog_csvs_first(tmp_path):
+    csv1 = write_csv(tmp_path / "a.csv", [
+        "...,3000000000,...,...,3,読み終わった,...,...,...,...,2020-01-01,C,著者,出版社,2020,...",
+        "...,1000000000,...,...,4,読み終わった,...,...,...,...,2020-01-01,A,著者,出版社,2020,...",
+    ])
+    csv2 = write_csv(tmp_path / "b.csv", [
+        "...,1000000000,...,...,5,読み終わった,...,...,...,...,2021-01-01,A,著者,出版社,2020,...",
+        "...,2000000000,...,...,5,積読,...,...,...,...,,B,著者,出版社,2020,...",
+    ])
+    report = MergeReport()
+
+    rows = list(merge_booklog_csvs([csv1, csv2], ["item_id", "rating"], report=report, chunk_size=1))
+
+    assert [(row["item_id"], row["rating"]) for row in rows] == [
+        ("1000000000", "4"),
+        ("2000000000", "5"),
+        ("3000000000", "3"),
+    ]
+    assert report == MergeReport(sources=2, rows=3, duplicates=1, conflicts=1)
+
+
+def test_merge_booklog_csvs_latest_finished(tmp_path):
+    csv1 = write_csv(tmp_path / "a.csv", [
+        "...,1000000000,...,...,4,読み終わった,...,...,...,...,2020-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+    csv2 = write_csv(tmp_path / "b.csv", [
+        "...,1000000000,...,...,5,読み終わった,...,...,...,...,2021-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+
+    rows = list(merge_booklog_csvs([csv1, csv2], ["item_id", "rating"], "latest_finished"))
+
+    assert rows[0]["rating"] == "5"
+
+
+def test_merge_booklog_csvs_highest_rating(tmp_path):
+    csv1 = write_csv(tmp_path / "a.csv", [
+        "...,1000000000,...,...,5,読み終わった,...,...,...,...,2020-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+    csv2 = write_csv(tmp_path / "b.csv", [
+        "...,1000000000,...,...,,積読,...,...,...,...,2021-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+
+    rows = list(merge_booklog_csvs([csv1, csv2], ["item_id", "status"], "highest_rating"))
+
+    assert rows[0]["status"] == "読み終わった"
+
+
+def test_merge_booklog_csvs_identical_rows_are_not_conflicts(tmp_path):
+    row = "...,1000000000,...,...,5,読み終わった,...,...,...,...,2020-01-01,A,著者,出版社,2020,..."
+    csv1 = write_csv(tmp_path / "a.csv", [row])
+    csv2 = write_csv(tmp_path / "b.csv", [row])
+    report = MergeReport()
+
+    list(merge_booklog_csvs([csv1, csv2], ["item_id", "title"], report=report))
+
+    assert report.duplicates == 1
+    assert report.conflicts == 0
+
+
+def test_merge_booklog_csvs_logs_conflicts(tmp_path, caplog):
+    csv1 = write_csv(tmp_path / "a.csv", [
+        "...,1000000000,...,...,4,読み終わった,...,...,...,...,2020-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+    csv2 = write_csv(tmp_path / "b.csv", [
+        "...,1000000000,...,...,5,読み終わった,...,...,...,...,2021-01-01 10:00:00,A,著者,出版社,2020,...",
+    ])
+
+    with caplog.at_level(logging.INFO, logger="booklog_sync.merge"):
+        list(merge_booklog_csvs([csv1, csv2], ["item_id", "rating"], "latest_finished"))
+
+    conflicts = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(conflicts) == 1
+    assert "1000000000" in conflicts[0].getMessage()
+    assert str(csv2) in conflicts[0].getMessage()
@@ -0,0 +1,107 @@
+import logging
+
+import pytest
+
+from booklog_sync.orphans import (
+    ORPHAN_TAG,
+    archive_orphans,
+    find_orphans,
+    handle_orphans,
+    tag_orphans,
+)
+
+
+def test_find_orphans(tmp_path):
+    index = {
+        "1000000000": tmp_path / "Book1.md",
+        "2000000000": tmp_path / "Book2.md",
+    }
+
+    orphans = find_orphans(index, {"1000000000", "3000000000"})
+
+    assert orphans == {"2000000000": tmp_path / "Book2.md"}
+
+
+def test_tag_orphans(tmp_path):
+    file1 = tmp_path / "Book1.md"
+    file1.write_text("---\nitem_id: '1000000000'\n---\n## メモ\n", encoding="utf-8")
+    file2 = tmp_path / "Book2.md"
+    file2.write_text("---\nitem_id: '2000000000'\ntags: 小説\n---\n", encoding="utf-8")
+
+    tagged = tag_orphans([file1, file2])
+
+    assert tagged == 2
+    content1 = file1.read_text(encoding="utf-8")
+    assert f"tags:\n- {ORPHAN_TAG}\n" in content1
+    assert content1.endswith("---\n## メモ\n")
+    assert f"tags: 小説,{ORPHAN_TAG}\n" in file2.read_text(encoding="utf-8")
+
+
+def test_tag_orphans_keeps_comma_separated_tags(tmp_path):
+    file1 = tmp_path / "Book1.md"
+    file1.write_text("---\nitem_id: '1000000000'\ntags: 小説,SF\n---\n## メモ\n", encoding="utf-8")
+
+    assert tag_orphans([file1]) == 1
+    content = file1.read_text(encoding="utf-8")
+    assert content == f"---\nitem_id: '1000000000'\ntags: 小説,SF,{ORPHAN_TAG}\n---\n## メモ\n"
+
+    # 文字列のまま読み込めて、2回目はタグを追加しない
+    assert tag_orphans([file1]) == 0
+    assert file1.read_text(encoding="utf-8") == content
+
+
+def test_tag_orphans_already_tagged(tmp_path):
+    file1 = tmp_path / "Book1.md"
+    file1.write_text(f"---\nitem_id: '1000000000'\ntags:\n- {ORPHAN_TAG}\n---\n", encoding="utf-8")
+    mtime_before = file1.stat().st_mtime_ns
+
+    tagged = tag_orphans([file1])
+
+    assert tagged == 0
+    assert file1.stat().st_mtime_ns == mtime_before
+
+
+def test_archive_orphans(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    file1 = books_path / "Book1.md"
+    file1.write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Archive"
+
+    moved = archive_orphans([file1], archive_path)
+
+    assert moved == 1
+    assert not file1.exists()
+    assert (archive_path / "Book1.md").exists()
+
+
+def test_archive_orphans_skips_existing_destination(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    file1 = books_path / "Book1.md"
+    file1.write_text("new", encoding="utf-8")
+    archive_path = tmp_path / "Archive"
+    archive_path.mkdir()
+    (archive_path / "Book1.md").write_text("old", encoding="utf-8")
+
+    moved = archive_orphans([file1], archive_path)
+
+    assert moved == 0
+    assert file1.exists()
+    assert (archive_path / "Book1.md").read_text(encoding="utf-8") == "old"
+
+
+def test_handle_orphans_report_does_not_modify(tmp_path, caplog):
+    file1 = tmp_path / "Book1.md"
+    file1.write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+
+    with caplog.at_level(logging.INFO, logger="booklog_sync.orphans"):
+        handle_orphans({"1000000000": file1})
+
+    assert "Orphans: 1 found" in caplog.text
+    assert file1.read_text(encoding="utf-8") == "---\nitem_id: '1000000000'\n---\n"
+
+
+def test_handle_orphans_archive_without_path(tmp_path):
+    with pytest.raises(ValueError, match="archive_path"):
+        handle_orphans({"1000000000": tmp_path / "Book1.md"}, "archive")
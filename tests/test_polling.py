@@ -0,0 +1,77 @@
+import os
+from unittest.mock import MagicMock
+
+from booklog_sync.polling import CSVPoller, file_digest
+
+
+def _write(path, content: str, mtime_ns: int):
+    path.write_text(content, encoding="cp932")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_poll_syncs_after_stat_settles(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    _write(csv_file, "a", 1_000_000_000)
+    on_change = MagicMock()
+    poller = CSVPoller([csv_file], on_change, interval=0.01)
+
+    assert not poller.poll()
+
+    _write(csv_file, "ab", 2_000_000_000)
+    # statが変わった直後は書き込み途中の可能性があるため同期しない
+    assert not poller.poll()
+    _write(csv_file, "abc", 3_000_000_000)
+    assert not poller.poll()
+    on_change.assert_not_called()
+
+    assert poller.poll()
+    on_change.assert_called_once()
+    assert not poller.poll()
+
+
+def test_poll_skips_when_content_is_identical(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    _write(csv_file, "a", 1_000_000_000)
+    on_change = MagicMock()
+    poller = CSVPoller([csv_file], on_change, interval=0.01)
+
+    _write(csv_file, "a", 2_000_000_000)
+    poller.poll()
+    assert not poller.poll()
+    on_change.assert_not_called()
+
+
+def test_poll_ignores_deleted_file_and_syncs_when_recreated(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    _write(csv_file, "a", 1_000_000_000)
+    on_change = MagicMock()
+    poller = CSVPoller([csv_file], on_change, interval=0.01)
+
+    csv_file.unlink()
+    poller.poll()
+    assert not poller.poll()
+
+    # 削除前と同じ内容でも、作り直されたCSVは同期する
+    _write(csv_file, "a", 2_000_000_000)
+    poller.poll()
+    assert poller.poll()
+    on_change.assert_called_once()
+
+
+def test_poller_thread_stops(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    _write(csv_file, "a", 1_000_000_000)
+    poller = CSVPoller([csv_file], MagicMock(), interval=0.01)
+
+    poller.start()
+    poller.stop()
+    poller.join(timeout=1)
+    assert not poller.is_alive()
+
+
+def test_file_digest(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    csv_file.write_bytes(b"x" * 3_000_000)
+
+    assert file_digest(csv_file) == file_digest(csv_file)
+    assert file_digest(tmp_path / "missing.csv") is None
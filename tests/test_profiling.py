@@ -0,0 +1,102 @@
+import pstats
+import time
+from unittest.mock import patch
+
+import pytest
+
+from booklog_sync.profiling import CPUProfiler, collapse_pstats
+from booklog_sync.watcher import CSVSyncHandler
+
+
+def busy(seconds: float) -> str:
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        sum(i * i for i in range(1000))
+    return "done"
+
+
+def _read_collapsed(path):
+    stacks = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        stack, value = line.rsplit(" ", 1)
+        stacks[stack] = int(value)
+    return stacks
+
+
+def test_cprofile_writes_pstats_and_collapsed_stacks(tmp_path):
+    profiler = CPUProfiler(tmp_path, label="sync")
+
+    assert profiler.run(busy, 0.05) == "done"
+
+    (pstats_file,) = tmp_path.glob("sync-*.pstats")
+    stats = pstats.Stats(str(pstats_file))
+    assert any(name == "busy" for _, _, name in stats.stats)
+    stacks = _read_collapsed(pstats_file.with_suffix(".collapsed"))
+    assert all(stack.startswith("busy (test_profiling.py:") for stack in stacks)
+    assert any("<built-in method builtins.sum>" in stack for stack in stacks)
+
+
+def test_sampling_profiler_records_stacks_of_profiled_call(tmp_path):
+    profiler = CPUProfiler(tmp_path, interval=0.001, label="watch")
+
+    assert profiler.run(busy, 0.2) == "done"
+
+    (pstats_file,) = tmp_path.glob("watch-*.pstats")
+    stacks = _read_collapsed(pstats_file.with_suffix(".collapsed"))
+    assert stacks
+    # 計測を始めた関数より外側のフレームは含めない
+    assert all(stack.startswith("busy (test_profiling.py:") for stack in stacks)
+    stats = pstats.Stats(str(pstats_file))
+    busy_key = next(key for key in stats.stats if key[2] == "busy")
+    assert stats.stats[busy_key][1] == sum(stacks.values())
+
+
+def test_profile_is_written_when_sync_fails(tmp_path):
+    def fail():
+        raise RuntimeError("sync failed")
+
+    with pytest.raises(RuntimeError):
+        CPUProfiler(tmp_path).run(fail)
+    assert len(list(tmp_path.glob("*.pstats"))) == 1
+
+
+def test_collapse_pstats_splits_time_by_caller():
+    main = ("app.py", 1, "main")
+    load = ("app.py", 10, "load")
+    save = ("app.py", 20, "save")
+    parse = ("app.py", 30, "parse")
+    # parseの4秒のうち3秒はloadから、1秒はsaveから呼ばれた
+    stats = {
+        main: (1, 1, 1.0, 9.0, {}),
+        load: (1, 1, 1.0, 5.0, {main: (1, 1, 1.0, 5.0)}),
+        save: (1, 1, 2.0, 3.0, {main: (1, 1, 2.0, 3.0)}),
+        parse: (2, 2, 4.0, 4.0, {load: (1, 1, 3.0, 3.0), save: (1, 1, 1.0, 1.0)}),
+    }
+
+    stacks = collapse_pstats(stats)
+
+    assert stacks == {
+        "main (app.py:1)": 1_000_000,
+        "main (app.py:1);load (app.py:10)": 1_000_000,
+        "main (app.py:1);load (app.py:10);parse (app.py:30)": 3_000_000,
+        "main (app.py:1);save (app.py:20)": 2_000_000,
+        "main (app.py:1);save (app.py:20);parse (app.py:30)": 1_000_000,
+    }
+
+
+def test_watch_writes_profile_per_sync(tmp_path):
+    csv_file = tmp_path / "booklog.csv"
+    csv_file.touch()
+    profile_path = tmp_path / "profiles"
+    handler = CSVSyncHandler(
+        csv_file, tmp_path / "Books", debounce_seconds=0.1, profiler=CPUProfiler(profile_path, label="watch")
+    )
+
+    with patch("booklog_sync.watcher.run_sync") as mock_run_sync:
+        handler.sync_now()
+        handler.sync_now()
+
+    assert mock_run_sync.call_count == 2
+    assert len(list(profile_path.glob("watch-*.pstats"))) == 2
+    assert len(list(profile_path.glob("watch-*.collapsed"))) == 2
+    handler.close()
@@ -0,0 +1,102 @@
+from booklog_sync.resume import SyncJournal, source_signature
+
+
+def test_source_signature_changes_when_csv_modified(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text("a", encoding="cp932")
+    before = source_signature(csv_file)
+
+    csv_file.write_text("ab", encoding="cp932")
+
+    assert source_signature(csv_file) != before
+
+
+def test_journal_not_written_before_first_checkpoint(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=10)
+
+    journal.record(0, "1000000000")
+    journal.complete()
+
+    assert not journal_path.exists()
+
+
+def test_journal_resumes_from_checkpoint(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=2)
+    journal.record(0, "1000000000")
+    journal.record(1, "2000000000")
+    journal.record(2, "3000000000")
+    # 3行目はチェックポイント前に中断された
+    del journal
+
+    resumed = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=2)
+
+    assert resumed.resumed_rows == 2
+    assert resumed.is_done(0, "1000000000")
+    assert resumed.is_done(1, "2000000000")
+    assert not resumed.is_done(2, "3000000000")
+
+
+def test_journal_close_writes_pending_rows(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=100)
+    journal.record(0, "1000000000")
+    journal.close()
+
+    resumed = SyncJournal(journal_path, [{"size": 1}])
+
+    assert resumed.resumed_rows == 1
+    assert resumed.is_done(0, "1000000000")
+
+
+def test_journal_discarded_when_source_changed(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=1)
+    journal.record(0, "1000000000")
+    journal.close()
+
+    resumed = SyncJournal(journal_path, [{"size": 2}])
+
+    assert resumed.resumed_rows == 0
+    assert not resumed.is_done(0, "1000000000")
+    assert not journal_path.exists()
+
+
+def test_journal_ignores_truncated_checkpoint(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=1)
+    journal.record(0, "1000000000")
+    journal.close()
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"rows": 2, "done": ["20000')
+
+    resumed = SyncJournal(journal_path, [{"size": 1}])
+
+    assert resumed.resumed_rows == 1
+
+
+def test_journal_complete_removes_file(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=1)
+    journal.record(0, "1000000000")
+
+    journal.complete()
+
+    assert not journal_path.exists()
+
+
+def test_journal_advance_without_mark_done_is_not_done(tmp_path):
+    journal_path = tmp_path / "state" / "sync-journal.jsonl"
+    journal = SyncJournal(journal_path, [{"size": 1}], checkpoint_interval=100)
+    journal.advance(0)
+    # 書き込みが終わった行だけを完了として記録する
+    journal.mark_done("2000000000")
+    journal.advance(1)
+    journal.close()
+
+    resumed = SyncJournal(journal_path, [{"size": 1}])
+
+    assert resumed.resumed_rows == 2
+    assert not resumed.is_done(0, "1000000000")
+    assert resumed.is_done(1, "2000000000")
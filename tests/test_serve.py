@@ -0,0 +1,129 @@
+import os
+import time
+from unittest.mock import patch
+
+from conftest import create_book
+
+from booklog_sync.core import save_book
+from booklog_sync.serve import (
+    IdIndexCache,
+    backoff_delay,
+    directories_unchanged,
+    directory_mtimes,
+    memory_is_low,
+    settled_directory_mtimes,
+)
+from booklog_sync.sync import run_sync
+
+
+def _age(path, seconds=60):
+    # 作成直後のディレクトリは更新日時を信用しないため、古い更新日時にする
+    old = time.time_ns() - seconds * 1_000_000_000
+    os.utime(path, ns=(old, old))
+
+
+def test_directory_mtimes_detects_added_notes(tmp_path):
+    books_path = tmp_path / "Books"
+    (books_path / "A").mkdir(parents=True)
+    (books_path / ".booklog-sync").mkdir()
+    _age(books_path)
+    _age(books_path / "A")
+
+    mtimes = directory_mtimes(books_path, recursive=True)
+    assert set(mtimes) == {books_path, books_path / "A"}
+    assert directories_unchanged(mtimes)
+
+    # ノートの内容の編集や、無視するディレクトリの変更では変わらない
+    (books_path / ".booklog-sync" / "sync.lock").touch()
+    assert directories_unchanged(mtimes)
+
+    (books_path / "A" / "note.md").touch()
+    assert not directories_unchanged(mtimes)
+
+
+def test_directory_mtimes_does_not_trust_recent_changes(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+
+    # 更新日時の精度が粗いと、直後の変更で更新日時が変わらないことがある
+    assert not directories_unchanged(directory_mtimes(books_path))
+    assert directories_unchanged(directory_mtimes(tmp_path / "missing"))
+
+
+def test_settled_directory_mtimes_ignores_own_writes(tmp_path):
+    books_path = tmp_path / "Books"
+    (books_path / "A").mkdir(parents=True)
+    (books_path / "B").mkdir()
+    for path in (books_path / "A", books_path / "B", books_path):
+        _age(path)
+    before = directory_mtimes(books_path, recursive=True)
+
+    # 同期でAにノートを作成し、その間にほかのプロセスがBにノートを追加した
+    (books_path / "A" / "synced.md").touch()
+    (books_path / "B" / "other.md").touch()
+    settled = settled_directory_mtimes(before, books_path, recursive=True, written={books_path / "A"})
+
+    assert settled[books_path / "A"] == (books_path / "A").stat().st_mtime_ns
+    assert settled[books_path / "B"] == before[books_path / "B"]
+    assert not directories_unchanged(settled)
+
+
+def test_index_cache_reuses_index_until_vault_changes(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    save_book(books_path, create_book({"item_id": "1"}))
+    _age(books_path)
+
+    cache = IdIndexCache()
+    index = cache.get(books_path)
+    assert set(index) == {"1"}
+    assert cache.get(books_path) is index
+    assert (cache.builds, cache.hits) == (1, 1)
+
+    save_book(books_path, create_book({"item_id": "2", "title": "別の本"}))
+    assert set(cache.get(books_path)) == {"1", "2"}
+    assert cache.builds == 2
+
+    # 走査の条件が変わった場合も作り直す
+    cache.get(books_path, recursive=True)
+    assert cache.builds == 3
+
+    cache.clear()
+    assert not cache.loaded
+
+
+def test_run_sync_uses_index_cache(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    _age(books_path)
+    cache = IdIndexCache()
+
+    assert run_sync(csv_file, books_path, index_cache=cache).created == 1
+    # ノートを作成したため、次の同期では索引を作り直す
+    _age(books_path)
+    stats = run_sync(csv_file, books_path, index_cache=cache)
+    assert (stats.created, stats.unchanged) == (0, 1)
+    assert run_sync(csv_file, books_path, index_cache=cache).unchanged == 1
+    assert (cache.builds, cache.hits) == (2, 1)
+
+
+def test_backoff_delay_grows_with_jitter_up_to_limit():
+    assert backoff_delay(0, 60) == 60
+    for failures in range(1, 5):
+        cap = 60 * 2**failures
+        assert all(cap / 2 <= backoff_delay(failures, 60, 3600) <= cap for _ in range(20))
+    assert all(1800 <= backoff_delay(100, 60, 3600) <= 3600 for _ in range(20))
+
+
+def test_memory_is_low():
+    with patch("booklog_sync.serve.available_memory_ratio", return_value=0.05):
+        assert memory_is_low()
+    with patch("booklog_sync.serve.available_memory_ratio", return_value=0.5):
+        assert not memory_is_low()
+    with patch("booklog_sync.serve.available_memory_ratio", return_value=None):
+        assert not memory_is_low()
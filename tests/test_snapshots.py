@@ -0,0 +1,200 @@
+import gzip
+import shutil
+
+import pytest
+
+from booklog_sync.core import default_state_path
+from booklog_sync.snapshots import (
+    SNAPSHOT_DIRNAME,
+    SnapshotPack,
+    list_snapshots,
+    read_snapshot,
+    rollback,
+    snapshot_run_id,
+)
+from booklog_sync.sync import run_sync
+from booklog_sync.throttle import WriteScheduler
+
+
+def _write_csv(csv_file, rows):
+    csv_file.write_text(
+        "\n".join(
+            f"...,{item_id},9784000000001,...,5,{status},...,...,...,...,...,{title},著者A,テスト出版社,2020,..."
+            for item_id, title, status in rows
+        ),
+        encoding="cp932",
+    )
+
+
+def _snapshots(books_path):
+    return list_snapshots(default_state_path(books_path) / SNAPSHOT_DIRNAME)
+
+
+def test_rollback_restores_updated_and_removes_created_notes(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "既存", "読み終わった"), ("2000000000", "新規", "積読")])
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    existing = books_path / "既存.md"
+    # 元のバイト列（改行コードを含む）のまま戻す
+    original = "---\r\nitem_id: '1000000000'\r\nstatus: 読みたい\r\n---\r\nメモ\r\n".encode("utf-8")
+    existing.write_bytes(original)
+
+    stats = run_sync(csv_file, books_path)
+    assert (stats.created, stats.updated) == (1, 1)
+    created = next(path for path in books_path.glob("*.md") if path != existing)
+    assert len(_snapshots(books_path)) == 1
+
+    result = rollback(books_path)
+
+    assert (result.restored, result.removed, result.skipped) == (1, 1, [])
+    assert existing.read_bytes() == original
+    assert not created.exists()
+    assert _snapshots(books_path) == []
+
+
+def test_sync_without_changes_does_not_write_snapshot(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "タイトル", "読み終わった")])
+    books_path = tmp_path / "Books"
+
+    run_sync(csv_file, books_path)
+    run_sync(csv_file, books_path)
+
+    assert len(_snapshots(books_path)) == 1
+    with pytest.raises(ValueError, match="元に戻せる同期が見つかりません"):
+        rollback(books_path, run_id="20000101-000000")
+
+
+def test_rollback_skips_notes_edited_after_sync(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "タイトル", "読み終わった")])
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    note = books_path / "タイトル.md"
+    note.write_text("---\nitem_id: '1000000000'\nstatus: 読みたい\n---\n", encoding="utf-8")
+    run_sync(csv_file, books_path)
+    note.write_text(note.read_text(encoding="utf-8") + "同期のあとに書いたメモ\n", encoding="utf-8")
+
+    result = rollback(books_path)
+
+    assert result.skipped == [note]
+    assert "同期のあとに書いたメモ" in note.read_text(encoding="utf-8")
+    # すべて戻せなかったパックは残り、forceで上書きして戻せる
+    assert len(_snapshots(books_path)) == 1
+    result = rollback(books_path, force=True)
+    assert result.restored == 1
+    assert "status: 読みたい" in note.read_text(encoding="utf-8")
+
+
+def test_rollback_moves_back_archived_orphans(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "タイトル", "読み終わった")])
+    books_path = tmp_path / "Vault" / "Books"
+    books_path.mkdir(parents=True)
+    (books_path / "タイトル.md").write_text("---\nitem_id: '1000000000'\n---\n", encoding="utf-8")
+    orphan = books_path / "Orphan.md"
+    orphan.write_text("---\nitem_id: '2000000000'\n---\n", encoding="utf-8")
+    archive_path = tmp_path / "Vault" / "Archive"
+
+    run_sync(csv_file, books_path, orphan_action="archive", orphan_archive_path=archive_path)
+    assert not orphan.exists()
+
+    result = rollback(books_path)
+
+    assert result.moved_back == 1
+    assert orphan.exists()
+    assert not (archive_path / "Orphan.md").exists()
+
+
+def test_rollback_with_rate_limited_writes_and_resets_state(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "タイトル", "読み終わった")])
+    books_path = tmp_path / "Books"
+    state_path = tmp_path / "state"
+    run_sync(
+        csv_file,
+        books_path,
+        state_path=state_path,
+        max_writes_per_second=1000,
+        aggregate_path=tmp_path / "Index",
+        aggregate_by=["status"],
+    )
+    (state_path / "sync-journal.jsonl").write_text("{}\n", encoding="utf-8")
+
+    result = rollback(books_path, state_path)
+
+    assert result.removed == 1
+    assert list(books_path.glob("*.md")) == []
+    assert not (state_path / "sync-journal.jsonl").exists()
+    # 集計ノートは次回の同期で集計し直す
+    assert (state_path / "aggregates.json.dirty").exists()
+
+
+def test_shared_scheduler_records_snapshot_at_write_time(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    _write_csv(csv_file, [("1000000000", "既存", "読み終わった")])
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    existing = books_path / "既存.md"
+    existing.write_text("---\nitem_id: '1000000000'\nstatus: 読みたい\n---\nメモ\n", encoding="utf-8")
+
+    # 監視モードと同じく、同期のあとに書き込むスケジューラを共有する。最初の1件で書き込みの枠を使い切っておく。
+    scheduler = WriteScheduler(max_writes_per_second=1)
+    scheduler.submit(tmp_path / "other.md", "x")
+    scheduler.flush()
+    run_sync(csv_file, books_path, write_scheduler=scheduler)
+    # 書き込みを待っている間に本文が編集され、書き込むときにマージし直される
+    existing.write_text("---\nitem_id: '1000000000'\nstatus: 読みたい\n---\nメモ\n追記\n", encoding="utf-8")
+    scheduler.close()
+    assert existing.read_text(encoding="utf-8").endswith("追記\n")
+    assert "status: 読み終わった" in existing.read_text(encoding="utf-8")
+
+    result = rollback(books_path)
+
+    # 実際に書き込んだ内容と、その直前の内容（編集後）が記録されている
+    assert (result.restored, result.skipped) == (1, [])
+    assert existing.read_text(encoding="utf-8") == "---\nitem_id: '1000000000'\nstatus: 読みたい\n---\nメモ\n追記\n"
+
+
+def test_snapshots_are_pruned(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    books_path = tmp_path / "Books"
+    for status in ["読みたい", "いま読んでる", "読み終わった"]:
+        _write_csv(csv_file, [("1000000000", "タイトル", status)])
+        run_sync(csv_file, books_path, snapshot_keep=2)
+
+    packs = _snapshots(books_path)
+    assert len(packs) == 2
+    # 最後の同期を戻すと、その前の同期のあとの状態になる
+    rollback(books_path, run_id=snapshot_run_id(packs[1]))
+    (note,) = books_path.glob("*.md")
+    assert "status: いま読んでる" in note.read_text(encoding="utf-8")
+
+    run_sync(csv_file, books_path, state_path=tmp_path / "none", snapshot_keep=0)
+    assert not (tmp_path / "none" / SNAPSHOT_DIRNAME).exists()
+
+
+def test_read_snapshot_of_interrupted_sync(tmp_path):
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    note = books_path / "note.md"
+    note.write_text("before", encoding="utf-8")
+    pack = SnapshotPack(tmp_path / "snapshots", books_path)
+    pack.write(note, "after")
+    pack.write(books_path / "new.md", "created")
+
+    # 強制終了されたプロセスのように、閉じる前のパックを読み込む
+    interrupted = tmp_path / "interrupted.pack.gz"
+    shutil.copy(pack.path, interrupted)
+    info, records = read_snapshot(interrupted)
+    records = list(records)
+    pack.close()
+
+    assert info["books_path"] == str(books_path)
+    assert [(header["op"], header["path"], data) for header, data in records] == [
+        ("modified", "note.md", b"before"),
+        ("created", "new.md", b""),
+    ]
+    with gzip.open(pack.path, "rb") as f:
+        assert f.read().count(b"\n") == 3
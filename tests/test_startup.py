@@ -0,0 +1,109 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import yaml
+
+# 起動時間の予算（マイクロ秒）。python -X importtime で計測した、CLIが読み込むモジュールのimport時間の合計。
+# 値はREADMEの「起動時間」と合わせること。
+HELP_IMPORT_BUDGET_US = 50_000
+SYNC_IMPORT_BUDGET_US = 200_000
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def run_with_importtime(*args: str, cwd: Path | None = None) -> tuple[subprocess.CompletedProcess, dict[str, int]]:
+    """
+    python -X importtime でCLIを実行し、booklog_sync以降に読み込まれたトップレベルのモジュールと
+    その累積import時間を返す。インタプリタ自体の起動で読み込まれるモジュールは含めない。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "booklog_sync.main", *args],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    imported: dict[str, int] = {}
+    started = False
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        if name == "booklog_sync":
+            started = True
+        if started and not indent:
+            imported[name] = imported.get(name, 0) + int(cumulative)
+    return result, imported
+
+
+def min_import_time_us(*args: str, runs: int = 3) -> int:
+    """
+    共有CIなどの揺らぎを抑えるため、複数回計測した合計import時間の最小値を返す。
+    """
+    totals = []
+    for _ in range(runs):
+        result, imported = run_with_importtime(*args)
+        assert result.returncode == 0, result.stderr
+        totals.append(sum(imported.values()))
+    return min(totals)
+
+
+def all_imported_modules(stderr: str) -> set[str]:
+    return {match.group(4) for line in stderr.splitlines() if (match := IMPORTTIME_LINE.match(line))}
+
+
+def test_help_does_not_import_sync_dependencies():
+    result, _ = run_with_importtime("--help")
+
+    assert result.returncode == 0
+    modules = all_imported_modules(result.stderr)
+    for name in ["yaml", "watchdog", "csv", "booklog_sync.core", "booklog_sync.config", "booklog_sync.sync"]:
+        assert name not in modules, f"{name} is imported by --help"
+
+
+def test_help_within_startup_budget():
+    assert min_import_time_us("--help") < HELP_IMPORT_BUDGET_US
+
+
+def test_noop_sync_within_startup_budget(tmp_path):
+    csv_path = tmp_path / "booklog.csv"
+    csv_path.write_text(
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,テストタイトル,テスト作者名,テスト出版社,2020,...",
+        encoding="cp932",
+    )
+    books_path = tmp_path / "Books"
+    books_path.mkdir()
+    (books_path / "Book.md").write_text(
+        "---\nitem_id: '1000000000'\ntitle: テストタイトル\nauthor: テスト作者名\nisbn13: '9784000000001'\n"
+        "publisher: テスト出版社\npublish_year: '2020'\nstatus: 読み終わった\nrating: 5\n---\n",
+        encoding="utf-8",
+    )
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        yaml.dump({"csv_path": str(csv_path), "books_path": str(books_path)}),
+        encoding="utf-8",
+    )
+
+    result, _ = run_with_importtime("sync", "--config", str(config_file))
+
+    assert result.returncode == 0, result.stderr
+    assert "0 created, 0 updated, 1 unchanged" in result.stderr
+    modules = all_imported_modules(result.stderr)
+    # 設定のデフォルト値のために、同期で使わない機能のモジュールを読み込まない
+    for name in [
+        "watchdog",
+        "asyncio",
+        "booklog_sync.adopt",
+        "booklog_sync.aggregates",
+        "booklog_sync.changelog",
+        "booklog_sync.extsort",
+        "booklog_sync.join",
+        "booklog_sync.merge",
+        "booklog_sync.polling",
+        "booklog_sync.serve",
+        "booklog_sync.transforms",
+    ]:
+        assert name not in modules, f"{name} is imported by sync"
+    assert min_import_time_us("sync", "--config", str(config_file)) < SYNC_IMPORT_BUDGET_US
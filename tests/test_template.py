@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from conftest import create_booklog_csv_row
+
+from booklog_sync.template import compile_template, load_body_template
+
+
+def test_compile_template_renders_fields():
+    template = compile_template("## 感想\n{review}\n\n登録日: {registered_at}")
+    row = create_booklog_csv_row({"review": "面白かった", "registered_at": "2020-01-01 10:00:00"})
+
+    assert template.render(row) == "## 感想\n面白かった\n\n登録日: 2020-01-01 10:00:00"
+    assert template.fields == ("review", "registered_at")
+
+
+def test_compile_template_missing_field_renders_empty():
+    template = compile_template("メモ: {memo}")
+    row = create_booklog_csv_row()
+    row["memo"] = None
+
+    assert template.render(row) == "メモ: "
+
+
+def test_compile_template_keeps_escaped_braces():
+    template = compile_template("{{literal}} {title}")
+
+    assert template.render(create_booklog_csv_row()) == "{literal} テストタイトル"
+
+
+def test_compile_template_unknown_field():
+    with pytest.raises(ValueError, match="unknown_field"):
+        compile_template("{unknown_field}")
+
+
+def test_load_body_template_uses_cache(tmp_path):
+    template_file = tmp_path / "template.md"
+    template_file.write_text("{review}\n", encoding="utf-8")
+
+    first = load_body_template(template_file)
+    second = load_body_template(template_file)
+
+    assert first is second
+    assert first.format_string == "{0}"
+
+
+def test_load_body_template_reloads_when_modified(tmp_path):
+    template_file = tmp_path / "template.md"
+    template_file.write_text("{review}", encoding="utf-8")
+    first = load_body_template(template_file)
+
+    template_file.write_text("{memo}", encoding="utf-8")
+    stat = template_file.stat()
+    os.utime(template_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = load_body_template(template_file)
+
+    assert second is not first
+    assert second.fields == ("memo",)
+
+
+def test_load_body_template_not_found(tmp_path):
+    with pytest.raises(FileNotFoundError, match="テンプレートファイルが見つかりません"):
+        load_body_template(tmp_path / "missing.md")
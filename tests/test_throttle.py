@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+from booklog_sync.throttle import WriteScheduler
+
+
+def test_write_scheduler_writes_files(tmp_path):
+    scheduler = WriteScheduler()
+
+    scheduler.submit(tmp_path / "a.md", "a", "created")
+    scheduler.submit(tmp_path / "b.md", "bb", "updated")
+    scheduler.close()
+
+    assert (tmp_path / "a.md").read_text(encoding="utf-8") == "a"
+    assert (tmp_path / "b.md").read_text(encoding="utf-8") == "bb"
+    stats = scheduler.stats()
+    assert stats.files == 2
+    assert stats.bytes == 3
+    assert stats.pending == 0
+
+
+def test_write_scheduler_limits_writes_per_second(tmp_path):
+    scheduler = WriteScheduler(max_writes_per_second=10)
+
+    start = time.monotonic()
+    for i in range(15):
+        scheduler.submit(tmp_path / f"{i}.md", "x", "created")
+    scheduler.close()
+    elapsed = time.monotonic() - start
+
+    # 最初の10件はバーストで書き込まれ、残り5件に約0.5秒かかる
+    assert elapsed >= 0.4
+    assert scheduler.stats().files == 15
+
+
+def test_write_scheduler_limits_bytes_per_second(tmp_path):
+    scheduler = WriteScheduler(max_bytes_per_second=100)
+
+    start = time.monotonic()
+    for i in range(3):
+        scheduler.submit(tmp_path / f"{i}.md", "x" * 50, "created")
+    scheduler.close()
+
+    assert time.monotonic() - start >= 0.4
+
+
+def test_write_scheduler_prioritizes_creates(tmp_path):
+    written = []
+    release = threading.Event()
+
+    def writer(path, content):
+        release.wait()
+        written.append(path.name)
+
+    scheduler = WriteScheduler(writer=writer)
+    # 最初の1件は書き込みスレッドに取り出されてreleaseを待つ
+    scheduler.submit(tmp_path / "first.md", "x", "updated")
+    time.sleep(0.1)
+    scheduler.submit(tmp_path / "tagged.md", "x", "tagged")
+    scheduler.submit(tmp_path / "updated.md", "x", "updated")
+    scheduler.submit(tmp_path / "created.md", "x", "created")
+    release.set()
+    scheduler.close()
+
+    assert written == ["first.md", "created.md", "updated.md", "tagged.md"]
+
+
+def test_write_scheduler_coalesces_same_path(tmp_path):
+    written = []
+    release = threading.Event()
+
+    def writer(path, content):
+        release.wait()
+        written.append((path.name, content))
+
+    scheduler = WriteScheduler(writer=writer)
+    scheduler.submit(tmp_path / "first.md", "x", "created")
+    time.sleep(0.1)
+    scheduler.submit(tmp_path / "a.md", "old", "updated")
+    scheduler.submit(tmp_path / "a.md", "new", "updated")
+    release.set()
+    scheduler.close()
+
+    assert written == [("first.md", "x"), ("a.md", "new")]
+
+
+def test_write_scheduler_guarded_write_rebases_on_conflict(tmp_path):
+    from booklog_sync.core import read_text_versioned
+
+    note = tmp_path / "note.md"
+    note.write_text("元の内容", encoding="utf-8")
+    _, version = read_text_versioned(note)
+    # 書き込みが予約されてから実行されるまでの間に編集される
+    mtime_ns = note.stat().st_mtime_ns + 1_000_000_000
+    note.write_text("編集後の内容", encoding="utf-8")
+    os.utime(note, ns=(mtime_ns, mtime_ns))
+
+    def rebase():
+        text, current = read_text_versioned(note)
+        return text + "+同期", current
+
+    scheduler = WriteScheduler()
+    scheduler.submit(note, "元の内容+同期", "updated", guard=(version, rebase))
+    scheduler.close()
+
+    assert note.read_text(encoding="utf-8") == "編集後の内容+同期"
+
+
+def test_write_scheduler_reports_outcome(tmp_path):
+    def writer(path, content):
+        if path.name == "bad.md":
+            raise OSError("書き込めない")
+        path.write_text(content, encoding="utf-8")
+
+    outcomes = []
+    scheduler = WriteScheduler(writer=writer)
+    scheduler.submit(tmp_path / "good.md", "x", "created", on_done=lambda outcome: outcomes.append(("good", outcome)))
+    scheduler.submit(tmp_path / "bad.md", "x", "created", on_done=lambda outcome: outcomes.append(("bad", outcome)))
+    scheduler.close()
+
+    assert sorted(outcomes) == [("bad", "failed"), ("good", "written")]
+
+
+def test_write_scheduler_reports_guard_conflict(tmp_path):
+    from booklog_sync.core import read_text_versioned
+
+    note = tmp_path / "note.md"
+    note.write_text("元の内容", encoding="utf-8")
+    _, version = read_text_versioned(note)
+    note.unlink()
+
+    outcomes = []
+    scheduler = WriteScheduler()
+    scheduler.submit(note, "内容", "updated", guard=(version, lambda: None), on_done=outcomes.append)
+    scheduler.close()
+
+    assert outcomes == ["conflict"]
+    assert not note.exists()
+    assert scheduler.stats().files == 0
@@ -0,0 +1,90 @@
+import pytest
+from conftest import create_book, create_booklog_csv_row
+
+from booklog_sync.transforms import TransformPipeline, compile_transforms
+
+
+def test_split_tags():
+    (stage,) = compile_transforms(["split_tags"])
+
+    assert stage.function(create_book({"tags": "SF, 海外,"}), {})["tags"] == ["SF", "海外"]
+    assert stage.function(create_book({"tags": ""}), {})["tags"] is None
+    assert "tags" not in stage.function(create_book(), {})
+
+
+def test_category_tag():
+    (stage,) = compile_transforms([{"name": "category_tag", "prefix": "genre/"}])
+
+    book = stage.function(create_book({"tags": "SF,海外"}), create_booklog_csv_row({"category": "小説"}))
+    assert book["tags"] == ["SF", "海外", "genre/小説"]
+    assert stage.columns == ("category",)
+    assert "tags" not in stage.function(create_book(), create_booklog_csv_row({"category": ""}))
+
+
+def test_rating_stars():
+    (stage,) = compile_transforms([{"name": "rating_stars", "field": "stars"}])
+
+    assert stage.function(create_book(), create_booklog_csv_row({"rating": "3"}))["stars"] == "★★★☆☆"
+    assert "stars" not in stage.function(create_book(), create_booklog_csv_row({"rating": "0"}))
+
+
+def test_compile_custom_transform_from_file(tmp_path):
+    (tmp_path / "my_transforms.py").write_text(
+        "def add_series(book, row, series):\n    book['series'] = series\n    return book\n",
+        encoding="utf-8",
+    )
+
+    stages = compile_transforms(
+        [
+            {"name": "my_transforms.py:add_series", "columns": ["title"], "series": "第1期"},
+            {"name": "my_transforms.py:add_series", "series": "第2期"},
+        ],
+        tmp_path,
+    )
+
+    assert [stage.name for stage in stages] == ["my_transforms.py:add_series", "my_transforms.py:add_series#2"]
+    assert stages[0].columns == ("title",)
+    # columnsを省略した独自の変換にはすべての列を渡す
+    assert "review" in stages[1].columns
+    assert stages[0].function(create_book(), {})["series"] == "第1期"
+
+
+def test_compile_custom_transform_records_source_digest(tmp_path):
+    source = tmp_path / "my_transforms.py"
+    source.write_text("def run(book, row):\n    return book\n", encoding="utf-8")
+    (stage,) = compile_transforms(["my_transforms.py:run"], tmp_path)
+    (same,) = compile_transforms(["my_transforms.py:run"], tmp_path)
+    assert stage.source_digest is not None
+    assert same.source_digest == stage.source_digest
+
+    # 関数のコードを書き換えると、同期の再開の判定に使うハッシュも変わる
+    source.write_text("def run(book, row):\n    book['title'] = 'x'\n    return book\n", encoding="utf-8")
+    (changed,) = compile_transforms(["my_transforms.py:run"], tmp_path)
+    assert changed.source_digest != stage.source_digest
+    assert compile_transforms(["split_tags"])[0].source_digest is None
+
+
+@pytest.mark.parametrize(
+    ("spec", "message"),
+    [
+        ("unknown", "不明な変換 'unknown'"),
+        ({"name": "rating_stars", "stars": 5}, "変換 'rating_stars' のオプションが正しくありません"),
+        ("missing.py:run", "変換のファイルが見つかりません"),
+        ("booklog_sync.core:no_such_function", "変換の関数が見つかりません"),
+        ({"name": "booklog_sync.core:convert_csv", "columns": ["nope"]}, "'columns' はCSVの列名のリスト"),
+    ],
+)
+def test_compile_transforms_errors(tmp_path, spec, message):
+    with pytest.raises(ValueError, match=message):
+        compile_transforms([spec], tmp_path)
+
+
+def test_transform_pipeline_times_each_stage():
+    pipeline = TransformPipeline(compile_transforms(["split_tags", {"name": "category_tag", "prefix": "#"}]))
+
+    book = pipeline(create_book({"tags": "SF"}), create_booklog_csv_row({"category": "小説"}))
+
+    assert book["tags"] == ["SF", "#小説"]
+    assert pipeline.columns == {"category"}
+    assert set(pipeline.seconds) == {"split_tags", "category_tag"}
+    assert all(seconds > 0 for seconds in pipeline.seconds.values())
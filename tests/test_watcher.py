@@ -1,10 +1,20 @@
+import asyncio
+import os
+import threading
 import time
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 import pytest
 
-from booklog_sync.watcher import CSVSyncHandler, start_watching
+from booklog_sync.watcher import (
+    CSVSyncHandler,
+    ResidentSyncHandler,
+    RestartingSyncHandler,
+    select_backend,
+    start_serving,
+    start_watching,
+)
 
 
 class TestCSVSyncHandler:
@@ -84,6 +94,291 @@ class TestCSVSyncHandler:
             time.sleep(0.3)
             mock_sync.assert_called_once()
 
+    def test_multiple_csv_files(self, tmp_path):
+        csv1 = tmp_path / "a.csv"
+        csv2 = tmp_path / "b.csv"
+        csv1.touch()
+        csv2.touch()
+        books_path = tmp_path / "Books"
+
+        handler = CSVSyncHandler([csv1, csv2], books_path, debounce_seconds=0.1)
+
+        with patch("booklog_sync.watcher.run_sync") as mock_run_sync:
+            handler.on_modified(self._make_event(str(csv2)))
+            time.sleep(0.3)
+
+        mock_run_sync.assert_called_once()
+        assert mock_run_sync.call_args.args[0] == (csv1.resolve(), csv2.resolve())
+
+    def test_rate_limited_sync_uses_shared_scheduler(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.touch()
+        books_path = tmp_path / "Books"
+
+        handler = CSVSyncHandler(
+            csv_file, books_path, debounce_seconds=0.1, max_writes_per_second=10
+        )
+
+        with patch("booklog_sync.watcher.run_sync") as mock_run_sync:
+            handler._do_sync()
+            handler._do_sync()
+
+        schedulers = {call.kwargs["write_scheduler"] for call in mock_run_sync.call_args_list}
+        assert len(schedulers) == 1
+        assert None not in schedulers
+        handler.close()
+
+    def test_overlapping_syncs_are_serialized(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.touch()
+        books_path = tmp_path / "Books"
+
+        handler = CSVSyncHandler(csv_file, books_path, debounce_seconds=0.1)
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def slow_sync(*args, **kwargs):
+            with lock:
+                active.append(1)
+                max_active.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.pop()
+
+        with patch("booklog_sync.watcher.run_sync", side_effect=slow_sync) as mock_run_sync:
+            threads = [threading.Thread(target=handler._do_sync) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.02)
+            for thread in threads:
+                thread.join()
+
+        # 実行中の同期と重ならず、実行待ちの同期は1回にまとめられる
+        assert max(max_active) == 1
+        assert mock_run_sync.call_count == 2
+
+
+    def test_sync_now_runs_requested_sync(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.touch()
+        books_path = tmp_path / "Books"
+
+        handler = CSVSyncHandler(csv_file, books_path, debounce_seconds=0.1)
+
+        with patch("booklog_sync.watcher.run_sync") as mock_run_sync:
+            handler.sync_now()
+            # 依頼された同期は呼び出しの中で完了している
+            mock_run_sync.assert_called_once()
+            handler.close()
+            handler.sync_now()
+            mock_run_sync.assert_called_once()
+
+
+class TestResidentSyncHandler:
+    CSV_LINE = (
+        "...,1000000000,9784000000001,...,5,読み終わった,...,...,...,...,...,"
+        "テストタイトル,テスト作者名,テスト出版社,2020,..."
+    )
+
+    def _age(self, path: Path):
+        # 作成直後のディレクトリは更新日時を信用しないため、古い更新日時にする
+        old = time.time_ns() - 60 * 1_000_000_000
+        os.utime(path, ns=(old, old))
+
+    def test_tick_skips_sync_when_nothing_changed(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+
+        handler = ResidentSyncHandler(csv_file, books_path, interval=60)
+        assert handler.tick()
+        assert len(list(books_path.glob("*.md"))) == 1
+        # 同期自身の書き込みはVaultの変更とみなさない
+        assert not handler.tick()
+        assert handler.index_cache.builds == 1
+
+        # 内容が同じCSVに置き換わっても同期しない
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        with patch("booklog_sync.watcher.iter_sync") as mock_iter_sync:
+            assert not handler.tick()
+            mock_iter_sync.assert_not_called()
+
+        csv_file.write_text(self.CSV_LINE.replace("テストタイトル", "新しいタイトル"), encoding="cp932")
+        assert handler.tick()
+        # 前回の同期でノートを作成したため、索引を作り直す
+        assert handler.index_cache.builds == 2
+        handler.close()
+
+    def test_tick_rebuilds_index_when_csv_changes(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+
+        handler = ResidentSyncHandler(csv_file, books_path, interval=60)
+        assert handler.tick()
+        (note,) = books_path.glob("*.md")
+        # 作成したノートを含む索引を作る
+        self._age(books_path)
+        handler.sync_now()
+        assert handler.index_cache.builds == 2
+
+        # ノートのitem_idをその場で書き換えても、ディレクトリの更新日時は変わらない
+        note.write_text(
+            note.read_text(encoding="utf-8").replace("1000000000", "2000000000"), encoding="utf-8"
+        )
+        csv_file.write_text(
+            self.CSV_LINE.replace("1000000000", "2000000000").replace("テストタイトル", "新しいタイトル"),
+            encoding="cp932",
+        )
+        assert handler.tick()
+        # 書き換えたitem_idのノートを更新し、同じ書籍のノートを新しく作らない
+        assert list(books_path.glob("*.md")) == [note]
+        assert "title: 新しいタイトル" in note.read_text(encoding="utf-8")
+        handler.close()
+
+    def test_tick_ignores_own_orphan_and_aggregate_writes(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+        (books_path / "Old").mkdir(parents=True)
+        (books_path / "Old" / "old.md").write_text("---\nitem_id: '2000000000'\n---\n", encoding="utf-8")
+        self._age(books_path / "Old")
+        self._age(books_path)
+
+        handler = ResidentSyncHandler(
+            csv_file,
+            books_path,
+            interval=60,
+            recursive=True,
+            orphan_action="tag",
+            aggregate_path=books_path / "Index",
+        )
+        assert handler.tick()
+        assert "booklog/deleted" in (books_path / "Old" / "old.md").read_text(encoding="utf-8")
+        assert (books_path / "Index" / "status").is_dir()
+        # 孤立ノートのタグ付けと集計ノートの書き込みは、Vaultの変更とみなさない
+        assert not handler.tick()
+        handler.close()
+
+    def test_tick_detects_vault_changes_made_during_sync(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+        (books_path / "Other").mkdir(parents=True)
+        self._age(books_path / "Other")
+        self._age(books_path)
+
+        handler = ResidentSyncHandler(csv_file, books_path, interval=60, recursive=True)
+        with patch("booklog_sync.watcher.iter_sync") as mock_iter_sync:
+            # 同期している間に、ほかのフォルダにノートが追加される
+            mock_iter_sync.side_effect = lambda *args, **kwargs: iter(
+                (books_path / "Other" / "note.md").touch() or ()
+            )
+            assert handler.tick()
+        self._age(books_path / "Other")
+        assert handler.tick()
+        assert not handler.tick()
+        handler.close()
+
+    def test_sync_now_runs_even_when_unchanged(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+        books_path.mkdir()
+        self._age(books_path)
+
+        handler = ResidentSyncHandler(csv_file, books_path)
+        with patch("booklog_sync.watcher.iter_sync") as mock_iter_sync:
+            assert handler.tick()
+            assert not handler.tick()
+            handler.sync_now()
+            assert mock_iter_sync.call_count == 2
+            assert mock_iter_sync.call_args.kwargs["index_cache"] is handler.index_cache
+        handler.close()
+
+    def test_failed_sync_backs_off_and_retries(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+
+        handler = ResidentSyncHandler(csv_file, books_path, interval=10, max_backoff=30)
+        with patch("booklog_sync.watcher.iter_sync", side_effect=OSError("unavailable")) as mock_iter_sync:
+            assert not handler.tick()
+            assert 10 <= handler.next_delay <= 20
+            assert not handler.tick()
+            assert not handler.tick()
+            assert handler.failures == 3
+            assert 15 <= handler.next_delay <= 30
+            assert mock_iter_sync.call_count == 3
+
+        # 失敗のあとは変更がなくても同期し、成功したら間隔を戻す
+        assert handler.tick()
+        assert handler.failures == 0
+        assert handler.next_delay == 10
+        handler.close()
+
+    def test_idle_handler_drops_index_when_memory_is_low(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(self.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+        books_path.mkdir()
+        self._age(books_path)
+
+        handler = ResidentSyncHandler(csv_file, books_path, idle_after=0)
+        with patch("booklog_sync.watcher.iter_sync") as mock_iter_sync:
+            mock_iter_sync.side_effect = lambda *args, index_cache, **kwargs: iter(index_cache.get(books_path) and ())
+            handler.tick()
+            with patch("booklog_sync.watcher.memory_is_low", return_value=False):
+                assert not handler.tick()
+            assert handler.index_cache.loaded
+            with patch("booklog_sync.watcher.memory_is_low", return_value=True):
+                assert not handler.tick()
+            assert not handler.index_cache.loaded
+        handler.close()
+
+
+class TestRestartingSyncHandler:
+    def test_sync_now_runs_async_sync(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.write_text(TestResidentSyncHandler.CSV_LINE, encoding="cp932")
+        books_path = tmp_path / "Books"
+
+        handler = RestartingSyncHandler(csv_file, books_path, debounce_seconds=0.1)
+        try:
+            handler.sync_now()
+        finally:
+            handler.close()
+
+        assert len(list(books_path.glob("*.md"))) == 1
+
+    def test_csv_change_restarts_running_sync(self, tmp_path):
+        csv_file = tmp_path / "booklog.csv"
+        csv_file.touch()
+        books_path = tmp_path / "Books"
+        started = threading.Event()
+        calls = []
+
+        async def fake_run_sync_async(csv_path, books_path, **options):
+            calls.append(csv_path)
+            if len(calls) == 1:
+                started.set()
+                # 新しいCSVの同期に取り消されるまで終わらない
+                await asyncio.sleep(60)
+
+        handler = RestartingSyncHandler(csv_file, books_path, debounce_seconds=0.1)
+        try:
+            with patch("booklog_sync.aiosync.run_sync_async", fake_run_sync_async):
+                handler._do_sync()
+                assert started.wait(5)
+                start = time.monotonic()
+                handler.sync_now()
+                assert time.monotonic() - start < 5
+        finally:
+            handler.close()
+
+        assert len(calls) == 2
+
 
 class TestStartWatching:
     def test_nonexistent_directory_raises_error(self, tmp_path):
@@ -92,3 +387,22 @@ class TestStartWatching:
 
         with pytest.raises(FileNotFoundError, match="監視対象のディレクトリが存在しません"):
             start_watching(csv_file, books_path)
+
+    def test_serving_nonexistent_directory_raises_error(self, tmp_path):
+        csv_file = tmp_path / "nonexistent_dir" / "booklog.csv"
+        books_path = tmp_path / "Books"
+
+        with pytest.raises(FileNotFoundError, match="監視対象のディレクトリが存在しません"):
+            start_serving(csv_file, books_path)
+
+
+class TestSelectBackend:
+    def test_explicit_backend(self, tmp_path):
+        with patch("booklog_sync.watcher.is_network_path", return_value=True):
+            assert select_backend("native", [tmp_path]) == "native"
+
+    def test_auto_uses_polling_on_network_drive(self, tmp_path):
+        with patch("booklog_sync.watcher.is_network_path", return_value=True):
+            assert select_backend("auto", [tmp_path]) == "polling"
+        with patch("booklog_sync.watcher.is_network_path", return_value=False):
+            assert select_backend("auto", [tmp_path]) == "native"